@@ -14,3 +14,8 @@ from django.core.asgi import get_asgi_application
 os.environ.setdefault("DJANGO_SETTINGS_MODULE", "mysite.settings")
 
 application = get_asgi_application()
+
+# Warm this server process's caches if POLLS_WARM_CACHES_ON_STARTUP is set
+from polls.warmup import warm_on_startup  # noqa: E402
+
+warm_on_startup()
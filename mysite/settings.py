@@ -10,6 +10,7 @@ For the full list of settings and their values, see
 https://docs.djangoproject.com/en/5.2/ref/settings/
 """
 
+import os
 from pathlib import Path
 
 # Build paths inside the project like this: BASE_DIR / 'subdir'.
@@ -77,9 +78,30 @@ DATABASES = {
     "default": {
         "ENGINE": "django.db.backends.sqlite3",
         "NAME": BASE_DIR / "db.sqlite3",
+        "OPTIONS": {
+            # Take the write lock when a transaction starts. A deferred one that
+            # reads first and then writes fails with "database is locked" straight
+            # away, instead of waiting, whenever another writer got in between.
+            "transaction_mode": "IMMEDIATE",
+        },
     }
 }
 
+# Optional vote shards (see polls/sharding.py). POLLS_VOTE_SHARD_FILES=3 keeps
+# each category's votes in one of db.sqlite3 and votes-1.sqlite3 to
+# votes-3.sqlite3. Create new files with "manage.py migrate --database
+# votes_N", and run "manage.py migrate_vote_shards" whenever the number of
+# files or POLLS_CATEGORY_SHARDS changes.
+POLLS_VOTE_SHARDS = []
+for shard in range(1, int(os.environ.get("POLLS_VOTE_SHARD_FILES", 0)) + 1):
+    DATABASES[f"votes_{shard}"] = {**DATABASES["default"], "NAME": BASE_DIR / f"votes-{shard}.sqlite3"}
+    POLLS_VOTE_SHARDS.append(f"votes_{shard}")
+
+# Pins categories to a vote shard, e.g. {7: "votes_2"}; others are spread by id
+POLLS_CATEGORY_SHARDS = {}
+
+DATABASE_ROUTERS = ["polls.sharding.VoteShardRouter"]
+
 
 # Password validation
 # https://docs.djangoproject.com/en/5.2/ref/settings/#auth-password-validators
@@ -116,6 +138,18 @@ USE_TZ = True
 # https://docs.djangoproject.com/en/5.2/howto/static-files/
 
 STATIC_URL = "static/"
+STATIC_ROOT = BASE_DIR / "staticfiles"
+
+# collectstatic writes content-hashed copies plus .gz/.br siblings into
+# STATIC_ROOT; serve that directory with far-future expiry headers.
+STORAGES = {
+    "default": {
+        "BACKEND": "django.core.files.storage.FileSystemStorage",
+    },
+    "staticfiles": {
+        "BACKEND": "polls.storage.PrecompressedManifestStaticFilesStorage",
+    },
+}
 
 # Default primary key field type
 # https://docs.djangoproject.com/en/5.2/ref/settings/#default-auto-field
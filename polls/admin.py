@@ -3,6 +3,8 @@ from django.utils.html import format_html
 from django.urls import reverse
 from django.utils.safestring import mark_safe
 from .models import Questions, Choice, ThisOrThat, ThisOrThatCategory, Vote
+from django.db.models import Q
+from . import search, sharding, stats, voting
 
 class ChoiceInline(admin.TabularInline):
     model = Choice
@@ -26,6 +28,10 @@ class ThisOrThatCategoryAdmin(admin.ModelAdmin):
     list_display = ['name', 'icon', 'question_count', 'total_votes', 'is_active', 'created_at']
     list_filter = ['is_active', 'created_at']
     search_fields = ['name', 'description']
+    actions = ['reset_votes']
+    
+    # Votes removed per transaction, so a big category never holds one long lock
+    reset_batch_size = 5000
     
     def question_count(self, obj):
         count = obj.thisorthat_set.filter(is_active=True).count()
@@ -38,18 +44,31 @@ class ThisOrThatCategoryAdmin(admin.ModelAdmin):
     question_count.short_description = "Questions"
     
     def total_votes(self, obj):
-        votes = Vote.objects.filter(this_or_that__category=obj).count()
+        votes = sharding.category_votes(obj.id).count()
         return f"{votes:,} votes"
     total_votes.short_description = "Total Votes"
+    
+    @admin.action(description="Reset all votes in selected categories")
+    def reset_votes(self, request, queryset):
+        removed = 0
+        for category in queryset:
+            while True:
+                votes = sharding.category_votes(category.id)
+                batch = list(votes.order_by('id').values_list('id', flat=True)[:self.reset_batch_size])
+                if not batch:
+                    break
+                removed += voting.reset_votes(votes.filter(id__in=batch))
+        self.message_user(request, f"Removed {removed:,} votes and updated the question totals.")
 
 @admin.register(ThisOrThat)
 class ThisOrThatAdmin(admin.ModelAdmin):
     list_display = [
-        'question_preview', 'category', 'votes_display', 'winning_side', 
+        'question_preview', 'category', 'votes_display', 'winning_side', 'confidence',
         'total_votes', 'is_active', 'featured', 'created_at'
     ]
     list_filter = ['category', 'is_active', 'featured', 'created_at']
-    search_fields = ['option_a', 'option_b']
+    # Matched through the full-text index, see get_search_results
+    search_fields = ['option_a', 'option_b', 'category__name']
     readonly_fields = ['votes_a', 'votes_b', 'created_at', 'vote_breakdown']
     
     fieldsets = [
@@ -73,6 +92,11 @@ class ThisOrThatAdmin(admin.ModelAdmin):
         })
     ]
     
+    def get_search_results(self, request, queryset, search_term):
+        if not search_term.strip():
+            return queryset, False
+        return search.matching(queryset, search_term), False
+    
     def question_preview(self, obj):
         return f"{obj.option_a} vs {obj.option_b}"
     question_preview.short_description = "Question"
@@ -111,6 +135,16 @@ class ThisOrThatAdmin(admin.ModelAdmin):
                              str(e), getattr(obj, 'votes_a', 'N/A'), getattr(obj, 'votes_b', 'N/A'), type(e).__name__)
     winning_side.short_description = "Winner"
     
+    def confidence(self, obj):
+        # See stats.py: 95% interval of A's share and the chance the leader is really ahead
+        summary = stats.summary(obj.votes_a, obj.votes_b)
+        # Formatted first: format_html turns its arguments into strings
+        return format_html(
+            '<span title="Chance the leader is really ahead: {}">A {}–{}</span>',
+            f"{summary['win_probability']:.0%}", f"{summary['low']:.0%}", f"{summary['high']:.0%}"
+        )
+    confidence.short_description = "Confidence"
+    
     def vote_breakdown(self, obj):
         try:
             # Get vote counts directly from the model fields
@@ -148,10 +182,20 @@ class ThisOrThatAdmin(admin.ModelAdmin):
 @admin.register(Vote)
 class VoteAdmin(admin.ModelAdmin):
     list_display = ['voter_info', 'question_preview', 'choice_display', 'timestamp']
-    list_filter = ['choice', 'timestamp', 'this_or_that__category']
-    search_fields = ['user__username', 'this_or_that__option_a', 'this_or_that__option_b']
+    list_filter = ['choice', 'timestamp', 'category', 'agent__device']
+    # Usernames match exactly (a unique index); question text through the full-text index
+    search_fields = ['=user__username', 'this_or_that__option_a', 'this_or_that__option_b']
     readonly_fields = ['user', 'session_key', 'this_or_that', 'choice', 'timestamp', 'user_agent', 'ip_address']
     
+    def get_search_results(self, request, queryset, search_term):
+        search_term = search_term.strip()
+        if not search_term:
+            return queryset, False
+        condition = Q(user__username=search_term)
+        if search.words(search_term):
+            condition |= Q(this_or_that_id__in=search.matching_ids(search_term))
+        return queryset.filter(condition), False
+    
     def voter_info(self, obj):
         if obj.user:
             return format_html(
@@ -0,0 +1,211 @@
+"""
+Read-only JSON API over categories, ThisOrThat tallies and classic poll results.
+
+Lists are paginated by keyset: each page holds the rows with ``id`` greater
+than ``?after=`` in id order, and ``next`` links to the page after the last
+row. The database seeks straight to that id through the primary key, so the
+thousandth page costs the same as the first (OFFSET would read and throw
+away every row before it). ``?fields=a,b`` trims each row to the named
+fields and ``?limit=`` sets the page size.
+
+Category and question lists carry an ETag and Last-Modified derived from the
+category versions and latest votes, so a client revalidating an unchanged page gets a 304
+before any rows are read. Classic poll results have no version to key on;
+their ETag is a hash of the page, which still saves the transfer.
+"""
+import hashlib
+
+from django.conf import settings
+from django.db.models import Count, F, Max, Sum
+from django.http import JsonResponse
+from django.utils import timezone
+from django.utils.cache import get_conditional_response
+from django.views.decorators.cache import cache_control
+from django.views.decorators.http import condition, require_GET
+
+from . import sharding
+from .models import Choice, Questions, ThisOrThat, ThisOrThatCategory
+
+PAGE_SIZE = getattr(settings, 'POLLS_API_PAGE_SIZE', 50)
+MAX_PAGE_SIZE = getattr(settings, 'POLLS_API_MAX_PAGE_SIZE', 500)
+SHARED_CACHE_SECONDS = getattr(settings, 'POLLS_SHARED_CACHE_SECONDS', 30)
+
+# Public field name -> model field or expression
+CATEGORY_FIELDS = {
+    'id': 'id',
+    'name': 'name',
+    'icon': 'icon',
+    'description': 'description',
+    'created_at': 'created_at',
+    'updated_at': 'updated_at',
+}
+QUESTION_FIELDS = {
+    'id': 'id',
+    'category_id': 'category_id',
+    'option_a': 'option_a',
+    'option_b': 'option_b',
+    'option_a_image': 'option_a_image',
+    'option_b_image': 'option_b_image',
+    'votes_a': 'votes_a',
+    'votes_b': 'votes_b',
+    'total_votes': F('votes_a') + F('votes_b'),
+    'featured': 'featured',
+    'created_at': 'created_at',
+}
+POLL_FIELDS = {
+    'id': 'id',
+    'question_text': 'question_text',
+    'pub_date': 'pub_date',
+    'choices': None,  # filled in from Choice
+}
+
+
+class ApiError(ValueError):
+    pass
+
+
+def _int_param(request, name, default, minimum, maximum=None):
+    value = request.GET.get(name)
+    if value in (None, ''):
+        return default
+    try:
+        value = int(value)
+    except ValueError:
+        raise ApiError(f'{name} must be an integer')
+    if value < minimum or (maximum is not None and value > maximum):
+        bounds = f'between {minimum} and {maximum}' if maximum is not None else f'at least {minimum}'
+        raise ApiError(f'{name} must be {bounds}')
+    return value
+
+
+def _fields(request, available):
+    requested = request.GET.get('fields')
+    if not requested:
+        return list(available)
+    fields = [field for field in requested.split(',') if field]
+    unknown = sorted(set(fields) - set(available))
+    if unknown:
+        raise ApiError(f"Unknown fields: {', '.join(unknown)} (available: {', '.join(available)})")
+    return fields
+
+
+def _page(request, queryset, available):
+    """
+    One keyset page of ``queryset``: the rows (dicts with the selected fields
+    plus ``id``), the selected field names and the URL of the next page.
+    """
+    after = _int_param(request, 'after', 0, 0)
+    limit = _int_param(request, 'limit', PAGE_SIZE, 1, MAX_PAGE_SIZE)
+    fields = _fields(request, available)
+    columns = {field: available[field] for field in fields if available[field] is not None}
+    plain = [field for field, column in columns.items() if column == field]
+    expressions = {field: column for field, column in columns.items() if column != field}
+    # The cursor needs the id even when the client did not ask for it
+    rows = list(
+        queryset.filter(id__gt=after).order_by('id')
+        .values('id', *[field for field in plain if field != 'id'], **expressions)[:limit + 1]
+    )
+    next_url = None
+    if len(rows) > limit:
+        rows = rows[:limit]
+        params = request.GET.copy()
+        params['after'] = rows[-1]['id']
+        next_url = f'{request.path}?{params.urlencode()}'
+    return rows, fields, next_url
+
+
+def _respond(rows, fields, next_url):
+    results = [{field: row[field] for field in fields} for row in rows]
+    return JsonResponse({'results': results, 'next': next_url})
+
+
+def _error(error):
+    return JsonResponse({'error': str(error)}, status=400)
+
+
+def _category_filter(request):
+    value = request.GET.get('category')
+    if value in (None, ''):
+        return None
+    try:
+        return int(value)
+    except ValueError:
+        raise ApiError('category must be an integer')
+
+
+def _list_state(request):
+    """Version fingerprint of the categories a list depends on, memoised per request"""
+    if not hasattr(request, '_polls_api_state'):
+        categories = ThisOrThatCategory.objects.all()
+        last_votes = ()
+        if request.resolver_match.url_name == 'api_questions':
+            # A question list for one category only changes with that category.
+            # Its tallies change with votes, which leave the versions alone
+            category = request.GET.get('category', '')
+            if category.isdigit():
+                categories = categories.filter(id=int(category))
+            last_votes = sharding.last_vote_times(int(category) if category.isdigit() else None)
+        request._polls_api_state = categories.aggregate(
+            count=Count('id'), version=Sum('version'), updated_at=Max('updated_at')
+        )
+        request._polls_api_state['last_votes'] = last_votes
+    return request._polls_api_state
+
+
+def _list_etag(request):
+    state = _list_state(request)
+    updated_at = state['updated_at'].timestamp() if state['updated_at'] else 0
+    last_votes = '-'.join(str(last.timestamp()) if last else '0' for last in state['last_votes'])
+    return f"{state['count']}-{state['version'] or 0}-{updated_at}-{last_votes}"
+
+
+def _list_last_modified(request):
+    state = _list_state(request)
+    return max(filter(None, (state['updated_at'], *state['last_votes'])), default=None)
+
+
+@require_GET
+@cache_control(public=True, max_age=0, s_maxage=SHARED_CACHE_SECONDS)
+@condition(etag_func=_list_etag, last_modified_func=_list_last_modified)
+def categories(request):
+    """Active categories"""
+    try:
+        return _respond(*_page(request, ThisOrThatCategory.objects.filter(is_active=True), CATEGORY_FIELDS))
+    except ApiError as e:
+        return _error(e)
+
+
+@require_GET
+@cache_control(public=True, max_age=0, s_maxage=SHARED_CACHE_SECONDS)
+@condition(etag_func=_list_etag, last_modified_func=_list_last_modified)
+def questions(request):
+    """Active ThisOrThat questions with their tallies, optionally for one ``?category=``"""
+    try:
+        queryset = ThisOrThat.objects.filter(is_active=True, category__is_active=True)
+        category_id = _category_filter(request)
+        if category_id is not None:
+            queryset = queryset.filter(category_id=category_id)
+        return _respond(*_page(request, queryset, QUESTION_FIELDS))
+    except ApiError as e:
+        return _error(e)
+
+
+@require_GET
+@cache_control(public=True, max_age=0, s_maxage=SHARED_CACHE_SECONDS)
+def polls(request):
+    """Published classic questions with their choices and vote counts"""
+    try:
+        rows, fields, next_url = _page(request, Questions.objects.filter(pub_date__lte=timezone.now()), POLL_FIELDS)
+    except ApiError as e:
+        return _error(e)
+    if 'choices' in fields:
+        choices = {row['id']: [] for row in rows}
+        for choice in Choice.objects.filter(question_id__in=list(choices)).order_by('id').values(
+            'question_id', 'id', 'choice_text', 'votes'
+        ):
+            choices[choice.pop('question_id')].append(choice)
+        for row in rows:
+            row['choices'] = choices[row['id']]
+    response = _respond(rows, fields, next_url)
+    response['ETag'] = f'"{hashlib.md5(response.content).hexdigest()}"'
+    return get_conditional_response(request, etag=response['ETag'], response=response)
@@ -4,3 +4,11 @@ from django.apps import AppConfig
 class PollsConfig(AppConfig):
     default_auto_field = "django.db.models.BigAutoField"
     name = "polls"
+
+    def ready(self):
+        from . import signals  # noqa: F401
+
+        # Startup cache warm-up is started by mysite's WSGI and ASGI modules
+        # (see warmup.warm_on_startup), which only server processes load:
+        # runserver imports WSGI_APPLICATION in the process that serves
+        # requests, and no other management command does
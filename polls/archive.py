@@ -0,0 +1,162 @@
+"""
+Archiving old votes out of the hot Vote table.
+
+Anonymous votes older than the retention window are processed in id-ordered
+batches: each batch is appended to gzip-compressed NDJSON files (one per
+month of vote time, under POLLS_VOTE_ARCHIVE_DIR), then folded into hourly
+VoteRollup rows and deleted from Vote in one transaction. Question counters
+are not touched, so totals stay the same.
+
+Votes of logged-in users are kept, because they are what stops a user from
+answering the same question twice. Anonymous votes are only archived once
+their session can no longer exist.
+
+With vote shards (see sharding.py) each vote database is archived in turn,
+into its own files, because vote ids are only unique within a database.
+The rollups all go to the default database.
+
+The archive file is written before the transaction. A crash in between can
+leave a batch in the archive twice; iter_archived_votes() skips repeated ids.
+"""
+import gzip
+import itertools
+import json
+import os
+from collections import defaultdict
+from datetime import timedelta, timezone as dt_timezone
+from pathlib import Path
+
+from django.conf import settings
+from django.db import DEFAULT_DB_ALIAS
+from django.utils import timezone
+
+from . import sharding
+from .models import UserAgent, Vote, VoteRollup
+
+ARCHIVE_FIELDS = ('id', 'this_or_that_id', 'category_id', 'user_id', 'session_key', 'choice', 'timestamp', 'user_agent', 'ip_address')
+
+
+def archive_dir():
+    return Path(getattr(settings, 'POLLS_VOTE_ARCHIVE_DIR', settings.BASE_DIR / 'vote_archive'))
+
+
+def retention_days():
+    return getattr(settings, 'POLLS_VOTE_RETENTION_DAYS', 90)
+
+
+def min_retention_days():
+    """Shortest window that cannot archive a vote whose session is still valid"""
+    return -(-settings.SESSION_COOKIE_AGE // 86400)
+
+
+def vote_rows(votes, chunk_size=2000):
+    """
+    Yield ``votes`` as dicts with ARCHIVE_FIELDS, the interned user agent
+    spelled out. The agents are looked up in the default database, a chunk
+    of votes at a time, since the UserAgent table is not in the shard files.
+    """
+    fields = [field for field in ARCHIVE_FIELDS if field != 'user_agent']
+    rows = votes.values(*fields, 'agent_id').iterator(chunk_size=chunk_size)
+    while chunk := list(itertools.islice(rows, chunk_size)):
+        strings = dict(
+            UserAgent.objects.filter(id__in={row['agent_id'] for row in chunk} - {None}).values_list('id', 'string')
+        )
+        for row in chunk:
+            row['user_agent'] = strings.get(row.pop('agent_id'), '')
+            yield {field: row[field] for field in ARCHIVE_FIELDS}
+
+
+def archivable_votes(days, using=DEFAULT_DB_ALIAS):
+    cutoff = timezone.now() - timedelta(days=days)
+    return Vote.objects.using(using).filter(timestamp__lt=cutoff, user__isnull=True)
+
+
+def _hour(timestamp):
+    return timestamp.astimezone(dt_timezone.utc).replace(minute=0, second=0, microsecond=0)
+
+
+def _archive_name(month, using):
+    suffix = '' if using == DEFAULT_DB_ALIAS else f'-{using}'
+    return f'votes-{month}{suffix}.ndjson.gz'
+
+
+def _write_archive(rows, root, using=DEFAULT_DB_ALIAS):
+    """Append ``rows`` to their monthly archive files, each file as one new gzip member"""
+    by_month = defaultdict(list)
+    for row in rows:
+        by_month[row['timestamp'].strftime('%Y-%m')].append(row)
+    root.mkdir(parents=True, exist_ok=True)
+    for month, month_rows in by_month.items():
+        lines = ''.join(
+            json.dumps({**row, 'timestamp': row['timestamp'].isoformat()}) + '\n'
+            for row in month_rows
+        )
+        with open(root / _archive_name(month, using), 'ab') as handle:
+            handle.write(gzip.compress(lines.encode(), mtime=0))
+            handle.flush()
+            os.fsync(handle.fileno())
+
+
+def _roll_up(rows):
+    """Add ``rows`` to the hourly VoteRollup rows"""
+    totals = defaultdict(lambda: [0, 0])
+    categories = {}
+    for row in rows:
+        totals[(row['this_or_that_id'], _hour(row['timestamp']))][row['choice'] == 'B'] += 1
+        categories[row['this_or_that_id']] = row['category_id']
+
+    existing = {
+        (rollup.this_or_that_id, rollup.hour): rollup
+        for rollup in VoteRollup.objects.filter(
+            this_or_that_id__in={key[0] for key in totals},
+            hour__in={key[1] for key in totals},
+        )
+    }
+    new, changed = [], []
+    for (question_id, hour), (votes_a, votes_b) in totals.items():
+        rollup = existing.get((question_id, hour))
+        if rollup is None:
+            new.append(VoteRollup(
+                this_or_that_id=question_id, category_id=categories[question_id],
+                hour=hour, votes_a=votes_a, votes_b=votes_b,
+            ))
+        else:
+            rollup.votes_a += votes_a
+            rollup.votes_b += votes_b
+            changed.append(rollup)
+    VoteRollup.objects.bulk_create(new)
+    VoteRollup.objects.bulk_update(changed, ['votes_a', 'votes_b'])
+
+
+def archive_votes(days=None, batch_size=5000, root=None):
+    """Archive votes older than ``days`` in batches; returns how many were moved"""
+    days = retention_days() if days is None else days
+    root = root or archive_dir()
+    moved = 0
+    for using in sharding.vote_databases():
+        while True:
+            rows = list(
+                vote_rows(archivable_votes(days, using).order_by('id')[:batch_size])
+            )
+            if not rows:
+                break
+            _write_archive(rows, root, using)
+            with sharding.atomic([DEFAULT_DB_ALIAS, using]):
+                _roll_up(rows)
+                Vote.objects.using(using).filter(id__in=[row['id'] for row in rows]).delete()
+            moved += len(rows)
+    return moved
+
+
+def iter_archived_votes(root=None):
+    """Yield every archived vote as a dict, oldest month first"""
+    root = root or archive_dir()
+    for path in sorted(root.glob('votes-*.ndjson.gz')):
+        seen = set()
+        with gzip.open(path, 'rt') as handle:
+            for line in handle:
+                row = json.loads(line)
+                if row['id'] in seen:
+                    continue
+                seen.add(row['id'])
+                yield row
@@ -0,0 +1,427 @@
+"""
+Vote counters for ThisOrThat questions.
+
+Normally a vote updates ``votes_a``/``votes_b`` on the question row. Once a
+question takes more than POLLS_SHARD_PROMOTE_WRITES_PER_SECOND writes it is
+promoted to sharded mode: writes then go to one of POLLS_COUNTER_SHARDS
+CounterShard rows picked at random, so concurrent voters no longer queue on
+a single row. The shards hold deltas that have not reached the question row
+yet, so the exact tally is always row + sum(shards). At most once every
+POLLS_COUNTER_FOLD_SECONDS the pending deltas are folded back into the row,
+which keeps every other reader of votes_a/votes_b (summary, admin, export)
+close to current. Folds run in a background timer scheduled by the first
+vote of each interval, never on the vote path, and the last votes before a
+question goes quiet are folded at the end of their interval like any other.
+A fold that finds the question down to under half the promotion rate
+demotes it again.
+
+Questions whose category lives in a vote shard (see sharding.py) keep their
+counters in that database instead, as CounterShard rows holding running
+totals, so a vote and its counter change commit in one file. Their
+votes_a/votes_b are then only a copy, refreshed by fold() at most once every
+POLLS_COUNTER_FOLD_SECONDS by overwriting rather than adding, so a fold that
+dies halfway is simply repeated.
+"""
+import logging
+import random
+import threading
+import time
+from collections import defaultdict
+
+from django.conf import settings
+from django.core.cache import cache
+from django.db import DEFAULT_DB_ALIAS, OperationalError, connections, transaction
+from django.db.models import Case, F, Sum, Value, When
+from django.db.models.functions import Coalesce
+
+from . import sharding, snapshots
+from .models import CounterShard, ThisOrThat, ThisOrThatCategory
+
+logger = logging.getLogger(__name__)
+
+# Ids per IN (...) list, well under SQLite's limit on query parameters
+_CHUNK = 500
+
+
+def _setting(name, default):
+    return getattr(settings, name, default)
+
+
+def shard_count():
+    return _setting('POLLS_COUNTER_SHARDS', 8)
+
+
+def promote_threshold():
+    """Writes per second above which a question is sharded (0 disables promotion)"""
+    return _setting('POLLS_SHARD_PROMOTE_WRITES_PER_SECOND', 20)
+
+
+def fold_interval():
+    return _setting('POLLS_COUNTER_FOLD_SECONDS', 2)
+
+
+def totals_cache_seconds():
+    return _setting('POLLS_COUNTER_CACHE_SECONDS', 1)
+
+
+def _totals_key(question_id):
+    return f'polls:counter-totals:{question_id}'
+
+
+def _chunks(ids):
+    ids = list(ids)
+    for start in range(0, len(ids), _CHUNK):
+        yield ids[start:start + _CHUNK]
+
+
+def add_votes(question, delta_a, delta_b):
+    """Apply a vote delta to ``question``, through its shards if it has any"""
+    if not delta_a and not delta_b:
+        return
+    using = sharding.db_for_category(question.category_id)
+    if using != DEFAULT_DB_ALIAS:
+        _add_in_vote_shard(question, delta_a, delta_b, using)
+    elif question.counter_shards:
+        CounterShard.objects.filter(
+            this_or_that_id=question.id, shard=random.randrange(question.counter_shards)
+        ).update(votes_a=F('votes_a') + delta_a, votes_b=F('votes_b') + delta_b)
+        _count_write(question.id)
+        # Folding writes the question row, so it never runs in the voter's
+        # transaction: one background fold per question per interval does it
+        transaction.on_commit(lambda: fold_later(question.id))
+    else:
+        ThisOrThat.objects.filter(id=question.id).update(
+            votes_a=F('votes_a') + delta_a, votes_b=F('votes_b') + delta_b
+        )
+        # No version bump: every vote in the category would then write its
+        # row. Pages showing tallies also key on the latest vote's time
+        # (sharding.last_vote_times); bulk changes and folds still bump.
+        transaction.on_commit(lambda: snapshots.expire_categories([question.category_id]))
+        _record_write(question)
+
+
+def add_votes_bulk(deltas, questions=None):
+    """
+    Apply ``{question_id: (delta_a, delta_b)}``. Unsharded questions are
+    updated with a single UPDATE; sharded ones go through their shards.
+    ``questions`` maps ids to ThisOrThat already loaded by the caller.
+    """
+    deltas = {question_id: delta for question_id, delta in deltas.items() if any(delta)}
+    if not deltas:
+        return
+    if questions is None:
+        questions = ThisOrThat.objects.filter(id__in=list(deltas)).only('id', 'category_id', 'counter_shards')
+    else:
+        questions = [questions[question_id] for question_id in deltas]
+    plain = []
+    for question in questions:
+        if question.counter_shards or sharding.db_for_category(question.category_id) != DEFAULT_DB_ALIAS:
+            add_votes(question, *deltas[question.id])
+        else:
+            plain.append(question)
+    if plain:
+        def change(index):
+            return Case(
+                *[When(id=question.id, then=Value(deltas[question.id][index])) for question in plain],
+                default=Value(0),
+            )
+        ThisOrThat.objects.filter(id__in=[question.id for question in plain]).update(
+            votes_a=F('votes_a') + change(0), votes_b=F('votes_b') + change(1)
+        )
+        ThisOrThatCategory.bump_version(*{question.category_id for question in plain})
+
+
+def _add_in_vote_shard(question, delta_a, delta_b, using):
+    """Add to one of the question's running-total rows in vote shard ``using``"""
+    slot = CounterShard.objects.using(using).filter(
+        this_or_that_id=question.id, shard=random.randrange(shard_count())
+    )
+    change = {'votes_a': F('votes_a') + delta_a, 'votes_b': F('votes_b') + delta_b}
+    if not slot.update(**change):
+        # First vote since the question was created or moved here
+        CounterShard.objects.using(using).bulk_create(
+            [CounterShard(this_or_that_id=question.id, shard=i) for i in range(shard_count())],
+            ignore_conflicts=True,
+        )
+        slot.update(**change)
+    # After the commit, so the question row never shows a vote that rolled back
+    if cache.add(f'polls:counter-fold:{question.id}', True, fold_interval()):
+        transaction.on_commit(lambda: _refresh_copy(using, question.id), using=using)
+    else:
+        transaction.on_commit(lambda: fold_later(question.id), using=using)
+
+
+def _refresh_copy(using, question_id):
+    """
+    Copy a question's totals from vote shard ``using`` to its row, unless the
+    default database is busy writing: waiting for it would make this shard's
+    voters queue behind the default database's again. The next vote, or
+    fold_all(), tries again.
+    """
+    connection = connections[DEFAULT_DB_ALIAS]
+    if connection.vendor != 'sqlite':
+        _copy_shard_totals(using, [question_id])
+        return
+    with connection.cursor() as cursor:
+        cursor.execute('PRAGMA busy_timeout')
+        timeout = cursor.fetchone()[0]
+        cursor.execute('PRAGMA busy_timeout = 0')
+        try:
+            _copy_shard_totals(using, [question_id])
+        except OperationalError:
+            cache.delete(f'polls:counter-fold:{question_id}')
+        finally:
+            cursor.execute(f'PRAGMA busy_timeout = {int(timeout)}')
+
+
+def _shard_totals(using, question_ids=None):
+    """``{question_id: (votes_a, votes_b)}`` from the running totals in vote shard ``using``"""
+    rows = CounterShard.objects.using(using)
+    if question_ids is not None:
+        rows = rows.filter(this_or_that_id__in=question_ids)
+    return {
+        question_id: (votes_a, votes_b)
+        for question_id, votes_a, votes_b in rows.values('this_or_that_id').annotate(
+            total_a=Sum('votes_a'), total_b=Sum('votes_b')
+        ).values_list('this_or_that_id', 'total_a', 'total_b')
+    }
+
+
+def _copy_shard_totals(using, question_ids=None):
+    """Overwrite question rows with their totals in vote shard ``using``; returns how many changed"""
+    totals = {}
+    if question_ids is None:
+        totals = _shard_totals(using)
+    else:
+        for chunk in _chunks(question_ids):
+            totals.update(_shard_totals(using, chunk))
+    changed = []
+    for chunk in _chunks(totals):
+        for question in ThisOrThat.objects.filter(id__in=chunk).only('id', 'category_id', 'votes_a', 'votes_b'):
+            if (question.votes_a, question.votes_b) != totals[question.id]:
+                question.votes_a, question.votes_b = totals[question.id]
+                changed.append(question)
+    ThisOrThat.objects.bulk_update(changed, ['votes_a', 'votes_b'], batch_size=_CHUNK)
+    ThisOrThatCategory.bump_version(*{question.category_id for question in changed})
+    return len(changed)
+
+
+def _count_write(question_id):
+    """Count a write in the current one-second window; returns the count so far"""
+    key = f'polls:counter-writes:{question_id}:{int(time.time())}'
+    cache.add(key, 0, 5)
+    try:
+        return cache.incr(key)
+    except ValueError:  # expired between add and incr
+        return 0
+
+
+def _recent_writes(question_id):
+    """Writes in the busier of the current and the previous one-second window"""
+    second = int(time.time())
+    counts = cache.get_many([f'polls:counter-writes:{question_id}:{second - i}' for i in (0, 1)])
+    return max(counts.values(), default=0)
+
+
+def _record_write(question):
+    """Count writes per one-second window and promote the question when it runs hot"""
+    threshold = promote_threshold()
+    if threshold and _count_write(question.id) == threshold + 1:
+        promote(question)
+
+
+def promote(question, shards=None):
+    """Switch ``question`` to sharded counters"""
+    shards = shards or shard_count()
+    with transaction.atomic():
+        CounterShard.objects.bulk_create(
+            [CounterShard(this_or_that_id=question.id, shard=i) for i in range(shards)],
+            ignore_conflicts=True,
+        )
+        # Shards exist before the flag flips, so writers never pick a missing one
+        ThisOrThat.objects.filter(id=question.id, counter_shards=0).update(counter_shards=shards)
+    question.counter_shards = shards
+
+
+def demote(question_id):
+    """
+    Switch ``question_id`` back to updating its row. The shard rows stay:
+    writers that loaded the question before the switch may still add to
+    them, and their own fold moves those deltas over.
+    """
+    ThisOrThat.objects.filter(id=question_id).exclude(counter_shards=0).update(counter_shards=0)
+
+
+def fold(question_id):
+    """Move pending shard deltas into the question row, demoting it once it has cooled down"""
+    category_id = ThisOrThat.objects.filter(id=question_id).values_list('category_id', flat=True).first()
+    using = sharding.db_for_category(category_id)
+    if using != DEFAULT_DB_ALIAS:
+        _copy_shard_totals(using, [question_id])
+        return
+    with transaction.atomic():
+        pending = list(
+            CounterShard.objects.filter(this_or_that_id=question_id)
+            .exclude(votes_a=0, votes_b=0)
+            .values_list('id', 'votes_a', 'votes_b')
+        )
+        if pending:
+            # Subtract what was read rather than zeroing, so concurrent shard
+            # writes made since the read are kept for the next fold
+            for shard_id, votes_a, votes_b in pending:
+                CounterShard.objects.filter(id=shard_id).update(
+                    votes_a=F('votes_a') - votes_a, votes_b=F('votes_b') - votes_b
+                )
+            ThisOrThat.objects.filter(id=question_id).update(
+                votes_a=F('votes_a') + sum(row[1] for row in pending),
+                votes_b=F('votes_b') + sum(row[2] for row in pending),
+            )
+            ThisOrThatCategory.bump_version(category_id)
+        # Half the promotion rate, so a question near it does not flip back and forth
+        if _recent_writes(question_id) * 2 < promote_threshold():
+            demote(question_id)
+
+
+def fold_later(question_id):
+    """
+    Fold ``question_id`` once the current fold interval is over, from a
+    background timer; one is pending per question at a time.
+    """
+    if not cache.add(f'polls:counter-fold-later:{question_id}', True, fold_interval()):
+        return
+    timer = threading.Timer(fold_interval(), _fold_in_background, args=(question_id,))
+    timer.daemon = True
+    timer.start()
+
+
+def _fold_in_background(question_id):
+    try:
+        fold(question_id)
+    except Exception:  # e.g. the database stayed locked; the next vote or fold_all() retries
+        logger.exception("Folding the counters of question %s failed", question_id)
+    finally:
+        # The timer thread has its own connections; don't leak them
+        connections.close_all()
+
+
+def fold_all():
+    """
+    Fold every sharded question and refresh the copies of counters kept in
+    vote shards; returns how many had pending changes.
+    """
+    question_ids = (
+        CounterShard.objects.exclude(votes_a=0, votes_b=0)
+        .values_list('this_or_that_id', flat=True).distinct()
+    )
+    folded = 0
+    for question_id in list(question_ids):
+        fold(question_id)
+        folded += 1
+    for using in sharding.vote_databases()[1:]:
+        folded += _copy_shard_totals(using)
+    return folded
+
+
+def set_totals(totals):
+    """
+    Overwrite the counters of ``{question_id: (votes_a, votes_b)}`` and drop
+    their pending shard deltas, e.g. when rebuilding from the vote event log.
+    Questions in vote shards get the totals there too. Unknown question ids
+    are ignored; returns how many questions were set.
+    """
+    questions = []
+    with transaction.atomic():
+        for chunk in _chunks(totals):
+            questions += ThisOrThat.objects.filter(id__in=chunk).only('id', 'category_id')
+        for question in questions:
+            question.votes_a, question.votes_b = totals[question.id]
+        ThisOrThat.objects.bulk_update(questions, ['votes_a', 'votes_b'], batch_size=1000)
+        for chunk in _chunks(question.id for question in questions):
+            CounterShard.objects.filter(this_or_that_id__in=chunk).update(votes_a=0, votes_b=0)
+    in_shards = defaultdict(list)
+    for question in questions:
+        using = sharding.db_for_category(question.category_id)
+        if using != DEFAULT_DB_ALIAS:
+            in_shards[using].append(question.id)
+    for using, question_ids in in_shards.items():
+        with transaction.atomic(using=using):
+            for chunk in _chunks(question_ids):
+                CounterShard.objects.using(using).filter(this_or_that_id__in=chunk).delete()
+            CounterShard.objects.using(using).bulk_create([
+                CounterShard(
+                    this_or_that_id=question_id, shard=0,
+                    votes_a=totals[question_id][0], votes_b=totals[question_id][1],
+                )
+                for question_id in question_ids
+            ], batch_size=_CHUNK)
+    cache.delete_many([_totals_key(question.id) for question in questions])
+    ThisOrThatCategory.bump_version(*{question.category_id for question in questions})
+    return len(questions)
+
+
+def totals(question):
+    """
+    Exact (votes_a, votes_b) for ``question``. Sharded questions are summed
+    across their shards and cached for POLLS_COUNTER_CACHE_SECONDS. Questions
+    in a vote shard are summed there, uncached: the few rows are in the file
+    the vote was just written to.
+    """
+    using = sharding.db_for_category(question.category_id)
+    if using != DEFAULT_DB_ALIAS:
+        return _shard_totals(using, [question.id]).get(question.id, (0, 0))
+    if not question.counter_shards:
+        row = ThisOrThat.objects.filter(id=question.id).values_list('votes_a', 'votes_b').first()
+        return row or (question.votes_a, question.votes_b)
+    key = _totals_key(question.id)
+    cached = cache.get(key)
+    if cached is not None:
+        return cached
+    row = ThisOrThat.objects.filter(id=question.id).annotate(
+        pending_a=Coalesce(Sum('counter_shard_set__votes_a'), 0),
+        pending_b=Coalesce(Sum('counter_shard_set__votes_b'), 0),
+    ).values_list('votes_a', 'votes_b', 'pending_a', 'pending_b').first()
+    result = (row[0] + row[2], row[1] + row[3])
+    cache.set(key, result, totals_cache_seconds())
+    return result
+
+
+def exact_totals(question_ids, using=None):
+    """
+    Exact ``{question_id: (votes_a, votes_b)}`` for many questions, counted
+    where ``using`` keeps them, or by default where each question's category
+    keeps them now. Questions that do not exist are left out.
+    """
+    by_database = defaultdict(list)
+    for chunk in _chunks(question_ids):
+        for question_id, category_id in ThisOrThat.objects.filter(id__in=chunk).values_list('id', 'category_id'):
+            by_database[using or sharding.db_for_category(category_id)].append(question_id)
+    result = {}
+    for alias, ids in by_database.items():
+        for chunk in _chunks(ids):
+            if alias != DEFAULT_DB_ALIAS:
+                in_shard = _shard_totals(alias, chunk)
+                result.update({question_id: in_shard.get(question_id, (0, 0)) for question_id in chunk})
+                continue
+            # Row plus pending shard deltas, in one query
+            result.update({
+                question_id: (votes_a + pending_a, votes_b + pending_b)
+                for question_id, votes_a, votes_b, pending_a, pending_b in ThisOrThat.objects.filter(
+                    id__in=chunk
+                ).annotate(
+                    pending_a=Coalesce(Sum('counter_shard_set__votes_a'), 0),
+                    pending_b=Coalesce(Sum('counter_shard_set__votes_b'), 0),
+                ).values_list('id', 'votes_a', 'votes_b', 'pending_a', 'pending_b')
+            })
+    return result
+
+
+def relocate(question_ids, source):
+    """
+    Move the counters of questions kept in vote database ``source`` to where
+    their categories live now, e.g. after a category changed shards.
+    """
+    moved = exact_totals(question_ids, using=source)
+    if source != DEFAULT_DB_ALIAS:
+        for chunk in _chunks(moved):
+            CounterShard.objects.using(source).filter(this_or_that_id__in=chunk).delete()
+    return set_totals(moved)
@@ -0,0 +1,163 @@
+"""
+Category completion funnels: how many voters got how far into each category.
+
+A voter's progress is the share of the category's active questions they
+answered, and the funnel counts, per category, the voters who reached each
+STEP (0 = answered at least one, then every 10%; 100 = completed).
+
+``update()`` maintains it from the votes cast since its last run instead of
+recounting every voter: per vote database it reads the votes after a
+watermark in id order, a chunk at a time, recounts only the voters in the
+chunk (through the per-category voter indexes) and moves each one up to
+the highest step they have now reached. A voter is counted once per step
+even if they reset their game and play again; revotes and deleted votes do
+not move anyone back. Progress is measured against the question count at
+the time the vote is processed.
+
+Reading the funnel is one query over at most ``len(STEPS)`` rows per
+category, whatever the number of voters or votes.
+"""
+from collections import defaultdict
+
+from django.db import DEFAULT_DB_ALIAS, transaction
+from django.db.models import Count, F
+
+from . import sharding
+from .models import FunnelProgress, FunnelStep, FunnelWatermark, ThisOrThat, Vote
+
+STEPS = tuple(range(0, 101, 10))
+
+
+def step_reached(answered, question_count):
+    """Highest step of ``answered`` out of ``question_count`` questions, or None before the first answer"""
+    if answered <= 0:
+        return None
+    if answered >= question_count:
+        return STEPS[-1]
+    return max(step for step in STEPS if step * question_count <= answered * 100)
+
+
+def _voter(user_id, session_key):
+    return f"user:{user_id}" if user_id is not None else f"session:{session_key}"
+
+
+def _answered(using, category_id, voters):
+    """How many votes each of ``voters`` (keys as from _voter) has in the category"""
+    users = [int(voter[5:]) for voter in voters if voter.startswith('user:')]
+    sessions = [voter[8:] for voter in voters if voter.startswith('session:')]
+    votes = Vote.objects.using(using).filter(category_id=category_id)
+    counts = {}
+    # Separate queries so each goes through its (category, user/session) index
+    if users:
+        for user_id, count in votes.filter(user_id__in=users).values_list('user_id').annotate(count=Count('id')):
+            counts[_voter(user_id, None)] = count
+    if sessions:
+        for session_key, count in votes.filter(user__isnull=True, session_key__in=sessions).values_list(
+            'session_key'
+        ).annotate(count=Count('id')):
+            counts[_voter(None, session_key)] = count
+    return counts
+
+
+def _process(using, rows):
+    """Move the voters of one chunk of vote rows along their category funnels"""
+    voters = defaultdict(set)
+    for row in rows:
+        if row['user_id'] is not None or row['session_key']:
+            voters[row['category_id']].add(_voter(row['user_id'], row['session_key']))
+    question_counts = dict(
+        ThisOrThat.objects.filter(category_id__in=list(voters), is_active=True).values_list(
+            'category_id'
+        ).annotate(count=Count('id'))
+    )
+    created, changed = [], []
+    reached = defaultdict(int)
+    for category_id, keys in voters.items():
+        answered = _answered(using, category_id, keys)
+        progress = {
+            item.voter: item for item in FunnelProgress.objects.filter(category_id=category_id, voter__in=keys)
+        }
+        for voter in keys:
+            count = answered.get(voter, 0)
+            step = step_reached(count, question_counts.get(category_id, 0))
+            item = progress.get(voter)
+            if item is None:
+                if step is None:
+                    continue
+                item = FunnelProgress(category_id=category_id, voter=voter, answered=count, step=step)
+                created.append(item)
+                previous = -1
+            elif step is None or step <= item.step:
+                continue
+            else:
+                previous = item.step
+                item.answered, item.step = count, step
+                changed.append(item)
+            for funnel_step in STEPS:
+                if previous < funnel_step <= step:
+                    reached[category_id, funnel_step] += 1
+    FunnelProgress.objects.bulk_create(created)
+    FunnelProgress.objects.bulk_update(changed, ['answered', 'step'])
+    FunnelStep.objects.bulk_create(
+        [FunnelStep(category_id=category_id, step=step) for category_id, step in reached], ignore_conflicts=True
+    )
+    for (category_id, step), count in reached.items():
+        FunnelStep.objects.filter(category_id=category_id, step=step).update(voters=F('voters') + count)
+
+
+def update(batch_size=1000):
+    """
+    Process the votes cast since the last run, ``batch_size`` at a time.
+    Returns the number of votes read. Run one at a time (e.g. from cron).
+    """
+    processed = 0
+    for using in sharding.vote_databases():
+        watermark, _ = FunnelWatermark.objects.get_or_create(database=using)
+        while True:
+            rows = list(
+                Vote.objects.using(using).filter(id__gt=watermark.last_vote_id).order_by('id')
+                .values('id', 'category_id', 'user_id', 'session_key')[:batch_size]
+            )
+            if not rows:
+                break
+            # The funnel and its watermark move together
+            with transaction.atomic(using=DEFAULT_DB_ALIAS):
+                _process(using, rows)
+                watermark.last_vote_id = rows[-1]['id']
+                watermark.save(update_fields=['last_vote_id'])
+            processed += len(rows)
+    return processed
+
+
+def reset():
+    """Forget all funnel data, so the next update() rebuilds it from the votes still stored"""
+    with transaction.atomic(using=DEFAULT_DB_ALIAS):
+        FunnelStep.objects.all().delete()
+        FunnelProgress.objects.all().delete()
+        FunnelWatermark.objects.all().delete()
+
+
+def funnel_data(categories):
+    """
+    The funnel of each of ``categories`` (dicts with id, name and icon, as
+    from get_category_stats) with its completion rate: the share of voters
+    who started the category and answered all of it.
+    """
+    counts = defaultdict(dict)
+    for category_id, step, voters in FunnelStep.objects.filter(
+        category_id__in=[category['id'] for category in categories]
+    ).values_list('category_id', 'step', 'voters'):
+        counts[category_id][step] = voters
+    funnels = []
+    for category in categories:
+        steps = [counts[category['id']].get(step, 0) for step in STEPS]
+        started, completed = steps[0], steps[-1]
+        funnels.append({
+            'name': category['name'],
+            'icon': category['icon'],
+            'steps': steps,
+            'started': started,
+            'completed': completed,
+            'completion_rate': round(completed / started * 100, 1) if started else 0,
+        })
+    return funnels
@@ -0,0 +1,123 @@
+"""
+Deterministic synthetic votes for load testing (see generate_load_data).
+
+Voters are split into fixed-size chunks and every chunk draws from its own
+random.Random seeded from (seed, chunk index). The output therefore only
+depends on the seed and the sizes, not on how many worker processes produced
+it or in which order they finished.
+
+Each voter answers a number of distinct questions picked with Zipfian
+popularity. Timestamps follow a daily cycle that peaks in the evening, and
+some votes are revotes: the choice flipped and the timestamp moved later.
+"""
+import math
+import random
+from dataclasses import dataclass
+from datetime import datetime, timedelta
+
+VOTERS_PER_CHUNK = 2000
+
+# Relative vote volume for each hour of the day (UTC), lowest around 08:00
+HOUR_WEIGHTS = [1 + 0.8 * math.cos(2 * math.pi * (hour - 20) / 24) for hour in range(24)]
+HOUR_CUM_WEIGHTS = [sum(HOUR_WEIGHTS[:hour + 1]) for hour in range(24)]
+
+USER_AGENTS = [
+    # (weight, header)
+    (30, "Mozilla/5.0 (iPhone; CPU iPhone OS 17_4 like Mac OS X) AppleWebKit/605.1.15 "
+         "(KHTML, like Gecko) Version/17.4 Mobile/15E148 Safari/604.1"),
+    (25, "Mozilla/5.0 (Linux; Android 14; Pixel 8) AppleWebKit/537.36 "
+         "(KHTML, like Gecko) Chrome/124.0.0.0 Mobile Safari/537.36"),
+    (20, "Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 "
+         "(KHTML, like Gecko) Chrome/124.0.0.0 Safari/537.36"),
+    (8, "Mozilla/5.0 (Macintosh; Intel Mac OS X 10_15_7) AppleWebKit/605.1.15 "
+        "(KHTML, like Gecko) Version/17.4 Safari/605.1.15"),
+    (7, "Mozilla/5.0 (Windows NT 10.0; Win64; x64; rv:125.0) Gecko/20100101 Firefox/125.0"),
+    (5, "Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 "
+        "(KHTML, like Gecko) Chrome/124.0.0.0 Safari/537.36 Edg/124.0.0.0"),
+    (3, "Mozilla/5.0 (iPad; CPU OS 17_4 like Mac OS X) AppleWebKit/605.1.15 "
+        "(KHTML, like Gecko) Version/17.4 Mobile/15E148 Safari/604.1"),
+    (2, "Mozilla/5.0 (compatible; Googlebot/2.1; +http://www.google.com/bot.html)"),
+]
+
+
+@dataclass
+class Plan:
+    """Everything a worker needs to generate its chunks (must stay picklable)"""
+    seed: int
+    question_ids: list
+    category_ids: list  # category of each entry in question_ids
+    p_a: list  # chance of choosing A for each entry in question_ids
+    cum_weights: list  # Zipfian popularity, cumulative
+    user_ids: list  # voters 0..len(user_ids)-1 are these users, the rest sessions
+    sessions: int
+    agent_ids: list
+    agent_cum_weights: list
+    votes_per_voter: float
+    revote_rate: float
+    days: int
+    end: datetime
+    session_prefix: str
+
+    @property
+    def voters(self):
+        return len(self.user_ids) + self.sessions
+
+
+def zipf_cum_weights(count, exponent=1.1):
+    total = 0.0
+    cum_weights = []
+    for rank in range(1, count + 1):
+        total += 1 / rank ** exponent
+        cum_weights.append(total)
+    return cum_weights
+
+
+def chunk_count(plan):
+    return -(-plan.voters // VOTERS_PER_CHUNK)
+
+
+def _timestamp(rng, plan):
+    day = rng.randrange(plan.days)
+    hour = rng.choices(range(24), cum_weights=HOUR_CUM_WEIGHTS)[0]
+    moment = plan.end.replace(hour=0, minute=0, second=0, microsecond=0) - timedelta(days=day)
+    moment += timedelta(hours=hour, seconds=rng.randrange(3600))
+    return min(moment, plan.end)
+
+
+def generate_chunk(plan, index):
+    """
+    Vote rows for voters ``index * VOTERS_PER_CHUNK`` onwards, as tuples of
+    (question_id, category_id, user_id, session_key, choice, timestamp,
+    agent_id, ip_address).
+    """
+    rng = random.Random(plan.seed * 1_000_003 + index)
+    questions = len(plan.question_ids)
+    rows = []
+    first = index * VOTERS_PER_CHUNK
+    for voter in range(first, min(first + VOTERS_PER_CHUNK, plan.voters)):
+        if voter < len(plan.user_ids):
+            user_id, session_key = plan.user_ids[voter], None
+        else:
+            user_id, session_key = None, f"{plan.session_prefix}{voter:x}"
+        agent_id = rng.choices(plan.agent_ids, cum_weights=plan.agent_cum_weights)[0]
+        ip_address = f"10.{rng.randrange(256)}.{rng.randrange(256)}.{rng.randrange(1, 255)}"
+        # Geometric number of answers with the requested mean, each question once
+        wanted = min(questions, 1 + int(rng.expovariate(1 / max(plan.votes_per_voter - 1, 1e-9))))
+        picked = set()
+        # Redraw duplicates so popular questions do not eat into the vote count
+        for _ in range(8):
+            picked.update(rng.choices(range(questions), cum_weights=plan.cum_weights, k=wanted - len(picked)))
+            if len(picked) == wanted:
+                break
+        for position in sorted(picked):
+            choice = 'A' if rng.random() < plan.p_a[position] else 'B'
+            timestamp = _timestamp(rng, plan)
+            if rng.random() < plan.revote_rate:
+                # The row keeps only the latest answer
+                choice = 'B' if choice == 'A' else 'A'
+                timestamp = min(timestamp + timedelta(minutes=rng.randrange(1, 2880)), plan.end)
+            rows.append((
+                plan.question_ids[position], plan.category_ids[position], user_id, session_key,
+                choice, timestamp, agent_id, ip_address,
+            ))
+    return rows
@@ -0,0 +1,27 @@
+from django.core.management.base import BaseCommand, CommandError
+
+from polls import archive
+
+
+class Command(BaseCommand):
+    help = (
+        "Move anonymous votes older than the retention window into compressed "
+        "NDJSON archives, keeping hourly rollups for analytics (run from cron)"
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("--days", type=int, default=archive.retention_days(),
+                            help="Retention window in days (default: POLLS_VOTE_RETENTION_DAYS)")
+        parser.add_argument("--batch-size", type=int, default=5000)
+
+    def handle(self, *args, **options):
+        days = options["days"]
+        if days < archive.min_retention_days():
+            raise CommandError(
+                f"--days must be at least {archive.min_retention_days()} "
+                "(SESSION_COOKIE_AGE), or revotes from live sessions would be double counted"
+            )
+        if options["batch_size"] < 1:
+            raise CommandError("--batch-size must be positive")
+        moved = archive.archive_votes(days, options["batch_size"])
+        self.stdout.write(f"Archived {moved} vote(s) to {archive.archive_dir()}")
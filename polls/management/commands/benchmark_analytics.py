@@ -0,0 +1,86 @@
+import random
+import time
+from datetime import timedelta
+
+from django.core.management.base import BaseCommand
+from django.db import transaction
+from django.db.models import Count
+from django.db.models.functions import TruncDate
+from django.utils import timezone
+
+from polls.models import ThisOrThat, ThisOrThatCategory, Vote
+from polls.views import _local_day_range, get_activity_data, get_hourly_data
+
+
+class Rollback(Exception):
+    """Raised to discard the synthetic rows once the benchmark is done."""
+
+
+class Command(BaseCommand):
+    help = "Time the dashboard chart queries and show their query plans"
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--votes", type=int, default=0,
+            help="Insert this many synthetic votes first (rolled back afterwards)",
+        )
+        parser.add_argument("--days", type=int, default=30, help="Activity window in days")
+        parser.add_argument("--repeat", type=int, default=5, help="Runs per query")
+
+    def handle(self, *args, **options):
+        try:
+            with transaction.atomic():
+                if options["votes"]:
+                    self.seed_votes(options["votes"])
+                self.run_benchmarks(options["days"], options["repeat"])
+                raise Rollback
+        except Rollback:
+            pass
+
+    def seed_votes(self, count):
+        category = ThisOrThatCategory.objects.create(name="Benchmark")
+        question = ThisOrThat.objects.create(category=category, option_a="A", option_b="B")
+        now = timezone.now()
+        batch = []
+        started = time.perf_counter()
+        for i in range(count):
+            batch.append(Vote(
+                this_or_that=question,
+                session_key=f"bench{i}",
+                choice=random.choice("AB"),
+            ))
+            if len(batch) >= 5000:
+                Vote.objects.bulk_create(batch)
+                batch = []
+        Vote.objects.bulk_create(batch)
+        # auto_now_add ignores explicit values, so spread timestamps over the
+        # last year afterwards, a chunk of rows at a time
+        ids = list(Vote.objects.filter(this_or_that=question).values_list("id", flat=True))
+        for start in range(0, len(ids), 1000):
+            Vote.objects.filter(id__in=ids[start:start + 1000]).update(
+                timestamp=now - timedelta(days=random.randrange(365), minutes=random.randrange(1440))
+            )
+        self.stdout.write(f"Seeded {count} votes in {time.perf_counter() - started:.2f}s")
+
+    def run_benchmarks(self, days, repeat):
+        tz = timezone.get_current_timezone()
+        end_date = timezone.localdate()
+        start, end = _local_day_range(end_date - timedelta(days=days), end_date, tz)
+        plan_qs = Vote.objects.filter(timestamp__gte=start, timestamp__lt=end).annotate(
+            day=TruncDate("timestamp", tzinfo=tz)
+        ).values("day").annotate(count=Count("id"))
+        self.stdout.write("Activity query plan:")
+        self.stdout.write(plan_qs.explain())
+
+        for label, func in [
+            ("get_activity_data", lambda: get_activity_data(days, tz=tz)),
+            ("get_hourly_data", lambda: get_hourly_data(days, tz=tz)),
+        ]:
+            timings = []
+            for _ in range(repeat):
+                started = time.perf_counter()
+                func()
+                timings.append((time.perf_counter() - started) * 1000)
+            self.stdout.write(
+                f"{label}: best {min(timings):.1f}ms, mean {sum(timings) / len(timings):.1f}ms"
+            )
@@ -0,0 +1,71 @@
+import threading
+import time
+
+from django.core.management.base import BaseCommand
+from django.db import OperationalError, connection, connections
+from django.test.utils import override_settings
+
+from polls import counters
+from polls.models import ThisOrThat, ThisOrThatCategory
+
+
+class Command(BaseCommand):
+    help = (
+        "Measure vote counter throughput with many concurrent writers on one "
+        "question, first on the question row and then on sharded counters. "
+        "The benchmark question is deleted afterwards."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("--threads", type=int, default=8)
+        parser.add_argument("--votes", type=int, default=500, help="Votes per thread")
+        parser.add_argument("--shards", type=int, default=counters.shard_count())
+
+    def handle(self, *args, **options):
+        if connection.vendor == "sqlite":
+            self.stderr.write(
+                "Note: SQLite locks the whole database for every write, so sharding "
+                "cannot add throughput here; run against PostgreSQL or MySQL."
+            )
+        category = ThisOrThatCategory.objects.create(name="Counter benchmark", is_active=False)
+        try:
+            for sharded in (False, True):
+                question = ThisOrThat.objects.create(
+                    category=category, option_a="A", option_b="B", is_active=False
+                )
+                if sharded:
+                    counters.promote(question, options["shards"])
+                self.run(question, sharded, options["threads"], options["votes"])
+        finally:
+            category.delete()
+
+    def run(self, question, sharded, threads, votes):
+        errors = []
+
+        def worker():
+            try:
+                for i in range(votes):
+                    try:
+                        counters.add_votes(question, int(i % 2 == 0), int(i % 2 == 1))
+                    except OperationalError as e:
+                        errors.append(e)
+            finally:
+                connections.close_all()
+
+        # Keep the single-row run from promoting itself halfway through
+        with override_settings(POLLS_SHARD_PROMOTE_WRITES_PER_SECOND=0):
+            started = time.perf_counter()
+            pool = [threading.Thread(target=worker) for _ in range(threads)]
+            for thread in pool:
+                thread.start()
+            for thread in pool:
+                thread.join()
+            elapsed = time.perf_counter() - started
+
+        counters.fold(question.id)
+        votes_a, votes_b = counters.totals(question)
+        label = f"{question.counter_shards} shards" if sharded else "single row"
+        self.stdout.write(
+            f"{label}: {(threads * votes - len(errors)) / elapsed:,.0f} writes/s, "
+            f"{len(errors)} lock errors, counted {votes_a + votes_b} of {threads * votes}"
+        )
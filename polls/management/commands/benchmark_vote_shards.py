@@ -0,0 +1,135 @@
+import multiprocessing
+import time
+
+from django.core.management.base import BaseCommand, CommandError
+from django.db import OperationalError, connections, transaction
+from django.db.models import Count, Q
+from django.test.utils import override_settings
+
+from polls import counters, sharding, voting
+from polls.models import CounterShard, ThisOrThat, ThisOrThatCategory, Vote
+
+
+def _cast_votes(question_ids, votes, worker, start_at, commit_delay):
+    """
+    Run in a child process: ``votes`` new votes round the questions, as fast
+    as possible. Returns the latency of each vote in seconds (None for a lock
+    error).
+    """
+    using = sharding.db_for_category(ThisOrThat.objects.get(id=question_ids[0]).category_id)
+    latencies = []
+    time.sleep(max(0, start_at - time.time()))
+    for i in range(votes):
+        started = time.perf_counter()
+        try:
+            with transaction.atomic(using=using):
+                voting.apply_votes(
+                    {question_ids[i % len(question_ids)]: "AB"[i % 2]}, {"session_key": f"bench-{worker}-{i}"}
+                )
+                # Stands in for a slow disk flushing the commit, with the write lock held
+                time.sleep(commit_delay)
+        except OperationalError:
+            latencies.append(None)
+        else:
+            latencies.append(time.perf_counter() - started)
+    connections.close_all()
+    return latencies
+
+
+class Command(BaseCommand):
+    help = (
+        "Measure vote write throughput with one process per category, first "
+        "with every category in the default database and then with the "
+        "categories spread over 1, 2, ... of the databases in "
+        "POLLS_VOTE_SHARDS. Shards only add throughput while writers wait on "
+        "each other's locks, so it needs more than one CPU core or slow "
+        "storage (see --commit-delay). The benchmark categories are deleted afterwards."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("--processes", type=int, default=4, help="Writers, each voting in its own category")
+        parser.add_argument("--votes", type=int, default=300, help="Votes per process")
+        parser.add_argument("--questions", type=int, default=5, help="Questions per category")
+        parser.add_argument(
+            "--commit-delay", type=float, default=0,
+            help="Milliseconds each write transaction holds its lock on top of its own work, to model slow storage",
+        )
+
+    def handle(self, *args, **options):
+        shards = sharding.shard_aliases()
+        if not shards:
+            raise CommandError(
+                "No vote shards configured; set POLLS_VOTE_SHARD_FILES (or POLLS_VOTE_SHARDS) and "
+                "migrate each shard database first."
+            )
+        categories = [
+            ThisOrThatCategory.objects.create(name=f"Shard benchmark {i + 1}", is_active=False)
+            for i in range(options["processes"])
+        ]
+        questions = {
+            category.id: [
+                question.id for question in ThisOrThat.objects.bulk_create([
+                    ThisOrThat(category=category, option_a=f"A{i}", option_b=f"B{i}", is_active=False)
+                    for i in range(options["questions"])
+                ])
+            ]
+            for category in categories
+        }
+        try:
+            baseline = None
+            for used in range(len(shards) + 1):
+                databases = ["default", *shards[:used]]
+                placement = {category.id: databases[i % len(databases)] for i, category in enumerate(categories)}
+                # Benchmark votes are deleted again, so keep them out of the event log
+                with override_settings(
+                    POLLS_VOTE_SHARDS=shards[:used], POLLS_CATEGORY_SHARDS=placement, POLLS_VOTE_EVENT_LOG=False,
+                ):
+                    rate, latencies, errors = self.run(questions, options["votes"], options["commit_delay"] / 1000)
+                    self.check_counters(questions)
+                    self.clear(categories)
+                baseline = baseline or rate
+                self.stdout.write(
+                    f"{len(databases)} database(s): {rate:,.0f} votes/s ({rate / baseline:.1f}x), "
+                    f"p50={self.percentile(latencies, 50):.1f}ms p95={self.percentile(latencies, 95):.1f}ms "
+                    f"p99={self.percentile(latencies, 99):.1f}ms, {errors} lock errors"
+                )
+        finally:
+            question_ids = [question_id for ids in questions.values() for question_id in ids]
+            for alias in shards:
+                Vote.objects.using(alias).filter(this_or_that_id__in=question_ids).delete()
+                CounterShard.objects.using(alias).filter(this_or_that_id__in=question_ids).delete()
+            for category in categories:
+                category.delete()
+
+    def run(self, questions, votes, commit_delay):
+        # Children must not share the parent's database connections
+        connections.close_all()
+        start_at = time.time() + 0.5
+        context = multiprocessing.get_context("fork")
+        with context.Pool(len(questions)) as pool:
+            results = [
+                pool.apply_async(_cast_votes, (question_ids, votes, worker, start_at, commit_delay))
+                for worker, question_ids in enumerate(questions.values())
+            ]
+            samples = [latency for result in results for latency in result.get()]
+        elapsed = time.time() - start_at
+        latencies = sorted(latency * 1000 for latency in samples if latency is not None)
+        return len(latencies) / elapsed, latencies, len(samples) - len(latencies)
+
+    def percentile(self, ordered, percent):
+        return ordered[min(len(ordered) - 1, int(len(ordered) * percent / 100))] if ordered else 0
+
+    def check_counters(self, questions):
+        for category_id, question_ids in questions.items():
+            counted = counters.exact_totals(question_ids)
+            for row in sharding.category_votes(category_id).values("this_or_that_id").annotate(
+                a=Count("id", filter=Q(choice="A")), b=Count("id", filter=Q(choice="B"))
+            ):
+                if counted[row["this_or_that_id"]] != (row["a"], row["b"]):
+                    raise CommandError(f"Counters of question {row['this_or_that_id']} do not match its votes")
+
+    def clear(self, categories):
+        for category in categories:
+            voting.reset_votes(sharding.category_votes(category.id))
+        # Bring the question rows up to date before categories change databases
+        counters.fold_all()
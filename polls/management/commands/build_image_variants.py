@@ -0,0 +1,59 @@
+import os
+
+from django.contrib.staticfiles import finders
+from django.core.management.base import BaseCommand, CommandError
+
+try:
+    from PIL import Image, features
+except ImportError:
+    Image = None
+
+
+class Command(BaseCommand):
+    help = (
+        "Write WebP/AVIF variants next to every JPEG/PNG found by the static "
+        "file finders. Run before collectstatic; existing up-to-date variants "
+        "are left alone."
+    )
+
+    source_extensions = ('.jpg', '.jpeg', '.png')
+    # AVIF reaches WebP's visual quality at a much lower setting
+    default_quality = {"webp": 75, "avif": 50}
+
+    def add_arguments(self, parser):
+        parser.add_argument("--formats", nargs="+", default=["webp", "avif"], choices=["webp", "avif"])
+        parser.add_argument("--quality", type=int, help="Encoder quality (default: per format)")
+        parser.add_argument("--force", action="store_true", help="Rebuild variants even if up to date")
+
+    def handle(self, *args, **options):
+        if Image is None:
+            raise CommandError("Pillow is required to build image variants")
+        formats = [fmt for fmt in options["formats"] if features.check(fmt)]
+        for fmt in set(options["formats"]) - set(formats):
+            self.stderr.write(f"Skipping {fmt}: not supported by this Pillow build")
+
+        seen = set()
+        for finder in finders.get_finders():
+            for path, storage in finder.list(["CVS", ".*", "*~"]):
+                if not path.lower().endswith(self.source_extensions):
+                    continue
+                source = storage.path(path)
+                if source in seen:
+                    continue
+                seen.add(source)
+                for fmt in formats:
+                    quality = options["quality"] or self.default_quality[fmt]
+                    self.build_variant(source, fmt, quality, options["force"])
+
+    def build_variant(self, source, fmt, quality, force):
+        target = os.path.splitext(source)[0] + "." + fmt
+        if not force and os.path.exists(target) and os.path.getmtime(target) >= os.path.getmtime(source):
+            return
+        with Image.open(source) as image:
+            if image.mode not in ("RGB", "RGBA"):
+                image = image.convert("RGBA" if "transparency" in image.info else "RGB")
+            image.save(target, fmt.upper(), quality=quality)
+        before, after = os.path.getsize(source), os.path.getsize(target)
+        self.stdout.write(
+            f"{os.path.basename(target)}: {before // 1024} KiB -> {after // 1024} KiB"
+        )
@@ -0,0 +1,30 @@
+import csv
+
+from django.core.management.base import BaseCommand
+
+from polls import archive, sharding
+from polls.models import Vote
+
+
+class Command(BaseCommand):
+    help = "Write every vote, archived ones included, as CSV"
+
+    def add_arguments(self, parser):
+        parser.add_argument("--output", help="File to write (default: stdout)")
+        parser.add_argument("--no-archive", action="store_true", help="Only export the live Vote table")
+
+    def handle(self, *args, **options):
+        handle = open(options["output"], "w", newline="") if options["output"] else self.stdout
+        try:
+            writer = csv.writer(handle)
+            writer.writerow(archive.ARCHIVE_FIELDS + ("archived",))
+            if not options["no_archive"]:
+                for row in archive.iter_archived_votes():
+                    writer.writerow([row[field] for field in archive.ARCHIVE_FIELDS] + [1])
+            for votes in sharding.vote_querysets(Vote.objects.order_by("id")):
+                for row in archive.vote_rows(votes):
+                    row["timestamp"] = row["timestamp"].isoformat()
+                    writer.writerow([row[field] for field in archive.ARCHIVE_FIELDS] + [0])
+        finally:
+            if handle is not self.stdout:
+                handle.close()
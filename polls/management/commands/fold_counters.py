@@ -0,0 +1,11 @@
+from django.core.management.base import BaseCommand
+
+from polls import counters
+
+
+class Command(BaseCommand):
+    help = "Fold pending sharded vote counts into their questions (run from cron)"
+
+    def handle(self, *args, **options):
+        folded = counters.fold_all()
+        self.stdout.write(f"Folded pending counts for {folded} question(s)")
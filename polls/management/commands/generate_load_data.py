@@ -0,0 +1,173 @@
+import multiprocessing
+import random
+import time
+from collections import defaultdict
+from datetime import datetime, time as dt_time, timezone as dt_timezone
+from functools import partial
+
+from django.contrib.auth.models import User
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connections, transaction
+from django.db.models import Count, Q
+
+from polls import counters, loadgen, search, sharding, useragents
+from polls.models import ThisOrThat, ThisOrThatCategory, Vote
+
+
+class Command(BaseCommand):
+    # Column order of the tuples produced by loadgen.generate_chunk
+    vote_fields = ("this_or_that", "category", "user", "session_key", "choice", "timestamp", "agent", "ip_address")
+    help = (
+        "Create synthetic categories, questions, users and votes for load "
+        "testing. Output is fully determined by --seed, the sizes and --end. "
+        "Categories are created inactive, out of the public pages, unless --active is given."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("--seed", type=int, default=1)
+        parser.add_argument("--categories", type=int, default=10)
+        parser.add_argument("--questions", type=int, default=50, help="Questions per category")
+        parser.add_argument("--users", type=int, default=1000, help="Registered voters")
+        parser.add_argument("--sessions", type=int, default=20000, help="Anonymous voters")
+        parser.add_argument("--votes", type=int, default=200000, help="Approximate number of votes")
+        parser.add_argument("--revote-rate", type=float, default=0.05)
+        parser.add_argument("--days", type=int, default=90, help="Spread votes over this many days")
+        parser.add_argument("--end", help="Last day of votes, YYYY-MM-DD (default: today, UTC)")
+        parser.add_argument("--prefix", default="load", help="Prefix for generated names")
+        parser.add_argument("--batch-size", type=int, default=10000)
+        parser.add_argument("--workers", type=int, default=1, help="Processes generating rows")
+        parser.add_argument(
+            "--active", action="store_true", help="Show the generated categories on the public pages"
+        )
+
+    def handle(self, *args, **options):
+        if options["categories"] < 1 or options["questions"] < 1:
+            raise CommandError("Need at least one category and one question")
+        voters = options["users"] + options["sessions"]
+        if voters < 1:
+            raise CommandError("Need at least one user or session")
+        rng = random.Random(options["seed"])
+        prefix = f"{options['prefix']}{options['seed']}"
+        # Usernames are unique; a rerun would fail halfway through with an IntegrityError
+        if (
+            ThisOrThatCategory.objects.filter(name__startswith=f"{prefix} ").exists()
+            or User.objects.filter(username__startswith=f"{prefix}u").exists()
+        ):
+            raise CommandError(f"Load data for {prefix} already exists; pick another --seed or --prefix")
+
+        started = time.perf_counter()
+        questions = self.create_questions(
+            rng, prefix, options["categories"], options["questions"], options["active"]
+        )
+        user_ids = self.create_users(prefix, options["users"])
+        agents = [
+            (weight, useragents.agent_id(string)) for weight, string in loadgen.USER_AGENTS
+        ]
+        # Popularity rank is random, so it is not tied to creation order
+        rng.shuffle(questions)
+        plan = loadgen.Plan(
+            seed=options["seed"],
+            question_ids=[question.id for question in questions],
+            category_ids=[question.category_id for question in questions],
+            p_a=[rng.betavariate(2, 2) for _ in questions],
+            cum_weights=loadgen.zipf_cum_weights(len(questions)),
+            user_ids=user_ids,
+            sessions=options["sessions"],
+            agent_ids=[agent_id for _, agent_id in agents],
+            agent_cum_weights=[sum(weight for weight, _ in agents[:i + 1]) for i in range(len(agents))],
+            votes_per_voter=options["votes"] / voters,
+            revote_rate=options["revote_rate"],
+            days=max(options["days"], 1),
+            end=self.end_of(options["end"]),
+            session_prefix=f"{prefix}s",
+        )
+        self.stdout.write(f"Created {len(questions)} questions and {len(user_ids)} users")
+
+        inserted = self.insert_votes(plan, options["workers"], options["batch_size"])
+        elapsed = time.perf_counter() - started
+        self.stdout.write(
+            f"Inserted {inserted} votes in {elapsed:.1f}s ({inserted / elapsed * 60:,.0f} votes/minute)"
+        )
+        self.update_counters(plan)
+
+    def end_of(self, day):
+        if not day:
+            return datetime.now(dt_timezone.utc)
+        try:
+            date = datetime.strptime(day, "%Y-%m-%d").date()
+        except ValueError:
+            raise CommandError("--end must be YYYY-MM-DD")
+        return datetime.combine(date, dt_time.max, tzinfo=dt_timezone.utc)
+
+    def create_questions(self, rng, prefix, categories, per_category, active):
+        created = ThisOrThatCategory.objects.bulk_create([
+            ThisOrThatCategory(name=f"{prefix} category {i}", description="Generated load test data", is_active=active)
+            for i in range(categories)
+        ])
+        questions = ThisOrThat.objects.bulk_create([
+            ThisOrThat(category=category, option_a=f"{prefix} A{i}", option_b=f"{prefix} B{i}")
+            for category in created
+            for i in range(per_category)
+        ], batch_size=5000)
+        # bulk_create skips the signals that keep the search index current
+        search.index_questions([question.id for question in questions])
+        return questions
+
+    def create_users(self, prefix, count):
+        # "!" is an unusable password; hashing thousands of real ones would dominate the run
+        users = User.objects.bulk_create(
+            [User(username=f"{prefix}u{i}", password="!") for i in range(count)], batch_size=5000
+        )
+        return [user.id for user in users]
+
+    def insert_votes(self, plan, workers, batch_size):
+        chunks = range(loadgen.chunk_count(plan))
+        generate = partial(loadgen.generate_chunk, plan)
+        inserted = 0
+        if workers > 1:
+            with multiprocessing.Pool(workers) as pool:
+                # imap keeps chunk order, so the inserted rows do not depend on scheduling
+                for rows in pool.imap(generate, chunks):
+                    inserted += self.insert_chunk(rows, batch_size)
+        else:
+            for rows in map(generate, chunks):
+                inserted += self.insert_chunk(rows, batch_size)
+        return inserted
+
+    def insert_chunk(self, rows, batch_size):
+        """
+        Insert generated rows with executemany. bulk_create builds and
+        prepares a model instance per row, which caps out well below a
+        million rows a minute; the rows here are already plain column values.
+        Each row goes to its category's vote database.
+        """
+        by_database = defaultdict(list)
+        for row in rows:
+            by_database[sharding.db_for_category(row[1])].append(row)
+        columns = [Vote._meta.get_field(name).column for name in self.vote_fields]
+        for alias, alias_rows in by_database.items():
+            connection = connections[alias]
+            quote = connection.ops.quote_name
+            sql = "INSERT INTO {} ({}) VALUES ({})".format(
+                quote(Vote._meta.db_table), ", ".join(map(quote, columns)), ", ".join(["%s"] * len(columns))
+            )
+            adapt = connection.ops.adapt_datetimefield_value
+            with transaction.atomic(using=alias), connection.cursor() as cursor:
+                for start in range(0, len(alias_rows), batch_size):
+                    cursor.executemany(sql, [
+                        row[:5] + (adapt(row[5]),) + row[6:] for row in alias_rows[start:start + batch_size]
+                    ])
+        return len(rows)
+
+    def update_counters(self, plan):
+        """
+        Set the counters of the generated questions from their votes, through
+        counters.set_totals so questions in vote shards get them there too
+        """
+        votes = Vote.objects.filter(category_id__in=set(plan.category_ids)).values("this_or_that_id").annotate(
+            votes_a=Count("id", filter=Q(choice="A")), votes_b=Count("id", filter=Q(choice="B"))
+        )
+        totals = dict.fromkeys(plan.question_ids, (0, 0))
+        for queryset in sharding.vote_querysets(votes):
+            totals.update((row["this_or_that_id"], (row["votes_a"], row["votes_b"])) for row in queryset)
+        counters.set_totals(totals)
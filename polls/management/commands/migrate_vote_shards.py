@@ -0,0 +1,74 @@
+from collections import defaultdict
+
+from django.core.management.base import BaseCommand, CommandError
+from django.db import DEFAULT_DB_ALIAS, connections
+
+from polls import counters, sharding
+from polls.models import CounterShard, ThisOrThat, ThisOrThatCategory, Vote
+
+
+class Command(BaseCommand):
+    help = (
+        "Move the votes and counters of every category into the vote database "
+        "that POLLS_VOTE_SHARDS and POLLS_CATEGORY_SHARDS now give it. Run it "
+        "with the app stopped after changing either setting: votes cast while "
+        "their category is being moved can be lost. Safe to run again."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--source", action="append", default=[],
+            help="Also drain this database alias, e.g. a shard being removed from POLLS_VOTE_SHARDS",
+        )
+        parser.add_argument("--batch-size", type=int, default=1000, help="Votes moved per transaction")
+        parser.add_argument("--dry-run", action="store_true", help="Report what would move without writing")
+
+    def handle(self, *args, **options):
+        sources = list(dict.fromkeys(sharding.vote_databases() + options["source"]))
+        unknown = [alias for alias in sources if alias not in connections]
+        if unknown:
+            raise CommandError(f"Unknown database(s): {', '.join(unknown)}")
+
+        # Counters of questions in a shard live there as running-total rows;
+        # everything else is counted on the question row in the default database
+        counter_homes = {}
+        for alias in sources:
+            if alias != DEFAULT_DB_ALIAS:
+                for question_id in CounterShard.objects.using(alias).values_list("this_or_that_id", flat=True).distinct():
+                    counter_homes[question_id] = alias
+        questions = defaultdict(list)
+        for question_id, category_id in ThisOrThat.objects.values_list("id", "category_id"):
+            questions[category_id].append(question_id)
+
+        moved_votes = moved_counters = 0
+        for category_id, name in ThisOrThatCategory.objects.order_by("id").values_list("id", "name"):
+            target = sharding.db_for_category(category_id)
+            for source in sources:
+                if source == target:
+                    continue
+                votes = Vote.objects.using(source).filter(category_id=category_id)
+                count = votes.count()
+                if not count:
+                    continue
+                self.stdout.write(f"  {name} (#{category_id}): {count} vote(s) {source} -> {target}")
+                if not options["dry_run"]:
+                    sharding.move_votes(votes, target, options["batch_size"])
+                moved_votes += count
+            by_home = defaultdict(list)
+            for question_id in questions[category_id]:
+                by_home[counter_homes.get(question_id, DEFAULT_DB_ALIAS)].append(question_id)
+            for home, question_ids in by_home.items():
+                if home == target:
+                    continue
+                self.stdout.write(
+                    f"  {name} (#{category_id}): counters of {len(question_ids)} question(s) {home} -> {target}"
+                )
+                if not options["dry_run"]:
+                    counters.relocate(question_ids, home)
+                moved_counters += len(question_ids)
+
+        verb = "Would move" if options["dry_run"] else "Moved"
+        self.stdout.write(
+            f"{verb} {moved_votes} vote(s) and the counters of {moved_counters} question(s) "
+            f"across {len(sources)} database(s)"
+        )
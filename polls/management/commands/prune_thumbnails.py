@@ -0,0 +1,14 @@
+from django.core.management.base import BaseCommand
+
+from polls import thumbnails
+
+
+class Command(BaseCommand):
+    help = (
+        "Remove the least recently served option image thumbnails until the "
+        "cache fits in POLLS_THUMBNAIL_CACHE_MAX_BYTES (run from cron)"
+    )
+
+    def handle(self, *args, **options):
+        removed, size = thumbnails.evict()
+        self.stdout.write(f"Removed {removed} thumbnail(s); {size} bytes left in {thumbnails.cache_dir()}")
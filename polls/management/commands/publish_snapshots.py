@@ -0,0 +1,30 @@
+import time
+
+from django.core.management.base import BaseCommand, CommandError
+
+from polls import snapshots
+
+
+class Command(BaseCommand):
+    help = (
+        "Write pre-rendered HTML of the public pages (This or That home, quiz "
+        "summaries, classic results) to POLLS_SNAPSHOT_DIR for the web server "
+        "to serve. Only pages that changed since the last run are rendered; "
+        "run it from cron every minute or so."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("--force", action="store_true", help="Render every page, changed or not")
+
+    def handle(self, *args, **options):
+        started = time.perf_counter()
+        try:
+            written, unchanged, removed = snapshots.publish(force=options["force"])
+        except snapshots.SnapshotError as e:
+            raise CommandError(str(e))
+        for url_path in written:
+            self.stdout.write(f"  wrote {url_path}")
+        self.stdout.write(self.style.SUCCESS(
+            f"Published {len(written)} page(s), {len(unchanged)} unchanged, {len(removed)} removed "
+            f"in {(time.perf_counter() - started) * 1000:.0f}ms"
+        ))
@@ -0,0 +1,14 @@
+from django.core.management.base import BaseCommand
+
+from polls import search
+
+
+class Command(BaseCommand):
+    help = (
+        "Rebuild the question full-text search index from the tables (SQLite; "
+        "run after bulk imports, which bypass the signals that keep it current)"
+    )
+
+    def handle(self, *args, **options):
+        indexed = search.rebuild_index()
+        self.stdout.write(f"Indexed {indexed} question(s)")
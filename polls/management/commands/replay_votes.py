@@ -0,0 +1,79 @@
+import time
+from pathlib import Path
+
+from django.core.management.base import BaseCommand, CommandError
+
+from polls import counters, eventlog, sharding
+from polls.models import ThisOrThat, Vote
+
+# Ids per IN (...) list
+CHUNK = 500
+
+
+class Command(BaseCommand):
+    help = (
+        "Compare question vote counters with the append-only vote event log, "
+        "and with --apply rebuild them from it. Only questions that appear in "
+        "the log are considered, and of those only the ones the log covers: "
+        "questions created before its first segment, or with votes older than "
+        "it (e.g. from generate_load_data), are skipped."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("--dir", help="Log directory (default: POLLS_VOTE_EVENT_DIR)")
+        parser.add_argument("--since", help="Skip segments named before this, e.g. events-20260101")
+        parser.add_argument("--apply", action="store_true", help="Write the rebuilt counters (default: only report)")
+
+    def handle(self, *args, **options):
+        root = Path(options["dir"]) if options["dir"] else eventlog.log_dir()
+        if not root.is_dir():
+            raise CommandError(f"No event log at {root}")
+        # Whatever this process still buffers belongs in the replay
+        eventlog.event_log.flush()
+        paths = eventlog.segments(root, options["since"])
+        if not paths:
+            raise CommandError(f"No event log segments in {root}")
+
+        started = time.perf_counter()
+        result = eventlog.replay(root, options["since"])
+        elapsed = time.perf_counter() - started
+        kinds = ", ".join(f"{count} {kind}" for kind, count in sorted(result.kinds.items()))
+        self.stdout.write(
+            f"Replayed {result.events} event(s) ({kinds or 'none'}) from "
+            f"{len(paths)} segment(s) in {elapsed:.2f}s "
+            f"({result.events / max(elapsed, 1e-9):,.0f} events/s)"
+        )
+
+        rebuilt = {question_id: tuple(totals) for question_id, totals in result.questions.items()}
+        uncovered = self.uncovered(list(rebuilt), eventlog.segment_start(paths[0]))
+        if uncovered:
+            self.stdout.write(
+                f"Skipped {len(uncovered)} question(s) with history from before {paths[0].name}"
+            )
+        current = counters.exact_totals(question_id for question_id in rebuilt if question_id not in uncovered)
+        changed = {
+            question_id: rebuilt[question_id]
+            for question_id, totals in current.items() if totals != rebuilt[question_id]
+        }
+        for question_id, (votes_a, votes_b) in sorted(changed.items()):
+            old_a, old_b = current[question_id]
+            self.stdout.write(f"  question {question_id}: {old_a}/{old_b} -> {votes_a}/{votes_b}")
+        missing = len(rebuilt) - len(uncovered) - len(current)
+        if missing:
+            self.stdout.write(f"Skipped {missing} question(s) that no longer exist")
+
+        if not options["apply"]:
+            self.stdout.write(f"{len(changed)} counter(s) differ from the log (run with --apply to rebuild them)")
+            return
+        counters.set_totals(changed)
+        self.stdout.write(f"Rebuilt {len(changed)} counter(s); {len(current) - len(changed)} already matched")
+
+    def uncovered(self, question_ids, start):
+        """Ids of ``question_ids`` created before ``start`` or with a vote timestamped before it"""
+        found = set()
+        for i in range(0, len(question_ids), CHUNK):
+            chunk = question_ids[i:i + CHUNK]
+            found.update(ThisOrThat.objects.filter(id__in=chunk, created_at__lt=start).values_list("id", flat=True))
+            for votes in sharding.vote_querysets(Vote.objects.filter(this_or_that_id__in=chunk, timestamp__lt=start)):
+                found.update(votes.values_list("this_or_that_id", flat=True).distinct())
+        return found
@@ -0,0 +1,218 @@
+import http.cookiejar
+import json
+import random
+import threading
+import time
+import urllib.error
+import urllib.request
+from collections import defaultdict
+
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connections
+from django.db.models import Count, Q
+from django.test import Client
+from django.test.utils import override_settings
+from django.urls import reverse
+
+from polls import counters, ratelimit, sharding
+from polls.models import ThisOrThat, ThisOrThatCategory
+
+
+class WsgiVoter:
+    """One voter talking to the WSGI app in this process"""
+
+    def __init__(self, base_url=None):
+        # Server errors come back as 500 responses, like they would over HTTP
+        self.client = Client(raise_request_exception=False)
+
+    def vote(self, question_id, choice, category_id):
+        response = self.client.post(
+            reverse("polls:vote_this_or_that", args=(question_id,)),
+            data=json.dumps({"choice": choice}), content_type="application/json",
+        )
+        return response.status_code, response.content
+
+    def reset(self, category_id):
+        response = self.client.get(reverse("polls:this_or_that", args=(category_id,)), {"reset": 1})
+        return response.status_code, response.content
+
+
+class HttpVoter:
+    """One voter talking to a running server, with its own cookies and CSRF token"""
+
+    def __init__(self, base_url):
+        self.base_url = base_url.rstrip("/")
+        self.cookies = http.cookiejar.CookieJar()
+        self.opener = urllib.request.build_opener(urllib.request.HTTPCookieProcessor(self.cookies))
+
+    def request(self, path, data=None, headers=None):
+        request = urllib.request.Request(self.base_url + path, data=data, headers=headers or {})
+        try:
+            with self.opener.open(request, timeout=30) as response:
+                return response.status, response.read()
+        except urllib.error.HTTPError as e:
+            return e.code, e.read()
+        except OSError as e:
+            return 0, str(e).encode()
+
+    def csrf_token(self, category_id):
+        for cookie in self.cookies:
+            if cookie.name == "csrftoken":
+                return cookie.value
+        # The game page sets the CSRF cookie
+        self.request(reverse("polls:this_or_that", args=(category_id,)))
+        return next((cookie.value for cookie in self.cookies if cookie.name == "csrftoken"), "")
+
+    def vote(self, question_id, choice, category_id):
+        return self.request(
+            reverse("polls:vote_this_or_that", args=(question_id,)),
+            data=json.dumps({"choice": choice}).encode(),
+            headers={
+                "Content-Type": "application/json",
+                "X-CSRFToken": self.csrf_token(category_id),
+                "Referer": self.base_url + "/",
+            },
+        )
+
+    def reset(self, category_id):
+        return self.request(reverse("polls:this_or_that", args=(category_id,)) + "?reset=1")
+
+
+class Command(BaseCommand):
+    help = (
+        "Hammer the vote endpoint with concurrent voters mixing new votes, "
+        "revotes and resets, report throughput, latency and errors, then "
+        "check that question counters match the Vote rows. Exits non-zero on "
+        "any mismatch, so it can gate changes to the write path. With "
+        "--categories, voters are spread over several categories, which vote "
+        "shards can place in separate database files."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("--threads", type=int, default=8)
+        parser.add_argument("--ops", type=int, default=200, help="Requests per thread")
+        parser.add_argument("--questions", type=int, default=5, help="Questions per category")
+        parser.add_argument("--categories", type=int, default=1, help="Voters are split evenly between these")
+        parser.add_argument("--reset-rate", type=float, default=0.05, help="Share of requests that reset")
+        parser.add_argument("--seed", type=int, default=1)
+        parser.add_argument("--url", help="Base URL of a running server (default: the WSGI app in-process)")
+        parser.add_argument("--keep", action="store_true", help="Keep the stress category afterwards")
+
+    def handle(self, *args, **options):
+        categories = [
+            ThisOrThatCategory.objects.create(name=f"Stress test {i + 1}") for i in range(options["categories"])
+        ]
+        questions = ThisOrThat.objects.bulk_create([
+            ThisOrThat(category=category, option_a=f"A{i}", option_b=f"B{i}")
+            for category in categories for i in range(options["questions"])
+        ])
+        databases = sorted({sharding.db_for_category(category.id) for category in categories})
+        self.stdout.write(f"{len(categories)} categor{'y' if len(categories) == 1 else 'ies'} in: {', '.join(databases)}")
+        try:
+            if options["url"]:
+                self.stderr.write("Note: the server's own rate limits apply; 429s are reported separately.")
+                results = self.run(HttpVoter, categories, questions, options)
+            else:
+                # The point is to load the write path, not the flood guard in front of it
+                unlimited = (1e9, 1e9)
+                with override_settings(
+                    POLLS_VOTE_RATE_PER_VOTER=unlimited, POLLS_VOTE_RATE_PER_IP=unlimited,
+                    # The test client sends Host: testserver
+                    ALLOWED_HOSTS=[*settings.ALLOWED_HOSTS, "testserver"],
+                ):
+                    ratelimit.reset()
+                    try:
+                        results = self.run(WsgiVoter, categories, questions, options)
+                    finally:
+                        ratelimit.reset()
+            self.report(*results)
+            self.verify(questions)
+        finally:
+            if not options["keep"]:
+                for category in categories:
+                    category.delete()
+
+    def run(self, voter_class, categories, questions, options):
+        samples = defaultdict(list)  # kind -> [(seconds, status, body)]
+        lock = threading.Lock()
+
+        def worker(index):
+            rng = random.Random(options["seed"] * 1000 + index)
+            category = categories[index % len(categories)]
+            question_ids = [question.id for question in questions if question.category_id == category.id]
+            voter = voter_class(options["url"])
+            voted = set()
+            local = defaultdict(list)
+            for _ in range(options["ops"]):
+                started = time.perf_counter()
+                if rng.random() < options["reset_rate"]:
+                    kind = "reset"
+                    status, body = voter.reset(category.id)
+                    voted.clear()
+                else:
+                    question_id = rng.choice(question_ids)
+                    kind = "revote" if question_id in voted else "vote"
+                    status, body = voter.vote(question_id, rng.choice("AB"), category.id)
+                    if status == 200:
+                        voted.add(question_id)
+                local[kind].append((time.perf_counter() - started, status, body))
+            for alias in sharding.vote_databases():
+                connections[alias].close()
+            with lock:
+                for kind, values in local.items():
+                    samples[kind].extend(values)
+
+        threads = [threading.Thread(target=worker, args=(i,)) for i in range(options["threads"])]
+        started = time.perf_counter()
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        return samples, time.perf_counter() - started
+
+    def report(self, samples, elapsed):
+        total = sum(len(values) for values in samples.values())
+        self.stdout.write(f"{total} requests in {elapsed:.2f}s ({total / elapsed:.0f} req/s)")
+        for kind in ("vote", "revote", "reset"):
+            values = samples.get(kind)
+            if not values:
+                continue
+            latencies = sorted(seconds * 1000 for seconds, _, _ in values)
+            ok = sum(1 for _, status, _ in values if status in (200, 302))
+            limited = sum(1 for _, status, _ in values if status == 429)
+            locked = sum(1 for _, status, body in values if status >= 500 and b"locked" in body)
+            other = len(values) - ok - limited - locked
+            self.stdout.write(
+                f"  {kind:<7} n={len(values):<6} p50={self.percentile(latencies, 50):.1f}ms "
+                f"p95={self.percentile(latencies, 95):.1f}ms p99={self.percentile(latencies, 99):.1f}ms "
+                f"lock errors={locked / len(values):.1%} rate limited={limited} other errors={other}"
+            )
+
+    def percentile(self, ordered, percent):
+        return ordered[min(len(ordered) - 1, int(len(ordered) * percent / 100))]
+
+    def verify(self, questions):
+        """Counters (after folding any shards) must equal the grouped Vote counts"""
+        for question in questions:
+            counters.fold(question.id)
+        expected = {}
+        for category_id in {question.category_id for question in questions}:
+            expected.update({
+                row["this_or_that_id"]: (row["a"], row["b"])
+                for row in sharding.category_votes(category_id).values("this_or_that_id").annotate(
+                    a=Count("id", filter=Q(choice="A")), b=Count("id", filter=Q(choice="B"))
+                )
+            })
+        mismatches = []
+        for question_id, votes_a, votes_b in ThisOrThat.objects.filter(
+            id__in=[question.id for question in questions]
+        ).values_list("id", "votes_a", "votes_b"):
+            if (votes_a, votes_b) != expected.get(question_id, (0, 0)):
+                mismatches.append(
+                    f"question {question_id}: counters {votes_a}/{votes_b}, "
+                    f"votes {expected.get(question_id, (0, 0))[0]}/{expected.get(question_id, (0, 0))[1]}"
+                )
+        if mismatches:
+            raise CommandError("Counters do not match votes:\n  " + "\n  ".join(mismatches))
+        self.stdout.write("Counters match the Vote table.")
@@ -0,0 +1,29 @@
+import time
+
+from django.core.management.base import BaseCommand
+
+from polls import funnels
+
+
+class Command(BaseCommand):
+    help = (
+        "Update the category completion funnels shown on the analytics "
+        "dashboard from the votes cast since the last run. Run it from cron "
+        "(e.g. every few minutes), one at a time."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("--batch-size", type=int, default=1000, help="Votes read per transaction")
+        parser.add_argument(
+            "--rebuild", action="store_true",
+            help="Start over from the votes still stored (archived votes are not counted again)",
+        )
+
+    def handle(self, *args, **options):
+        started = time.perf_counter()
+        if options["rebuild"]:
+            funnels.reset()
+        processed = funnels.update(options["batch_size"])
+        self.stdout.write(self.style.SUCCESS(
+            f"Processed {processed} vote(s) in {(time.perf_counter() - started) * 1000:.0f}ms"
+        ))
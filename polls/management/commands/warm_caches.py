@@ -0,0 +1,34 @@
+import time
+
+from django.core.management.base import BaseCommand
+
+from polls.ratelimit import shared_cache
+from polls.warmup import warm_caches
+
+
+class Command(BaseCommand):
+    help = (
+        "Precompute the category stats, per-category results and dashboard "
+        "data into the cache. Run at deploy time with a shared cache backend."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("--workers", type=int, default=4)
+
+    def handle(self, *args, **options):
+        if not shared_cache():
+            self.stderr.write(self.style.WARNING(
+                "The default cache is local to this process, so no server will see "
+                "what this warms; configure a shared CACHES backend, or set "
+                "POLLS_WARM_CACHES_ON_STARTUP so each server warms its own."
+            ))
+        started = time.perf_counter()
+        results = warm_caches(options["workers"])
+        for label, ms, error in results:
+            if error:
+                self.stderr.write(self.style.ERROR(f"{label}: failed after {ms:.0f}ms ({error})"))
+            else:
+                self.stdout.write(f"{label}: {ms:.0f}ms")
+        self.stdout.write(self.style.SUCCESS(
+            f"Warmed {len(results)} item(s) in {(time.perf_counter() - started) * 1000:.0f}ms"
+        ))
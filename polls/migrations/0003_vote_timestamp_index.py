@@ -0,0 +1,18 @@
+# Generated by Django 5.2.5 on 2026-10-19 08:06
+
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+    dependencies = [
+        ("polls", "0002_thisorthatcategory_thisorthat_vote"),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name="vote",
+            index=models.Index(fields=["timestamp"], name="polls_vote_timestamp_idx"),
+        ),
+    ]
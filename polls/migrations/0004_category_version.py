@@ -0,0 +1,26 @@
+# Generated by Django 5.2.5 on 2026-10-19 09:12
+
+import django.utils.timezone
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+    dependencies = [
+        ("polls", "0003_vote_timestamp_index"),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name="thisorthatcategory",
+            name="version",
+            field=models.PositiveIntegerField(default=0, editable=False),
+        ),
+        migrations.AddField(
+            model_name="thisorthatcategory",
+            name="updated_at",
+            field=models.DateTimeField(
+                auto_now=True, default=django.utils.timezone.now
+            ),
+            preserve_default=False,
+        ),
+    ]
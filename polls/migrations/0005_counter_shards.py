@@ -0,0 +1,31 @@
+# Generated by Django 5.2.5 on 2026-10-19 08:15
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+    dependencies = [
+        ("polls", "0004_category_version"),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name="thisorthat",
+            name="counter_shards",
+            field=models.PositiveSmallIntegerField(default=0, editable=False),
+        ),
+        migrations.CreateModel(
+            name="CounterShard",
+            fields=[
+                ("id", models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name="ID")),
+                ("shard", models.PositiveSmallIntegerField()),
+                ("votes_a", models.IntegerField(default=0)),
+                ("votes_b", models.IntegerField(default=0)),
+                ("this_or_that", models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name="counter_shard_set", to="polls.thisorthat")),
+            ],
+            options={
+                "unique_together": {("this_or_that", "shard")},
+            },
+        ),
+    ]
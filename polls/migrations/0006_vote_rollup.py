@@ -0,0 +1,27 @@
+# Generated by Django 5.2.5 on 2026-10-19 08:22
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+    dependencies = [
+        ("polls", "0005_counter_shards"),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name="VoteRollup",
+            fields=[
+                ("id", models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name="ID")),
+                ("hour", models.DateTimeField()),
+                ("votes_a", models.PositiveIntegerField(default=0)),
+                ("votes_b", models.PositiveIntegerField(default=0)),
+                ("this_or_that", models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, to="polls.thisorthat")),
+            ],
+            options={
+                "indexes": [models.Index(fields=["hour"], name="polls_rollup_hour_idx")],
+                "unique_together": {("this_or_that", "hour")},
+            },
+        ),
+    ]
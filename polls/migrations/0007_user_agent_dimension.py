@@ -0,0 +1,28 @@
+# Generated by Django 5.2.5 on 2026-10-19 08:24
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+    dependencies = [
+        ("polls", "0006_vote_rollup"),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name="UserAgent",
+            fields=[
+                ("id", models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name="ID")),
+                ("digest", models.CharField(max_length=40, unique=True)),
+                ("string", models.TextField()),
+                ("device", models.CharField(choices=[("desktop", "Desktop"), ("mobile", "Mobile"), ("tablet", "Tablet"), ("bot", "Bot")], max_length=10)),
+                ("browser", models.CharField(choices=[("chrome", "Chrome"), ("firefox", "Firefox"), ("safari", "Safari"), ("edge", "Edge"), ("opera", "Opera"), ("samsung", "Samsung Internet"), ("other", "Other")], max_length=10)),
+            ],
+        ),
+        migrations.AddField(
+            model_name="vote",
+            name="agent",
+            field=models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.PROTECT, to="polls.useragent"),
+        ),
+    ]
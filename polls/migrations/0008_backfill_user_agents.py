@@ -0,0 +1,89 @@
+import hashlib
+import re
+from collections import defaultdict
+
+from django.db import migrations, transaction
+
+BATCH_SIZE = 5000
+
+# A frozen copy of polls.useragents as of this migration, so later changes
+# to the live classifier do not change what this backfill does
+MAX_LENGTH = 1024
+
+_BOT = re.compile(r"bot|crawl|spider|slurp|curl|wget|python-requests|headless", re.I)
+_TABLET = re.compile(r"ipad|tablet|kindle|silk|playbook|android(?!.*mobile)", re.I)
+_MOBILE = re.compile(r"mobi|iphone|ipod|android|blackberry|opera mini|windows phone", re.I)
+_BROWSERS = [
+    (re.compile(r"edg(e|a|ios)?/", re.I), "edge"),
+    (re.compile(r"opr/|opera", re.I), "opera"),
+    (re.compile(r"samsungbrowser", re.I), "samsung"),
+    (re.compile(r"firefox|fxios", re.I), "firefox"),
+    (re.compile(r"chrome|crios|chromium", re.I), "chrome"),
+    (re.compile(r"safari", re.I), "safari"),
+]
+
+
+def digest(string):
+    return hashlib.sha1(string.encode()).hexdigest()
+
+
+def parse(string):
+    """(device, browser) classes for a user-agent string"""
+    if _BOT.search(string):
+        device = "bot"
+    elif _TABLET.search(string):
+        device = "tablet"
+    elif _MOBILE.search(string):
+        device = "mobile"
+    else:
+        device = "desktop"
+    browser = next((name for pattern, name in _BROWSERS if pattern.search(string)), "other")
+    return device, browser
+
+
+def backfill_agents(apps, schema_editor):
+    """Point every vote at its interned user agent, one committed batch at a time"""
+    UserAgent = apps.get_model("polls", "UserAgent")
+    Vote = apps.get_model("polls", "Vote")
+    agent_ids = {}
+    last_id = 0
+    while True:
+        with transaction.atomic():
+            rows = list(
+                Vote.objects.filter(id__gt=last_id).order_by("id").values_list("id", "user_agent")[:BATCH_SIZE]
+            )
+            if not rows:
+                return
+            groups = defaultdict(list)
+            for vote_id, string in rows:
+                if string:
+                    groups[string[:MAX_LENGTH]].append(vote_id)
+            for string, vote_ids in groups.items():
+                if string not in agent_ids:
+                    device, browser = parse(string)
+                    agent_ids[string] = UserAgent.objects.get_or_create(
+                        digest=digest(string),
+                        defaults={"string": string, "device": device, "browser": browser},
+                    )[0].id
+                Vote.objects.filter(id__in=vote_ids).update(agent_id=agent_ids[string])
+        last_id = rows[-1][0]
+
+
+def restore_strings(apps, schema_editor):
+    UserAgent = apps.get_model("polls", "UserAgent")
+    Vote = apps.get_model("polls", "Vote")
+    for agent_id, string in UserAgent.objects.values_list("id", "string").iterator():
+        Vote.objects.filter(agent_id=agent_id).update(user_agent=string)
+
+
+class Migration(migrations.Migration):
+    # Each batch commits on its own so a large table is not locked for the whole run
+    atomic = False
+
+    dependencies = [
+        ("polls", "0007_user_agent_dimension"),
+    ]
+
+    operations = [
+        migrations.RunPython(backfill_agents, restore_strings),
+    ]
@@ -0,0 +1,16 @@
+# Generated by Django 5.2.5 on 2026-10-19 08:25
+
+from django.db import migrations
+
+
+class Migration(migrations.Migration):
+    dependencies = [
+        ("polls", "0008_backfill_user_agents"),
+    ]
+
+    operations = [
+        migrations.RemoveField(
+            model_name="vote",
+            name="user_agent",
+        ),
+    ]
@@ -0,0 +1,37 @@
+# Generated by Django 5.2.5 on 2026-10-19 08:27
+
+import django.db.models.deletion
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+    dependencies = [
+        ("polls", "0009_remove_vote_user_agent"),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name="vote",
+            name="category",
+            field=models.ForeignKey(db_index=False, null=True, on_delete=django.db.models.deletion.CASCADE, to="polls.thisorthatcategory"),
+        ),
+        migrations.AddField(
+            model_name="voterollup",
+            name="category",
+            field=models.ForeignKey(null=True, on_delete=django.db.models.deletion.CASCADE, to="polls.thisorthatcategory"),
+        ),
+        migrations.AddIndex(
+            model_name="vote",
+            index=models.Index(fields=["category", "session_key"], name="polls_vote_cat_session_idx"),
+        ),
+        migrations.AddIndex(
+            model_name="vote",
+            index=models.Index(fields=["category", "user"], name="polls_vote_cat_user_idx"),
+        ),
+        migrations.AddIndex(
+            model_name="vote",
+            index=models.Index(fields=["category", "timestamp"], name="polls_vote_cat_ts_idx"),
+        ),
+    ]
@@ -0,0 +1,68 @@
+import logging
+from collections import defaultdict
+
+import django.db.models.deletion
+from django.db import migrations, models, transaction
+
+BATCH_SIZE = 5000
+
+logger = logging.getLogger(__name__)
+
+
+def backfill_categories(apps, schema_editor):
+    """Copy each question's category onto its votes and rollups, one committed batch at a time"""
+    ThisOrThat = apps.get_model("polls", "ThisOrThat")
+    Vote = apps.get_model("polls", "Vote")
+    VoteRollup = apps.get_model("polls", "VoteRollup")
+    categories = dict(ThisOrThat.objects.values_list("id", "category_id"))
+    orphans = 0
+    last_id = 0
+    while True:
+        with transaction.atomic():
+            rows = list(
+                Vote.objects.filter(id__gt=last_id).order_by("id").values_list("id", "this_or_that_id")[:BATCH_SIZE]
+            )
+            if not rows:
+                break
+            groups = defaultdict(list)
+            for vote_id, question_id in rows:
+                groups[categories.get(question_id)].append(vote_id)
+            # Votes of questions deleted without the ORM's cascade have no
+            # category to take, and the column becomes NOT NULL below
+            orphan_ids = groups.pop(None, [])
+            if orphan_ids:
+                orphans += Vote.objects.filter(id__in=orphan_ids).delete()[0]
+            for category_id, vote_ids in groups.items():
+                Vote.objects.filter(id__in=vote_ids).update(category_id=category_id)
+        last_id = rows[-1][0]
+    if orphans:
+        logger.warning("Deleted %d votes of questions that no longer exist", orphans)
+    # One UPDATE per category rather than per question; rollups of missing
+    # questions go the way of their votes
+    with transaction.atomic():
+        for category_id in set(categories.values()):
+            VoteRollup.objects.filter(this_or_that__category_id=category_id).update(category_id=category_id)
+        VoteRollup.objects.filter(category__isnull=True).delete()
+
+
+class Migration(migrations.Migration):
+    # Each batch commits on its own so a large table is not locked for the whole run
+    atomic = False
+
+    dependencies = [
+        ("polls", "0010_vote_category"),
+    ]
+
+    operations = [
+        migrations.RunPython(backfill_categories, migrations.RunPython.noop),
+        migrations.AlterField(
+            model_name="vote",
+            name="category",
+            field=models.ForeignKey(db_index=False, on_delete=django.db.models.deletion.CASCADE, to="polls.thisorthatcategory"),
+        ),
+        migrations.AlterField(
+            model_name="voterollup",
+            name="category",
+            field=models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, to="polls.thisorthatcategory"),
+        ),
+    ]
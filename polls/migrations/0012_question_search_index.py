@@ -0,0 +1,41 @@
+from django.db import migrations
+
+FTS_TABLE = "polls_question_fts"
+
+
+def create_search_index(apps, schema_editor):
+    vendor = schema_editor.connection.vendor
+    if vendor == "sqlite":
+        # Prefix indexes make the as-you-type "word*" queries index lookups
+        schema_editor.execute(
+            f"CREATE VIRTUAL TABLE {FTS_TABLE} USING fts5("
+            "option_a, option_b, category, tokenize = 'unicode61 remove_diacritics 2', prefix = '2 3')"
+        )
+        schema_editor.execute(
+            f"INSERT INTO {FTS_TABLE} (rowid, option_a, option_b, category) "
+            "SELECT q.id, q.option_a, q.option_b, c.name FROM polls_thisorthat q "
+            "JOIN polls_thisorthatcategory c ON c.id = q.category_id"
+        )
+    elif vendor == "postgresql":
+        schema_editor.execute(
+            "CREATE INDEX polls_thisorthat_search_idx ON polls_thisorthat "
+            "USING GIN (to_tsvector('english', option_a || ' ' || option_b))"
+        )
+
+
+def drop_search_index(apps, schema_editor):
+    vendor = schema_editor.connection.vendor
+    if vendor == "sqlite":
+        schema_editor.execute(f"DROP TABLE {FTS_TABLE}")
+    elif vendor == "postgresql":
+        schema_editor.execute("DROP INDEX polls_thisorthat_search_idx")
+
+
+class Migration(migrations.Migration):
+    dependencies = [
+        ("polls", "0011_backfill_vote_category"),
+    ]
+
+    operations = [
+        migrations.RunPython(create_search_index, drop_search_index),
+    ]
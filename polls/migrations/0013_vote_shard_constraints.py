@@ -0,0 +1,40 @@
+# Generated by Django 5.2.5 on 2026-10-19 09:07
+
+import django.db.models.deletion
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+    dependencies = [
+        ("polls", "0012_question_search_index"),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name="countershard",
+            name="this_or_that",
+            field=models.ForeignKey(db_constraint=False, on_delete=django.db.models.deletion.CASCADE, related_name="counter_shard_set", to="polls.thisorthat"),
+        ),
+        migrations.AlterField(
+            model_name="vote",
+            name="agent",
+            field=models.ForeignKey(blank=True, db_constraint=False, null=True, on_delete=django.db.models.deletion.PROTECT, to="polls.useragent"),
+        ),
+        migrations.AlterField(
+            model_name="vote",
+            name="category",
+            field=models.ForeignKey(db_constraint=False, db_index=False, on_delete=django.db.models.deletion.CASCADE, to="polls.thisorthatcategory"),
+        ),
+        migrations.AlterField(
+            model_name="vote",
+            name="this_or_that",
+            field=models.ForeignKey(db_constraint=False, on_delete=django.db.models.deletion.CASCADE, to="polls.thisorthat"),
+        ),
+        migrations.AlterField(
+            model_name="vote",
+            name="user",
+            field=models.ForeignKey(blank=True, db_constraint=False, null=True, on_delete=django.db.models.deletion.CASCADE, to=settings.AUTH_USER_MODEL),
+        ),
+    ]
@@ -0,0 +1,46 @@
+# Generated by Django 5.2.5 on 2026-10-19 09:26
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+    dependencies = [
+        ("polls", "0013_vote_shard_constraints"),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name="FunnelWatermark",
+            fields=[
+                ("id", models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name="ID")),
+                ("database", models.CharField(max_length=100, unique=True)),
+                ("last_vote_id", models.BigIntegerField(default=0)),
+            ],
+        ),
+        migrations.CreateModel(
+            name="FunnelProgress",
+            fields=[
+                ("id", models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name="ID")),
+                ("voter", models.CharField(max_length=60)),
+                ("answered", models.PositiveIntegerField(default=0)),
+                ("step", models.PositiveSmallIntegerField(default=0)),
+                ("category", models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, to="polls.thisorthatcategory")),
+            ],
+            options={
+                "unique_together": {("category", "voter")},
+            },
+        ),
+        migrations.CreateModel(
+            name="FunnelStep",
+            fields=[
+                ("id", models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name="ID")),
+                ("step", models.PositiveSmallIntegerField()),
+                ("voters", models.PositiveIntegerField(default=0)),
+                ("category", models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, to="polls.thisorthatcategory")),
+            ],
+            options={
+                "unique_together": {("category", "step")},
+            },
+        ),
+    ]
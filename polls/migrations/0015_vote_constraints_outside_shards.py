@@ -0,0 +1,52 @@
+import django.db.models.deletion
+from django.conf import settings
+from django.db import migrations, models
+
+
+class AlterFieldWhereTargetMigrates(migrations.AlterField):
+    """
+    AlterField applied only in databases that also hold the model the field
+    points at. The vote shard files have no question, category, user or
+    agent tables, so only their foreign keys go without constraints.
+    """
+
+    def database_forwards(self, app_label, schema_editor, from_state, to_state):
+        model = to_state.apps.get_model(app_label, self.model_name)
+        target = model._meta.get_field(self.name).related_model
+        if self.allow_migrate_model(schema_editor.connection.alias, target):
+            super().database_forwards(app_label, schema_editor, from_state, to_state)
+
+
+class Migration(migrations.Migration):
+    dependencies = [
+        ("polls", "0014_vote_funnels"),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    # The models keep db_constraint=False, so only the schema changes. One
+    # operation for all fields: SQLite rebuilds the whole table for each, from
+    # the state the previous ones left.
+    operations = [
+        migrations.SeparateDatabaseAndState(database_operations=[
+            AlterFieldWhereTargetMigrates(
+                model_name="countershard", name="this_or_that",
+                field=models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name="counter_shard_set", to="polls.thisorthat"),
+            ),
+            AlterFieldWhereTargetMigrates(
+                model_name="vote", name="agent",
+                field=models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.PROTECT, to="polls.useragent"),
+            ),
+            AlterFieldWhereTargetMigrates(
+                model_name="vote", name="category",
+                field=models.ForeignKey(db_index=False, on_delete=django.db.models.deletion.CASCADE, to="polls.thisorthatcategory"),
+            ),
+            AlterFieldWhereTargetMigrates(
+                model_name="vote", name="this_or_that",
+                field=models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, to="polls.thisorthat"),
+            ),
+            AlterFieldWhereTargetMigrates(
+                model_name="vote", name="user",
+                field=models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.CASCADE, to=settings.AUTH_USER_MODEL),
+            ),
+        ]),
+    ]
@@ -0,0 +1,25 @@
+from django.db import migrations
+
+
+def create_search_index(apps, schema_editor):
+    # SQLite's FTS5 table already holds the category names (0012)
+    if schema_editor.connection.vendor == "postgresql":
+        schema_editor.execute(
+            "CREATE INDEX polls_thisorthatcategory_search_idx ON polls_thisorthatcategory "
+            "USING GIN (to_tsvector('english', name))"
+        )
+
+
+def drop_search_index(apps, schema_editor):
+    if schema_editor.connection.vendor == "postgresql":
+        schema_editor.execute("DROP INDEX polls_thisorthatcategory_search_idx")
+
+
+class Migration(migrations.Migration):
+    dependencies = [
+        ("polls", "0015_vote_constraints_outside_shards"),
+    ]
+
+    operations = [
+        migrations.RunPython(create_search_index, drop_search_index),
+    ]
@@ -1,5 +1,6 @@
 import datetime
-from django.db import models
+from django.db import models, transaction
+from django.db.models import F
 from django.utils import timezone
 from django.contrib.auth.models import User
 
@@ -27,9 +28,24 @@ class ThisOrThatCategory(models.Model):
     is_active = models.BooleanField(default=True)
     created_at = models.DateTimeField(auto_now_add=True)
     
+    # Bumped whenever a question in the category changes, and by counter
+    # folds and bulk vote changes; single votes leave it alone and pages
+    # also key on the latest vote (see sharding.last_vote_times)
+    version = models.PositiveIntegerField(default=0, editable=False)
+    updated_at = models.DateTimeField(auto_now=True)
+    
     def __str__(self):
         return f"{self.icon} {self.name}"
     
+    @classmethod
+    def bump_version(cls, *category_ids):
+        cls.objects.filter(id__in=category_ids).update(
+            version=F('version') + 1, updated_at=timezone.now()
+        )
+        # Imported here: snapshots renders views, which import this module
+        from .snapshots import expire_categories
+        transaction.on_commit(lambda: expire_categories(category_ids))
+    
     class Meta:
         verbose_name_plural = "Categories"
 
@@ -50,6 +66,10 @@ class ThisOrThat(models.Model):
     is_active = models.BooleanField(default=True)
     featured = models.BooleanField(default=False)
     
+    # Number of CounterShard rows absorbing this question's vote writes;
+    # 0 means votes_a/votes_b are updated directly (see polls.counters)
+    counter_shards = models.PositiveSmallIntegerField(default=0, editable=False)
+    
     def __str__(self):
         return f"{self.option_a} vs {self.option_b}"
     
@@ -77,6 +97,72 @@ class ThisOrThat(models.Model):
             return 'B'
         return 'TIE'
 
+class CounterShard(models.Model):
+    # Pending vote deltas for a hot question, folded into its votes_a/votes_b.
+    # With vote shards these rows can live in another database file than the
+    # question, so the foreign key is declared without a database constraint;
+    # migration 0015 adds it back in the databases that hold questions
+    this_or_that = models.ForeignKey(
+        ThisOrThat, on_delete=models.CASCADE, related_name='counter_shard_set', db_constraint=False
+    )
+    shard = models.PositiveSmallIntegerField()
+    votes_a = models.IntegerField(default=0)
+    votes_b = models.IntegerField(default=0)
+    
+    class Meta:
+        unique_together = [('this_or_that', 'shard')]
+    
+    def __str__(self):
+        return f"Shard {self.shard} of {self.this_or_that}"
+
+class UserAgent(models.Model):
+    # One row per distinct User-Agent header, classified when first seen
+    DESKTOP, MOBILE, TABLET, BOT = 'desktop', 'mobile', 'tablet', 'bot'
+    CHROME, FIREFOX, SAFARI, EDGE, OPERA, SAMSUNG, OTHER = (
+        'chrome', 'firefox', 'safari', 'edge', 'opera', 'samsung', 'other'
+    )
+    DEVICE_CHOICES = [
+        (DESKTOP, 'Desktop'),
+        (MOBILE, 'Mobile'),
+        (TABLET, 'Tablet'),
+        (BOT, 'Bot'),
+    ]
+    BROWSER_CHOICES = [
+        (CHROME, 'Chrome'),
+        (FIREFOX, 'Firefox'),
+        (SAFARI, 'Safari'),
+        (EDGE, 'Edge'),
+        (OPERA, 'Opera'),
+        (SAMSUNG, 'Samsung Internet'),
+        (OTHER, 'Other'),
+    ]
+    
+    digest = models.CharField(max_length=40, unique=True)  # sha1 of string
+    string = models.TextField()
+    device = models.CharField(max_length=10, choices=DEVICE_CHOICES)
+    browser = models.CharField(max_length=10, choices=BROWSER_CHOICES)
+    
+    def __str__(self):
+        return self.string[:80]
+
+class VoteRollup(models.Model):
+    # Hourly totals of votes moved out of the Vote table by archive_votes
+    this_or_that = models.ForeignKey(ThisOrThat, on_delete=models.CASCADE)
+    # Copy of this_or_that.category_id, like Vote.category
+    category = models.ForeignKey(ThisOrThatCategory, on_delete=models.CASCADE)
+    hour = models.DateTimeField()  # Start of the UTC hour
+    votes_a = models.PositiveIntegerField(default=0)
+    votes_b = models.PositiveIntegerField(default=0)
+    
+    class Meta:
+        unique_together = [('this_or_that', 'hour')]
+        indexes = [
+            models.Index(fields=['hour'], name='polls_rollup_hour_idx'),
+        ]
+    
+    def __str__(self):
+        return f"{self.this_or_that} @ {self.hour:%Y-%m-%d %H:00}"
+
 class Vote(models.Model):
     # Track individual votes for analytics
     CHOICE_OPTIONS = [
@@ -84,20 +170,71 @@ class Vote(models.Model):
         ('B', 'Option B'),
     ]
     
-    this_or_that = models.ForeignKey(ThisOrThat, on_delete=models.CASCADE)
-    user = models.ForeignKey(User, on_delete=models.CASCADE, null=True, blank=True)
+    # Declared without database constraints: with vote shards (see
+    # sharding.py) a vote can live in another database file than the rows it
+    # points at. Migration 0015 adds them back where those rows are
+    this_or_that = models.ForeignKey(ThisOrThat, on_delete=models.CASCADE, db_constraint=False)
+    # Copy of this_or_that.category_id so category queries need no join; kept
+    # in sync by the ThisOrThat post_save signal. Indexed by the composites below
+    category = models.ForeignKey(ThisOrThatCategory, on_delete=models.CASCADE, db_index=False, db_constraint=False)
+    user = models.ForeignKey(User, on_delete=models.CASCADE, null=True, blank=True, db_constraint=False)
     session_key = models.CharField(max_length=40, null=True, blank=True)  # For anonymous users
     choice = models.CharField(max_length=1, choices=CHOICE_OPTIONS)
     
     # Analytics data
     timestamp = models.DateTimeField(auto_now_add=True)
-    user_agent = models.TextField(blank=True)  # Browser info
+    agent = models.ForeignKey(UserAgent, on_delete=models.PROTECT, null=True, blank=True, db_constraint=False)  # Browser info
     ip_address = models.GenericIPAddressField(null=True, blank=True)
     
     class Meta:
-        # Prevent duplicate votes from same user/session
-        pass 
+        # As created in migration 0002. A vote leaves user or session_key
+        # NULL and NULLs never collide, so this does not stop duplicates: the
+        # vote views update the voter's existing vote instead of adding one
+        unique_together = [('this_or_that', 'user', 'session_key')]
+        indexes = [
+            # Analytics charts filter on timestamp ranges
+            models.Index(fields=['timestamp'], name='polls_vote_timestamp_idx'),
+            # Per-voter progress, summary and reset within a category
+            models.Index(fields=['category', 'session_key'], name='polls_vote_cat_session_idx'),
+            models.Index(fields=['category', 'user'], name='polls_vote_cat_user_idx'),
+            # Category-filtered analytics windows
+            models.Index(fields=['category', 'timestamp'], name='polls_vote_cat_ts_idx'),
+        ]
     
     def __str__(self):
         identifier = self.user.username if self.user else f"Session {self.session_key[:8]}"
-        return f"{identifier} voted {self.choice} on {self.this_or_that}"
\ No newline at end of file
+        return f"{identifier} voted {self.choice} on {self.this_or_that}"
+    
+    def save(self, *args, **kwargs):
+        if self.category_id is None and self.this_or_that_id is not None:
+            self.category_id = self.this_or_that.category_id
+        super().save(*args, **kwargs)
+    
+    @property
+    def user_agent(self):
+        return self.agent.string if self.agent_id else ''
+
+class FunnelStep(models.Model):
+    # Voters who have answered at least `step` percent of a category's active
+    # questions (step 0: at least one). Maintained by funnels.update()
+    category = models.ForeignKey(ThisOrThatCategory, on_delete=models.CASCADE)
+    step = models.PositiveSmallIntegerField()
+    voters = models.PositiveIntegerField(default=0)
+    
+    class Meta:
+        unique_together = [('category', 'step')]
+
+class FunnelProgress(models.Model):
+    # How far one voter ("user:<id>" or "session:<key>") got in a category
+    category = models.ForeignKey(ThisOrThatCategory, on_delete=models.CASCADE)
+    voter = models.CharField(max_length=60)
+    answered = models.PositiveIntegerField(default=0)
+    step = models.PositiveSmallIntegerField(default=0)  # Highest FunnelStep reached
+    
+    class Meta:
+        unique_together = [('category', 'voter')]
+
+class FunnelWatermark(models.Model):
+    # Highest vote id funnels.update() has processed, per vote database
+    database = models.CharField(max_length=100, unique=True)
+    last_vote_id = models.BigIntegerField(default=0)
@@ -0,0 +1,147 @@
+"""
+Flood protection for the vote endpoint.
+
+The token buckets live in worker memory and are bounded LRU maps, so
+checking them costs microseconds and never touches the database or the
+session store. Each worker enforces its own limits.
+
+The last vote of each voter on each question is kept in the cache instead,
+so a repeat is answered the same way whichever worker gets it, and a reset
+of votes in one worker stops every worker from answering from it. That only
+holds for a cache every worker shares, so with the local-memory (default)
+or dummy backend repeats are not collapsed at all.
+"""
+import threading
+import time
+from collections import OrderedDict
+
+from django.conf import settings
+from django.core.cache import cache, caches
+from django.core.cache.backends.dummy import DummyCache
+from django.core.cache.backends.locmem import LocMemCache
+
+
+class TokenBucketLimiter:
+    """Token buckets refilled at ``rate`` per second up to ``burst``, one per key"""
+
+    def __init__(self, rate, burst, max_keys=10000):
+        self.rate = rate
+        self.burst = burst
+        self.max_keys = max_keys
+        self._buckets = OrderedDict()
+        self._lock = threading.Lock()
+
+    def consume(self, key, now=None, count=1):
+        """
+        Take ``count`` tokens for ``key``; returns 0 if allowed, else seconds
+        until one is available. One token is enough to be let through: the
+        rest is taken as debt that later requests wait off, so a batch larger
+        than the burst is possible but costs as much as its votes one by one.
+        """
+        now = time.monotonic() if now is None else now
+        with self._lock:
+            tokens, last = self._buckets.pop(key, (self.burst, now))
+            tokens = min(self.burst, tokens + (now - last) * self.rate)
+            if tokens >= 1:
+                tokens -= count
+                retry_after = 0
+            else:
+                retry_after = (1 - tokens) / self.rate
+            self._buckets[key] = (tokens, now)
+            if len(self._buckets) > self.max_keys:
+                self._buckets.popitem(last=False)
+            return retry_after
+
+
+class RecentVotes:
+    """
+    Last (choice, response) per (voter, question) for ``ttl`` seconds, in
+    the shared cache; a ``ttl`` of 0 turns the collapse off. Voters are
+    eventlog.voter_label() strings, so a user's votes from all their
+    sessions share entries. Entries are stored under the reset generation read
+    before their votes were written, and clear() moves the generation on,
+    so votes removed by a reset can no longer be answered from here.
+    """
+
+    GENERATION_KEY = 'polls:recent-votes:generation'
+
+    def __init__(self, ttl):
+        self.ttl = ttl
+
+    def _key(self, voter, question_id):
+        return f'polls:recent-vote:{voter}:{question_id}'
+
+    def get(self, voter, question_id):
+        """
+        ((choice, response) or None, generation) for ``voter``'s last vote on
+        ``question_id``, with one cache round trip. Pass the generation on to
+        remember() once the new vote is written.
+        """
+        if not self.ttl:
+            return None, 0
+        keys = [self.GENERATION_KEY] + ([self._key(voter, question_id)] if voter else [])
+        found = cache.get_many(keys)
+        generation = found.get(self.GENERATION_KEY, 0)
+        entry = found.get(keys[-1]) if voter else None
+        if entry is None or entry[0] != generation:
+            return None, generation
+        return entry[1], generation
+
+    def generation(self):
+        return cache.get(self.GENERATION_KEY, 0) if self.ttl else 0
+
+    def remember(self, voter, entries, generation):
+        """Store ``{question_id: (choice, response)}`` for ``voter``"""
+        if not self.ttl or not voter:
+            return
+        cache.set_many(
+            {self._key(voter, question_id): (generation, entry) for question_id, entry in entries.items()},
+            self.ttl,
+        )
+
+    def clear(self):
+        """Stop answering from any entry stored so far, in every worker"""
+        cache.add(self.GENERATION_KEY, 0, None)
+        try:
+            cache.incr(self.GENERATION_KEY)
+        except ValueError:  # evicted in between; a fresh generation will do
+            cache.set(self.GENERATION_KEY, time.time_ns(), None)
+
+
+def shared_cache():
+    """Whether every worker sees the same default cache (not a per-process or dummy one)"""
+    return not isinstance(caches['default'], (LocMemCache, DummyCache))
+
+
+def _build():
+    global voter_limiter, ip_limiter, recent_votes
+    max_keys = getattr(settings, 'POLLS_RATE_LIMIT_MAX_KEYS', 10000)
+    voter_limiter = TokenBucketLimiter(*getattr(settings, 'POLLS_VOTE_RATE_PER_VOTER', (2, 10)), max_keys)
+    ip_limiter = TokenBucketLimiter(*getattr(settings, 'POLLS_VOTE_RATE_PER_IP', (10, 50)), max_keys)
+    recent_votes = RecentVotes(getattr(settings, 'POLLS_REVOTE_COLLAPSE_SECONDS', 5) if shared_cache() else 0)
+
+
+def reset():
+    """Forget the token buckets and re-read the settings"""
+    _build()
+
+
+_build()
+
+
+def voter_key(request):
+    """
+    The raw session cookie identifies the voter (anonymous or logged in)
+    without loading the session or the user from the database.
+    """
+    return request.COOKIES.get(settings.SESSION_COOKIE_NAME)
+
+
+def check_rate(request, votes=1):
+    """Seconds the client must wait before casting ``votes`` more votes, or 0"""
+    voter = voter_key(request)
+    if voter:
+        retry_after = voter_limiter.consume(voter, count=votes)
+        if retry_after:
+            return retry_after
+    return ip_limiter.consume(request.META.get('REMOTE_ADDR') or 'unknown', count=votes)
@@ -0,0 +1,178 @@
+"""
+Full-text search over ThisOrThat questions and their category names.
+
+On SQLite the text lives in an FTS5 table (``polls_question_fts``, rowid =
+question id) that the signals in signals.py keep in step with saves and
+deletes. Bulk writes bypass signals; run ``manage.py rebuild_search_index``
+after them. On PostgreSQL the same queries go through expression GIN
+indexes on the question text and on the category name, which cannot drift;
+questions are matched by each index separately and the two id sets joined
+with UNION, as an OR across the join could use neither. Other databases
+fall back to ``icontains``.
+
+Queries are split into words and every word must match, as a prefix, so
+results show up while the user is still typing.
+"""
+import re
+
+from django.db import connection, transaction
+from django.db.models import Q
+from django.db.models.expressions import RawSQL
+
+from .models import ThisOrThat
+
+FTS_TABLE = 'polls_question_fts'
+
+# bm25() weights for option_a, option_b and the category name
+_FTS_WEIGHTS = (1.0, 1.0, 0.5)
+
+_PG_VECTOR = "to_tsvector('english', q.option_a || ' ' || q.option_b)"
+
+_PG_CATEGORY_VECTOR = "to_tsvector('english', c.name)"
+
+# Ids of questions whose text or category name matches; each half of the
+# UNION can use its own GIN index. Takes the tsquery twice.
+_PG_MATCHING_IDS = (
+    f"SELECT q.id FROM polls_thisorthat q WHERE {_PG_VECTOR} @@ to_tsquery('english', %s) "
+    f"UNION SELECT q.id FROM polls_thisorthat q JOIN polls_thisorthatcategory c ON c.id = q.category_id "
+    f"WHERE {_PG_CATEGORY_VECTOR} @@ to_tsquery('english', %s)"
+)
+
+_WORD = re.compile(r'\w+')
+
+
+def words(term):
+    return _WORD.findall(term.lower())
+
+
+def _fts_query(term):
+    return ' '.join(f'"{word}"*' for word in words(term))
+
+
+def _pg_query(term):
+    return ' & '.join(f'{word}:*' for word in words(term))
+
+
+def _backend():
+    return connection.vendor if connection.vendor in ('sqlite', 'postgresql') else None
+
+
+def matching(queryset, term):
+    """``queryset`` (of ThisOrThat) narrowed to questions matching ``term``, unranked"""
+    if not words(term):
+        return queryset.none()
+    return queryset.filter(id__in=matching_ids(term))
+
+
+def matching_ids(term):
+    """A subquery of the ids of questions matching ``term``, usable in ``__in`` lookups"""
+    backend = _backend()
+    if backend == 'sqlite':
+        return RawSQL(f'SELECT rowid FROM {FTS_TABLE} WHERE {FTS_TABLE} MATCH %s', (_fts_query(term),))
+    if backend == 'postgresql':
+        return RawSQL(_PG_MATCHING_IDS, (_pg_query(term),) * 2)
+    condition = Q()
+    for word in words(term):
+        condition &= Q(option_a__icontains=word) | Q(option_b__icontains=word) | Q(category__name__icontains=word)
+    return ThisOrThat.objects.filter(condition).values('id')
+
+
+def _ranked_ids(sql, params):
+    with connection.cursor() as cursor:
+        cursor.execute(sql, params)
+        return [row[0] for row in cursor.fetchall()]
+
+
+def _load_active(ids, limit):
+    questions = ThisOrThat.objects.filter(is_active=True, category__is_active=True).select_related('category').in_bulk(ids)
+    return [questions[question_id] for question_id in ids if question_id in questions][:limit]
+
+
+def search(term, limit=20):
+    """
+    Active questions in active categories matching ``term``, best match
+    first, as a list of ThisOrThat with their category loaded.
+    """
+    if not words(term):
+        return []
+    backend = _backend()
+    if backend == 'sqlite':
+        order = f'bm25({FTS_TABLE}, {", ".join(map(str, _FTS_WEIGHTS))}), {FTS_TABLE}.rowid'
+        # Rank inside the FTS table alone and over-fetch a little: joining every
+        # match to the questions before sorting costs as much as the ranking.
+        # Only if inactive questions crowd out the page is the join needed.
+        fetch = limit * 2 + 10
+        ids = _ranked_ids(
+            f'SELECT rowid FROM {FTS_TABLE} WHERE {FTS_TABLE} MATCH %s ORDER BY {order} LIMIT %s',
+            (_fts_query(term), fetch),
+        )
+        questions = _load_active(ids, limit)
+        if len(questions) == limit or len(ids) < fetch:
+            return questions
+        ids = _ranked_ids(
+            f'SELECT {FTS_TABLE}.rowid FROM {FTS_TABLE} '
+            f'JOIN polls_thisorthat q ON q.id = {FTS_TABLE}.rowid '
+            f'JOIN polls_thisorthatcategory c ON c.id = q.category_id '
+            f'WHERE {FTS_TABLE} MATCH %s AND q.is_active AND c.is_active ORDER BY {order} LIMIT %s',
+            (_fts_query(term), limit),
+        )
+    elif backend == 'postgresql':
+        ids = _ranked_ids(
+            f"SELECT q.id FROM polls_thisorthat q JOIN polls_thisorthatcategory c ON c.id = q.category_id, "
+            f"to_tsquery('english', %s) query "
+            f"WHERE q.id IN ({_PG_MATCHING_IDS}) AND q.is_active AND c.is_active "
+            f"ORDER BY ts_rank({_PG_VECTOR}, query) + 0.5 * ts_rank({_PG_CATEGORY_VECTOR}, query) DESC, q.id "
+            f"LIMIT %s",
+            (_pg_query(term),) * 3 + (limit,),
+        )
+    else:
+        questions = matching(
+            ThisOrThat.objects.filter(is_active=True, category__is_active=True), term
+        ).select_related('category').order_by('id')
+        return list(questions[:limit])
+    return _load_active(ids, limit)
+
+
+def index_questions(question_ids, batch_size=500):
+    """(Re)index the given questions; a no-op outside SQLite"""
+    if _backend() != 'sqlite':
+        return
+    question_ids = list(question_ids)
+    for start in range(0, len(question_ids), batch_size):
+        batch = question_ids[start:start + batch_size]
+        rows = list(ThisOrThat.objects.filter(id__in=batch).values_list('id', 'option_a', 'option_b', 'category__name'))
+        # One transaction per batch rather than one per row in autocommit mode
+        with transaction.atomic(), connection.cursor() as cursor:
+            cursor.executemany(f'DELETE FROM {FTS_TABLE} WHERE rowid = %s', [(question_id,) for question_id in batch])
+            cursor.executemany(
+                f'INSERT INTO {FTS_TABLE} (rowid, option_a, option_b, category) VALUES (%s, %s, %s, %s)', rows
+            )
+
+
+def index_category(category_id):
+    """Reindex every question of a category, e.g. after it was renamed"""
+    index_questions(list(ThisOrThat.objects.filter(category_id=category_id).values_list('id', flat=True)))
+
+
+def remove_questions(question_ids):
+    if _backend() != 'sqlite' or not question_ids:
+        return
+    with transaction.atomic(), connection.cursor() as cursor:
+        cursor.executemany(f'DELETE FROM {FTS_TABLE} WHERE rowid = %s', [(question_id,) for question_id in question_ids])
+
+
+def rebuild_index():
+    """Repopulate the whole index from the tables; returns the number of questions indexed"""
+    if _backend() != 'sqlite':
+        return 0
+    with transaction.atomic(), connection.cursor() as cursor:
+        cursor.execute(f'DELETE FROM {FTS_TABLE}')
+        cursor.execute(
+            f'INSERT INTO {FTS_TABLE} (rowid, option_a, option_b, category) '
+            f'SELECT q.id, q.option_a, q.option_b, c.name FROM polls_thisorthat q '
+            f'JOIN polls_thisorthatcategory c ON c.id = q.category_id'
+        )
+        count = cursor.rowcount
+        # Merge the index b-trees written by the bulk insert
+        cursor.execute(f"INSERT INTO {FTS_TABLE} ({FTS_TABLE}) VALUES ('optimize')")
+    return count
@@ -0,0 +1,160 @@
+"""
+Optional per-category vote shards: Vote rows, and the counter rows of their
+questions, kept in several database files.
+
+SQLite lets one writer at a time into a file, so with a single database a
+busy category queues every other category's voters behind it. Listing extra
+database aliases in POLLS_VOTE_SHARDS spreads categories over
+``vote_databases()`` (the default database plus the shards): a category goes
+where POLLS_CATEGORY_SHARDS maps it, otherwise to ``category_id modulo the
+number of vote databases``. A vote then commits in its category's file only,
+together with its counter change (see counters.py), and categories in
+different files no longer wait for each other.
+
+Everything else, questions and categories included, stays in the default
+database, so question ids remain global. Votes point at their question,
+category, user and agent without database-level foreign keys; deleting a
+question removes its shard votes through a signal instead.
+
+Queries scoped to one category go to ``category_votes()``. Queries over all
+votes (dashboard, analytics) run once per database via ``vote_querysets()``
+and add up the results; they only group on Vote's own columns, because the
+tables they would join to are not in the shard files.
+
+Changing either setting moves categories between files: stop the app and run
+``manage.py migrate_vote_shards`` before serving again. With no shards
+configured every alias resolves to the default database and nothing changes.
+"""
+from contextlib import ExitStack
+
+from django.conf import settings
+from django.db import DEFAULT_DB_ALIAS, transaction
+from django.db.models import Max
+
+from .models import CounterShard, ThisOrThat, ThisOrThatCategory, Vote
+
+SHARDED_MODELS = (Vote, CounterShard)
+
+
+def shard_aliases():
+    return list(getattr(settings, 'POLLS_VOTE_SHARDS', []))
+
+
+def enabled():
+    return bool(shard_aliases())
+
+
+def vote_databases():
+    """Every database that can hold votes, the default one first"""
+    return [DEFAULT_DB_ALIAS] + [alias for alias in shard_aliases() if alias != DEFAULT_DB_ALIAS]
+
+
+def db_for_category(category_id):
+    """Alias of the database holding the votes of ``category_id``"""
+    databases = vote_databases()
+    if len(databases) == 1 or category_id is None:
+        return DEFAULT_DB_ALIAS
+    mapped = getattr(settings, 'POLLS_CATEGORY_SHARDS', {}).get(category_id)
+    if mapped in databases:
+        return mapped
+    return databases[category_id % len(databases)]
+
+
+def category_votes(category_id):
+    """Votes of one category, read from and written to its database"""
+    return Vote.objects.using(db_for_category(category_id)).filter(category_id=category_id)
+
+
+def vote_querysets(queryset=None):
+    """``queryset`` (all votes by default) once for each vote database"""
+    queryset = Vote.objects.all() if queryset is None else queryset
+    return [queryset.using(alias) for alias in vote_databases()]
+
+
+def last_vote_times(category_id=None):
+    """
+    When the latest vote was cast or changed in each vote database, or only
+    in the database of ``category_id``: one MAX per database, answered from
+    a timestamp index. Votes leave category versions alone, so the
+    validators of pages that show tallies include these.
+    """
+    querysets = vote_querysets() if category_id is None else [category_votes(category_id)]
+    return tuple(votes.aggregate(last=Max('timestamp'))['last'] for votes in querysets)
+
+
+def merge_counts(pairs):
+    """Add up ``(key, count)`` pairs from several databases into one dict"""
+    counts = {}
+    for key, count in pairs:
+        counts[key] = counts.get(key, 0) + count
+    return counts
+
+
+def atomic(databases):
+    """
+    One transaction per database, committed in reverse order when the block
+    exits. Not two-phase: a crash between the commits can leave one done.
+    """
+    stack = ExitStack()
+    for alias in dict.fromkeys(databases):
+        stack.enter_context(transaction.atomic(using=alias))
+    return stack
+
+
+def move_votes(votes, target, batch_size=1000):
+    """
+    Copy ``votes`` (a Vote queryset on its current database) into ``target``
+    and delete them from the source, one batch per pair of transactions.
+    Rows get new ids in the target. Returns how many were moved.
+    """
+    fields = [field.attname for field in Vote._meta.concrete_fields if not field.primary_key]
+    moved = 0
+    while True:
+        rows = list(votes.order_by('id').values('id', *fields)[:batch_size])
+        if not rows:
+            return moved
+        with atomic([votes.db, target]):
+            Vote.objects.using(target).bulk_create([
+                Vote(**{field: row[field] for field in fields}) for row in rows
+            ])
+            Vote.objects.using(votes.db).filter(id__in=[row['id'] for row in rows]).delete()
+        moved += len(rows)
+
+
+class VoteShardRouter:
+    """
+    Sends Vote and CounterShard rows to their category's database and every
+    other model to the default one. Only explicit ``using()`` calls and
+    instance hints can name a category, so querysets without either go to
+    the default database; category-scoped code uses ``category_votes()``.
+    """
+
+    def _db_for(self, model, hints):
+        instance = hints.get('instance')
+        if model not in SHARDED_MODELS:
+            # e.g. vote.this_or_that on a vote read from a shard
+            return DEFAULT_DB_ALIAS if isinstance(instance, SHARDED_MODELS) else None
+        if isinstance(instance, SHARDED_MODELS) and instance._state.db:
+            return instance._state.db
+        if isinstance(instance, (Vote, ThisOrThat)):
+            return db_for_category(instance.category_id)
+        if isinstance(instance, ThisOrThatCategory):
+            return db_for_category(instance.pk)
+        return DEFAULT_DB_ALIAS
+
+    def db_for_read(self, model, **hints):
+        return self._db_for(model, hints)
+
+    def db_for_write(self, model, **hints):
+        return self._db_for(model, hints)
+
+    def allow_relation(self, obj1, obj2, **hints):
+        # Votes point across databases on purpose
+        if isinstance(obj1, SHARDED_MODELS) or isinstance(obj2, SHARDED_MODELS):
+            return True
+        return None
+
+    def allow_migrate(self, db, app_label, model_name=None, **hints):
+        if db in shard_aliases():
+            return app_label == 'polls' and model_name in ('vote', 'countershard')
+        return None
@@ -0,0 +1,83 @@
+from django.db import DEFAULT_DB_ALIAS
+from django.db.models.signals import post_delete, post_save, pre_save
+from django.dispatch import receiver
+
+from . import counters, search, sharding, snapshots
+from .models import Choice, CounterShard, ThisOrThat, ThisOrThatCategory, Vote, VoteRollup
+
+
+@receiver(pre_save, sender=ThisOrThat)
+def remember_previous_category(sender, instance, **kwargs):
+    """Note the category a question is being moved out of, if any"""
+    instance._previous_category_id = None
+    if instance.pk:
+        instance._previous_category_id = (
+            ThisOrThat.objects.filter(pk=instance.pk).values_list('category_id', flat=True).first()
+        )
+
+
+@receiver(post_save, sender=ThisOrThat)
+def move_question_votes(sender, instance, created, **kwargs):
+    """Keep the category copied onto votes and rollups in step with the question"""
+    previous = getattr(instance, '_previous_category_id', None)
+    if created or previous is None or previous == instance.category_id:
+        return
+    source, target = sharding.db_for_category(previous), sharding.db_for_category(instance.category_id)
+    Vote.objects.using(source).filter(this_or_that=instance).update(category_id=instance.category_id)
+    VoteRollup.objects.filter(this_or_that=instance).update(category_id=instance.category_id)
+    if source != target:
+        # The new category keeps its votes and counters in another vote shard
+        sharding.move_votes(Vote.objects.using(source).filter(this_or_that=instance), target)
+        counters.relocate([instance.pk], source)
+
+
+@receiver(post_delete, sender=ThisOrThat)
+def delete_sharded_votes(sender, instance, **kwargs):
+    """Votes in a vote shard are out of reach of the cascade from the question row"""
+    using = sharding.db_for_category(instance.category_id)
+    if using != DEFAULT_DB_ALIAS:
+        Vote.objects.using(using).filter(this_or_that_id=instance.pk).delete()
+        CounterShard.objects.using(using).filter(this_or_that_id=instance.pk).delete()
+
+
+@receiver(post_save, sender=ThisOrThat)
+@receiver(post_delete, sender=ThisOrThat)
+def bump_question_category(sender, instance, **kwargs):
+    """Question edits change what the category pages render"""
+    category_ids = {instance.category_id, getattr(instance, '_previous_category_id', None)}
+    category_ids.discard(None)
+    ThisOrThatCategory.bump_version(*category_ids)
+
+
+@receiver(post_save, sender=ThisOrThat)
+def index_question(sender, instance, **kwargs):
+    search.index_questions([instance.pk])
+
+
+@receiver(post_delete, sender=ThisOrThat)
+def unindex_question(sender, instance, **kwargs):
+    search.remove_questions([instance.pk])
+
+
+@receiver(pre_save, sender=ThisOrThatCategory)
+def remember_previous_name(sender, instance, **kwargs):
+    instance._previous_name = None
+    if instance.pk:
+        instance._previous_name = (
+            ThisOrThatCategory.objects.filter(pk=instance.pk).values_list('name', flat=True).first()
+        )
+
+
+@receiver(post_save, sender=ThisOrThatCategory)
+def reindex_renamed_category(sender, instance, created, **kwargs):
+    """Category names are searchable, so a rename reindexes its questions"""
+    previous = getattr(instance, '_previous_name', None)
+    if not created and previous is not None and previous != instance.name:
+        search.index_category(instance.pk)
+
+
+@receiver(post_save, sender=Choice)
+@receiver(post_delete, sender=Choice)
+def expire_results_snapshot(sender, instance, **kwargs):
+    """A vote or edit changes the published results page of the question"""
+    snapshots.expire([snapshots.results_path(instance.question_id)])
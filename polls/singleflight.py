@@ -0,0 +1,61 @@
+"""
+Shared cache entries for expensive results that many requests ask for at
+once, recomputed by one of them at a time.
+
+An entry is fresh for ``fresh_for`` seconds and may then be served stale
+for ``stale_for`` more. The first request to find it stale takes a lock
+with ``cache.add`` and recomputes; the others keep getting the stale copy
+meanwhile. With no copy at all they wait for the lock holder instead of
+running the same queries alongside it. The lock expires after
+LOCK_SECONDS, so a worker dying mid-computation does not block the rest.
+
+Sharing works across workers only with a shared cache backend (memcached,
+Redis, database); the default local-memory cache shares within a process.
+"""
+import time
+
+from django.conf import settings
+from django.core.cache import cache
+
+LOCK_SECONDS = getattr(settings, 'POLLS_SINGLE_FLIGHT_LOCK_SECONDS', 30)
+WAIT_INTERVAL = 0.05
+
+
+def _store(key, value, fresh_for, stale_for):
+    cache.set(key, (value, time.time() + fresh_for), fresh_for + stale_for)
+    return value
+
+
+def get_or_compute(key, compute, fresh_for, stale_for=None, refresh=False):
+    """
+    The cached value of ``key``, calling ``compute()`` when it is missing or
+    stale and no other request is already doing so. ``stale_for`` defaults
+    to ``fresh_for``; ``refresh`` recomputes and stores unconditionally.
+    """
+    stale_for = fresh_for if stale_for is None else stale_for
+    if refresh:
+        return _store(key, compute(), fresh_for, stale_for)
+    entry = cache.get(key)
+    if entry is not None and entry[1] > time.time():
+        return entry[0]
+    lock = f'{key}:lock'
+    if cache.add(lock, True, LOCK_SECONDS):
+        try:
+            return _store(key, compute(), fresh_for, stale_for)
+        finally:
+            cache.delete(lock)
+    if entry is not None:
+        return entry[0]
+    # Nothing to serve yet: wait for the request holding the lock
+    deadline = time.monotonic() + LOCK_SECONDS
+    while time.monotonic() < deadline:
+        time.sleep(WAIT_INTERVAL)
+        # Lock before entry: the holder stores the entry, then releases
+        released = cache.get(lock) is None
+        entry = cache.get(key)
+        if entry is not None:
+            return entry[0]
+        if released:
+            # It failed, or stored nothing (a zero lifetime)
+            break
+    return compute()
@@ -0,0 +1,194 @@
+"""
+Pre-rendered HTML of the public, read-only pages, for the web server to
+serve without reaching Django.
+
+``publish()`` renders the This or That home page, the first page of every
+active category's quiz summary and every published classic results page as
+an anonymous visitor would see them, and writes each to
+``POLLS_SNAPSHOT_DIR/<url path>/index.html``. Files are written to a
+temporary name and renamed, so the web server never reads half a page.
+A manifest remembers the fingerprint each page was rendered from (category
+versions and latest votes, or the choice counts for classic results); later runs skip
+unchanged pages and remove snapshots of pages that went away.
+
+Between runs a snapshot can fall behind its page. When a category, vote or
+choice changes, ``expire()`` deletes the affected snapshots that are older than
+POLLS_SNAPSHOT_MAX_AGE seconds, so the web server falls back to Django's live
+render until the next run publishes them again. A younger snapshot is
+deleted by a timer once it reaches that age, unless a run has replaced it
+by then.
+"""
+import hashlib
+import json
+import os
+import tempfile
+import threading
+import time
+from collections import defaultdict
+from pathlib import Path
+
+from django.conf import settings
+from django.contrib.auth.models import AnonymousUser
+from django.contrib.sessions.backends.base import SessionBase
+from django.core.cache import cache
+from django.http import HttpRequest
+from django.urls import resolve, reverse
+from django.utils import timezone
+
+from . import sharding
+from .models import Questions, ThisOrThatCategory
+
+MANIFEST = 'manifest.json'
+
+
+class SnapshotError(Exception):
+    pass
+
+
+def snapshot_dir():
+    return Path(getattr(settings, 'POLLS_SNAPSHOT_DIR', settings.BASE_DIR / 'snapshots'))
+
+
+def max_age():
+    return getattr(settings, 'POLLS_SNAPSHOT_MAX_AGE', 60)
+
+
+def snapshot_path(url_path):
+    return snapshot_dir() / url_path.strip('/') / 'index.html'
+
+
+def home_path():
+    return reverse('polls:this_or_that_home')
+
+
+def summary_path(category_id):
+    return reverse('polls:quiz_summary', args=(category_id,))
+
+
+def results_path(question_id):
+    return reverse('polls:results', args=(question_id,))
+
+
+def _pages():
+    """URL path -> fingerprint of what the page shows, for every page to publish"""
+    from .views import _categories_state, _category_key, _state_key
+
+    pages = {home_path(): _state_key(_categories_state())}
+    for state in ThisOrThatCategory.objects.filter(is_active=True).values('id', 'version', 'updated_at'):
+        state['last_votes'] = sharding.last_vote_times(state['id'])
+        pages[summary_path(state['id'])] = _category_key(state['id'], state)
+    # The same rows the results page's ETag is made of, for every question in one query
+    choices = defaultdict(list)
+    for question_id, *row in Questions.objects.filter(pub_date__lte=timezone.now()).order_by(
+        'id', 'choice__id'
+    ).values_list('id', 'question_text', 'choice__id', 'choice__choice_text', 'choice__votes'):
+        choices[question_id].append(tuple(row))
+    for question_id, rows in choices.items():
+        pages[results_path(question_id)] = hashlib.md5(repr(rows).encode()).hexdigest()
+    return pages
+
+
+def _render(url_path):
+    """The page at ``url_path`` as a visitor without cookies gets it"""
+    request = HttpRequest()
+    request.method = 'GET'
+    request.path = request.path_info = url_path
+    request.user = AnonymousUser()
+    request.session = SessionBase()
+    request.resolver_match = match = resolve(url_path)
+    response = match.func(request, *match.args, **match.kwargs)
+    if hasattr(response, 'render'):
+        response.render()
+    if response.status_code != 200:
+        raise SnapshotError(f"{url_path} answered {response.status_code}")
+    return response.content
+
+
+def _write(path, content):
+    path.parent.mkdir(parents=True, exist_ok=True)
+    # Write to a temporary file and rename so the web server never sees a partial page
+    fd, tmp_path = tempfile.mkstemp(dir=path.parent, suffix='.tmp')
+    with os.fdopen(fd, 'wb') as handle:
+        handle.write(content)
+    # mkstemp creates the file readable by its owner only
+    os.chmod(tmp_path, 0o644)
+    os.replace(tmp_path, path)
+
+
+def _read_manifest():
+    try:
+        return json.loads((snapshot_dir() / MANIFEST).read_text())
+    except (FileNotFoundError, ValueError):
+        return {}
+
+
+def _remove(url_path):
+    try:
+        snapshot_path(url_path).unlink()
+    except FileNotFoundError:
+        pass
+
+
+def publish(force=False):
+    """
+    Render the pages that changed since the last run (all of them with
+    ``force``) and drop snapshots of pages no longer published. Returns
+    (written, unchanged, removed) lists of URL paths.
+    """
+    previous = _read_manifest()
+    # Fingerprints are read before rendering: a change made meanwhile is
+    # picked up by the next run rather than lost
+    pages = _pages()
+    written, unchanged = [], []
+    for url_path, fingerprint in pages.items():
+        if not force and previous.get(url_path) == fingerprint and snapshot_path(url_path).exists():
+            unchanged.append(url_path)
+            continue
+        _write(snapshot_path(url_path), _render(url_path))
+        written.append(url_path)
+    removed = [url_path for url_path in previous if url_path not in pages]
+    for url_path in removed:
+        _remove(url_path)
+    _write(snapshot_dir() / MANIFEST, json.dumps(pages, indent=1).encode())
+    return written, unchanged, removed
+
+
+def expire(url_paths):
+    """
+    Delete the snapshots of ``url_paths`` that are older than the maximum
+    age; the web server then passes their requests on to Django. Younger
+    ones are deleted when they reach it, if still the same file.
+    """
+    now = time.time()
+    for url_path in url_paths:
+        path = snapshot_path(url_path)
+        try:
+            mtime = path.stat().st_mtime
+            if mtime < now - max_age():
+                path.unlink()
+            else:
+                _expire_later(url_path, mtime, mtime + max_age() - now)
+        except FileNotFoundError:
+            pass
+
+
+def _expire_later(url_path, mtime, delay):
+    # One timer per snapshot file; a republished one has a new mtime
+    if not cache.add(f'polls:snapshot-expire:{url_path}:{mtime}', True, int(delay) + 1):
+        return
+    timer = threading.Timer(delay, _expire_if_unchanged, args=(url_path, mtime))
+    timer.daemon = True
+    timer.start()
+
+
+def _expire_if_unchanged(url_path, mtime):
+    path = snapshot_path(url_path)
+    try:
+        if path.stat().st_mtime == mtime:
+            path.unlink()
+    except FileNotFoundError:
+        pass
+
+
+def expire_categories(category_ids):
+    expire([home_path(), *(summary_path(category_id) for category_id in category_ids)])
@@ -0,0 +1,257 @@
+// Server-side values come from data attributes and json_script blocks
+const dashboard = document.getElementById('dashboard').dataset;
+const activityData = JSON.parse(document.getElementById('activity-data').textContent);
+const categoryData = JSON.parse(document.getElementById('category-data').textContent);
+const hourlyData = JSON.parse(document.getElementById('hourly-data').textContent);
+const deviceData = JSON.parse(document.getElementById('device-data').textContent);
+
+// Activity Chart
+const activityCtx = document.getElementById('activityChart').getContext('2d');
+const activityChart = new Chart(activityCtx, {
+    type: 'line',
+    data: {
+        labels: activityData.labels,
+        datasets: [{
+            label: 'Votes',
+            data: activityData.votes,
+            borderColor: '#667eea',
+            backgroundColor: 'rgba(102, 126, 234, 0.1)',
+            borderWidth: 3,
+            fill: true,
+            tension: 0.4
+        }]
+    },
+    options: {
+        responsive: true,
+        maintainAspectRatio: false,
+        plugins: {
+            legend: {
+                display: false
+            }
+        },
+        scales: {
+            y: {
+                beginAtZero: true,
+                grid: {
+                    color: 'rgba(0,0,0,0.1)'
+                }
+            },
+            x: {
+                grid: {
+                    display: false
+                }
+            }
+        }
+    }
+});
+
+// Category Chart
+const categoryCtx = document.getElementById('categoryChart').getContext('2d');
+const categoryChart = new Chart(categoryCtx, {
+    type: 'doughnut',
+    data: {
+        labels: categoryData.labels,
+        datasets: [{
+            data: categoryData.votes,
+            backgroundColor: [
+                '#ff6b6b',
+                '#4834d4',
+                '#00d2ff',
+                '#ff9ff3',
+                '#54a0ff',
+                '#5f27cd',
+                '#00d8d6',
+                '#ff3838'
+            ],
+            borderWidth: 3,
+            borderColor: '#fff'
+        }]
+    },
+    options: {
+        responsive: true,
+        maintainAspectRatio: false,
+        plugins: {
+            legend: {
+                position: 'right',
+                labels: {
+                    padding: 20,
+                    usePointStyle: true
+                }
+            }
+        }
+    }
+});
+
+// Hourly Chart
+const hourlyCtx = document.getElementById('hourlyChart').getContext('2d');
+const hourlyChart = new Chart(hourlyCtx, {
+    type: 'bar',
+    data: {
+        labels: hourlyData.labels,
+        datasets: [{
+            label: 'Votes by Hour',
+            data: hourlyData.votes,
+            backgroundColor: 'rgba(102, 126, 234, 0.8)',
+            borderColor: '#667eea',
+            borderWidth: 2,
+            borderRadius: 5
+        }]
+    },
+    options: {
+        responsive: true,
+        maintainAspectRatio: false,
+        plugins: {
+            legend: {
+                display: false
+            }
+        },
+        scales: {
+            y: {
+                beginAtZero: true,
+                grid: {
+                    color: 'rgba(0,0,0,0.1)'
+                }
+            },
+            x: {
+                grid: {
+                    display: false
+                }
+            }
+        }
+    }
+});
+
+// Device Chart
+const deviceCtx = document.getElementById('deviceChart').getContext('2d');
+const deviceChart = new Chart(deviceCtx, {
+    type: 'doughnut',
+    data: {
+        labels: deviceData.labels,
+        datasets: [{
+            data: deviceData.votes,
+            backgroundColor: [
+                '#54a0ff',
+                '#ff9ff3',
+                '#00d8d6',
+                '#5f27cd',
+                '#c8d6e5'
+            ],
+            borderWidth: 3,
+            borderColor: '#fff'
+        }]
+    },
+    options: {
+        responsive: true,
+        maintainAspectRatio: false,
+        plugins: {
+            legend: {
+                position: 'right',
+                labels: {
+                    padding: 20,
+                    usePointStyle: true
+                }
+            }
+        }
+    }
+});
+
+// Bucket days and hours in the viewer's timezone rather than the server's
+const browserTimezone = Intl.DateTimeFormat().resolvedOptions().timeZone;
+
+// Watermark of the data currently on screen and the filters it was computed for
+let watermark = dashboard.watermark;
+let syncedFilters = `30/all/${dashboard.serverTimezone}`;
+
+function applyUpdates(chart, updates) {
+    const values = chart.data.datasets[0].data;
+    updates.forEach(([index, count]) => { values[index] = count; });
+}
+
+function applyCategoryUpdates(updates) {
+    const labels = categoryChart.data.labels;
+    const values = categoryChart.data.datasets[0].data;
+    updates.forEach(([label, count]) => {
+        const index = labels.indexOf(label);
+        if (index === -1) {
+            labels.push(label);
+            values.push(count);
+        } else {
+            values[index] = count;
+        }
+    });
+}
+
+function updateCharts() {
+    const timePeriod = document.getElementById('timePeriod').value;
+    const category = document.getElementById('category').value;
+    const startDate = document.getElementById('startDate').value;
+    const endDate = document.getElementById('endDate').value;
+
+    // A filter change invalidates what we have, so ask for everything
+    const filters = `${timePeriod}/${category}/${browserTimezone}`;
+    const headers = {
+        'X-CSRFToken': dashboard.csrfToken,
+        'Content-Type': 'application/json',
+    };
+    if (filters === syncedFilters && watermark) {
+        headers['If-None-Match'] = `"${watermark}"`;
+    }
+
+    // Send AJAX request to update charts
+    fetch(dashboard.updateUrl, {
+        method: 'POST',
+        headers: headers,
+        body: JSON.stringify({
+            time_period: timePeriod,
+            category: category,
+            start_date: startDate,
+            end_date: endDate,
+            timezone: browserTimezone,
+            watermark: filters === syncedFilters ? watermark : null
+        })
+    })
+    .then(response => response.status === 304 ? null : response.json())
+    .then(data => {
+        if (!data || data.error) {
+            return;
+        }
+        if (data.full) {
+            activityChart.data.labels = data.activity_data.labels;
+            activityChart.data.datasets[0].data = data.activity_data.votes;
+            categoryChart.data.labels = data.category_data.labels;
+            categoryChart.data.datasets[0].data = data.category_data.votes;
+            hourlyChart.data.datasets[0].data = data.hourly_data.votes;
+        } else {
+            applyUpdates(activityChart, data.activity_data);
+            applyUpdates(hourlyChart, data.hourly_data);
+            applyCategoryUpdates(data.category_data);
+        }
+        activityChart.update();
+        categoryChart.update();
+        hourlyChart.update();
+
+        watermark = data.watermark;
+        syncedFilters = filters;
+    });
+}
+
+function exportData() {
+    const timePeriod = document.getElementById('timePeriod').value;
+    const category = document.getElementById('category').value;
+
+    window.location.href = `${dashboard.exportUrl}?period=${timePeriod}&category=${category}`;
+}
+
+// Set default date range to last 30 days
+const today = new Date();
+const thirtyDaysAgo = new Date(today.getTime() - (30 * 24 * 60 * 60 * 1000));
+
+document.getElementById('endDate').value = today.toISOString().split('T')[0];
+document.getElementById('startDate').value = thirtyDaysAgo.toISOString().split('T')[0];
+
+if (browserTimezone && browserTimezone !== dashboard.serverTimezone) {
+    updateCharts();
+}
+
+// Auto-refresh every 30 seconds
+setInterval(updateCharts, 30000);
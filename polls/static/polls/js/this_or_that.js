@@ -0,0 +1,148 @@
+// URLs and the CSRF token come from data attributes on the game card
+const game = document.getElementById('gameCard').dataset;
+
+// The vote response carries the next question, so the page is never reloaded
+let answered = false;
+let upcoming = null;
+
+function vote(choice) {
+    if (answered) return;
+    answered = true;
+
+    // Disable further clicks
+    document.getElementById('optionA').classList.add('disabled');
+    document.getElementById('optionB').classList.add('disabled');
+
+    // Send vote to server
+    fetch(game.voteUrl, {
+        method: 'POST',
+        headers: {
+            'X-CSRFToken': game.csrfToken,
+            'Content-Type': 'application/json',
+        },
+        body: JSON.stringify({choice: choice})
+    })
+    .then(response => {
+        if (!response.ok) throw new Error(`Vote failed with ${response.status}`);
+        return response.json();
+    })
+    .then(data => {
+        upcoming = data.next || null;
+        prefetch(upcoming);
+        showResults(data);
+    })
+    .catch(error => {
+        console.error('Error:', error);
+        // Re-enable clicks on error
+        answered = false;
+        document.getElementById('optionA').classList.remove('disabled');
+        document.getElementById('optionB').classList.remove('disabled');
+    });
+}
+
+function prefetch(next) {
+    // Warm the browser cache with the next question's images while results show
+    if (!next || !next.question) return;
+    for (const thumbnail of [next.question.option_a_thumbnail, next.question.option_b_thumbnail]) {
+        if (!thumbnail) continue;
+        const image = new Image();
+        image.sizes = '100px';
+        image.srcset = thumbnail.srcset;
+        image.src = thumbnail.src;
+    }
+}
+
+function showResults(data) {
+    const overlay = document.getElementById('resultsOverlay');
+    const sectionA = document.getElementById('resultSectionA');
+    const sectionB = document.getElementById('resultSectionB');
+
+    const hasNext = Boolean(upcoming && upcoming.question);
+    document.getElementById('nextButton').hidden = !hasNext;
+    document.getElementById('summaryLink').hidden = hasNext;
+
+    overlay.style.display = 'block';
+
+    // Set proportional widths
+    setTimeout(() => {
+        sectionA.style.flex = `${data.percentage_a}`;
+        sectionB.style.flex = `${data.percentage_b}`;
+
+        document.getElementById('percentA').textContent = data.percentage_a + '%';
+        document.getElementById('percentB').textContent = data.percentage_b + '%';
+
+        // Show controls after animation
+        setTimeout(() => {
+            document.getElementById('controls').style.display = 'flex';
+        }, 500);
+    }, 200);
+}
+
+function setOption(side, text, thumbnail) {
+    document.getElementById('text' + side).textContent = text;
+    document.getElementById('resultOption' + side).textContent = text;
+    const image = document.getElementById('image' + side);
+    image.hidden = !thumbnail;
+    if (thumbnail) {
+        image.srcset = thumbnail.srcset;
+        image.src = thumbnail.src;
+        image.alt = text;
+    }
+}
+
+function nextQuestion() {
+    if (!upcoming || !upcoming.question) {
+        // Nothing prefetched (e.g. the vote response was lost); fall back to a reload
+        window.location.href = game.nextUrl;
+        return;
+    }
+    const question = upcoming.question;
+    game.voteUrl = question.vote_url;
+    setOption('A', question.option_a, question.option_a_thumbnail);
+    setOption('B', question.option_b, question.option_b_thumbnail);
+    document.getElementById('progressFill').style.width = upcoming.progress_percentage + '%';
+
+    // Reset the results overlay for the new question
+    document.getElementById('controls').style.display = 'none';
+    document.getElementById('resultsOverlay').style.display = 'none';
+    for (const side of ['A', 'B']) {
+        document.getElementById('resultSection' + side).style.flex = '';
+        document.getElementById('percent' + side).textContent = '0%';
+        document.getElementById('option' + side).classList.remove('disabled');
+    }
+    upcoming = null;
+    answered = false;
+}
+
+// Add keyboard support
+document.addEventListener('keydown', function(event) {
+    if (event.key === 'ArrowLeft' || event.key === 'a' || event.key === 'A') {
+        vote('A');
+    } else if (event.key === 'ArrowRight' || event.key === 'd' || event.key === 'D') {
+        vote('B');
+    }
+});
+
+// Add swipe support for mobile
+let startX = null;
+
+document.addEventListener('touchstart', function(event) {
+    startX = event.touches[0].clientX;
+});
+
+document.addEventListener('touchend', function(event) {
+    if (startX === null) return;
+
+    const endX = event.changedTouches[0].clientX;
+    const diff = startX - endX;
+
+    if (Math.abs(diff) > 50) {
+        if (diff > 0) {
+            vote('B');
+        } else {
+            vote('A');
+        }
+    }
+
+    startX = null;
+});
@@ -0,0 +1,34 @@
+// Filter functionality
+document.getElementById('filterInput').addEventListener('input', function(e) {
+    const searchTerm = e.target.value.toLowerCase();
+    const categoryCards = document.querySelectorAll('.category-card');
+
+    categoryCards.forEach(card => {
+        const categoryName = card.getAttribute('data-name');
+        if (categoryName.includes(searchTerm)) {
+            card.style.display = 'block';
+        } else {
+            card.style.display = 'none';
+        }
+    });
+});
+
+// Category selection effect
+document.querySelectorAll('.category-card').forEach(card => {
+    card.addEventListener('click', function(e) {
+        e.preventDefault();
+
+        // Add selected class for animation
+        this.classList.add('selected');
+
+        // Navigate after animation
+        setTimeout(() => {
+            window.location.href = this.href;
+        }, 600);
+    });
+});
+
+// Add random floating animation delays to icons
+document.querySelectorAll('.category-icon').forEach((icon, index) => {
+    icon.style.animationDelay = (index * 0.5) + 's';
+});
@@ -0,0 +1,175 @@
+"""
+Sample-size aware statistics for ThisOrThat tallies.
+
+``percentage_a`` and ``winning_option`` treat a 1-0 split like 10,000-0.
+Here each question gets a Wilson score interval for option A's share of the
+votes (z = POLLS_CONFIDENCE_Z, 1.96 for 95%) and the probability that the
+option currently ahead really is ahead: P(share > 50%) under a normal
+approximation of the Beta(votes_a + 1, votes_b + 1) posterior, so an
+unvoted or tied question scores 0.5 and a landslide approaches 1.
+
+``question_stats()`` loads the counters of many questions in one query and
+computes everything in a single vectorised numpy pass. Without numpy the
+same formulas run per question in plain Python, about ten times slower.
+``closest_battles()`` ranks the questions whose winner is least certain
+among those with enough votes to matter.
+"""
+import heapq
+import itertools
+import math
+
+from django.conf import settings
+from django.core.exceptions import EmptyResultSet
+from django.db import connections
+from django.db.models import F
+
+from .models import ThisOrThat
+
+try:
+    import numpy
+except ImportError:  # the pure Python path gives the same numbers, only slower
+    numpy = None
+
+Z = getattr(settings, 'POLLS_CONFIDENCE_Z', 1.96)
+CLOSE_CALL_MIN_VOTES = getattr(settings, 'POLLS_CLOSE_CALL_MIN_VOTES', 20)
+
+
+def wilson(votes_a, votes_b, z=Z):
+    """Wilson score interval (low, high) for option A's share of one question's votes"""
+    total = votes_a + votes_b
+    if total == 0:
+        return 0.0, 1.0
+    share = votes_a / total
+    denominator = 1 + z * z / total
+    center = (share + z * z / (2 * total)) / denominator
+    margin = z * math.sqrt(share * (1 - share) / total + z * z / (4 * total * total)) / denominator
+    return max(0.0, center - margin), min(1.0, center + margin)
+
+
+def win_probability(votes_a, votes_b):
+    """Probability that the option ahead (either one on a tie) has the larger true share"""
+    mean = (votes_a + 1) / (votes_a + votes_b + 2)
+    sd = math.sqrt(mean * (1 - mean) / (votes_a + votes_b + 3))
+    return 0.5 * (1 + math.erf(abs(mean - 0.5) / sd / math.sqrt(2)))
+
+
+def summary(votes_a, votes_b, z=Z):
+    """Interval and win probability of one question, as a dict"""
+    low, high = wilson(votes_a, votes_b, z)
+    return {'low': low, 'high': high, 'win_probability': win_probability(votes_a, votes_b)}
+
+
+def _erf(x):
+    # Abramowitz & Stegun 7.1.26 (absolute error below 1.5e-7); numpy has no erf
+    sign = numpy.sign(x)
+    x = numpy.abs(x)
+    t = 1 / (1 + 0.3275911 * x)
+    poly = t * (0.254829592 + t * (-0.284496736 + t * (1.421413741 + t * (-1.453152027 + t * 1.061405429))))
+    return sign * (1 - poly * numpy.exp(-x * x))
+
+
+def _vectorised(votes_a, votes_b, z):
+    votes_a = votes_a.astype(numpy.float64)
+    votes_b = votes_b.astype(numpy.float64)
+    total = votes_a + votes_b
+    # Unvoted questions divide by zero here and are overwritten below
+    with numpy.errstate(divide='ignore', invalid='ignore'):
+        share = votes_a / total
+        denominator = 1 + z * z / total
+        center = (share + z * z / (2 * total)) / denominator
+        margin = z * numpy.sqrt(share * (1 - share) / total + z * z / (4 * total * total)) / denominator
+    empty = total == 0
+    low = numpy.where(empty, 0.0, numpy.clip(center - margin, 0.0, 1.0))
+    high = numpy.where(empty, 1.0, numpy.clip(center + margin, 0.0, 1.0))
+    mean = (votes_a + 1) / (total + 2)
+    sd = numpy.sqrt(mean * (1 - mean) / (total + 3))
+    probability = 0.5 * (1 + _erf(numpy.abs(mean - 0.5) / sd / math.sqrt(2)))
+    return low, high, probability
+
+
+def _counters(queryset):
+    """(ids, votes_a, votes_b) of ``queryset``, read with one query"""
+    queryset = queryset.order_by().values_list('id', 'votes_a', 'votes_b')
+    try:
+        sql, params = queryset.query.sql_with_params()
+    except EmptyResultSet:  # e.g. .none() or an empty id__in
+        rows = []
+    else:
+        # A plain cursor: building a tuple per row through the ORM costs more than the maths
+        with connections[queryset.db].cursor() as cursor:
+            cursor.execute(sql, params)
+            rows = cursor.fetchall()
+    if numpy is not None:
+        flat = numpy.fromiter(itertools.chain.from_iterable(rows), dtype=numpy.int64, count=len(rows) * 3)
+        columns = flat.reshape(-1, 3)
+        return columns[:, 0], columns[:, 1], columns[:, 2]
+    if not rows:
+        return [], [], []
+    ids, votes_a, votes_b = zip(*rows)
+    return list(ids), list(votes_a), list(votes_b)
+
+
+def question_stats(queryset=None, z=Z):
+    """
+    Counters, Wilson interval of option A's share and win probability of
+    every question in ``queryset`` (all questions by default), as parallel
+    sequences under 'ids', 'votes_a', 'votes_b', 'low', 'high' and
+    'win_probability': numpy arrays when numpy is installed, else lists.
+    """
+    ids, votes_a, votes_b = _counters(ThisOrThat.objects.all() if queryset is None else queryset)
+    if numpy is not None:
+        low, high, probability = _vectorised(votes_a, votes_b, z)
+    else:
+        low, high = [], []
+        for a, b in zip(votes_a, votes_b):
+            interval = wilson(a, b, z)
+            low.append(interval[0])
+            high.append(interval[1])
+        probability = [win_probability(a, b) for a, b in zip(votes_a, votes_b)]
+    return {
+        'ids': ids, 'votes_a': votes_a, 'votes_b': votes_b,
+        'low': low, 'high': high, 'win_probability': probability,
+    }
+
+
+def closest_battles(limit=10, min_votes=CLOSE_CALL_MIN_VOTES):
+    """
+    Active questions with at least ``min_votes`` votes whose winner is least
+    certain, closest first (more votes first on a tie), as ThisOrThat with
+    their category loaded and ``low``, ``high`` and ``win_probability`` set.
+    """
+    # Questions below the vote threshold are left out in SQL, before loading
+    questions = ThisOrThat.objects.filter(is_active=True, category__is_active=True).alias(
+        total=F('votes_a') + F('votes_b')
+    ).filter(total__gte=min_votes)
+    stats = question_stats(questions)
+    ids, votes_a, votes_b = stats['ids'], stats['votes_a'], stats['votes_b']
+    if numpy is not None:
+        total = votes_a + votes_b
+        eligible = numpy.arange(len(ids))
+        if len(eligible) > limit:
+            # Only questions as close as the limit-th closest can make the
+            # list (ties included), so sort just those
+            probability = stats['win_probability'][eligible]
+            cutoff = numpy.partition(probability, limit - 1)[limit - 1]
+            eligible = eligible[probability <= cutoff]
+        # By probability, then more votes first: lexsort's last key is the primary one
+        order = numpy.lexsort((-total[eligible], stats['win_probability'][eligible]))
+        chosen = [int(index) for index in eligible[order][:limit]]
+    else:
+        chosen = heapq.nsmallest(
+            limit,
+            range(len(ids)),
+            key=lambda index: (stats['win_probability'][index], -(votes_a[index] + votes_b[index])),
+        )
+    found = ThisOrThat.objects.select_related('category').in_bulk([int(ids[index]) for index in chosen])
+    battles = []
+    for index in chosen:
+        question = found.get(int(ids[index]))
+        if question is None:
+            continue
+        question.low = float(stats['low'][index])
+        question.high = float(stats['high'][index])
+        question.win_probability = float(stats['win_probability'][index])
+        battles.append(question)
+    return battles
@@ -0,0 +1,58 @@
+import gzip
+
+from django.conf import settings
+from django.contrib.staticfiles.storage import ManifestStaticFilesStorage, StaticFilesStorage
+
+try:
+    import brotli
+except ImportError:  # Brotli is optional; gzip siblings are always written
+    brotli = None
+
+
+class PrecompressedManifestStaticFilesStorage(ManifestStaticFilesStorage):
+    """
+    Hashed-manifest static storage that also writes ``.gz`` (and, when the
+    ``brotli`` package is installed, ``.br``) siblings of every hashed text
+    asset during collectstatic, so the web server can send them as-is with
+    ``gzip_static``/``brotli_static``.
+
+    With DEBUG on, URLs are left unhashed until collectstatic has written a
+    manifest, so the development server works from app directories. Without
+    DEBUG a missing manifest raises, as in ManifestStaticFilesStorage, rather
+    than serving unhashed names that bypass far-future caching.
+    """
+
+    compress_extensions = ('.css', '.js', '.svg', '.json', '.txt', '.html', '.map')
+    min_compress_size = 256
+
+    def url(self, name, force=False):
+        if settings.DEBUG and not self.hashed_files and not force:
+            return StaticFilesStorage.url(self, name)
+        return super().url(name, force)
+
+    def post_process(self, paths, dry_run=False, **options):
+        yield from super().post_process(paths, dry_run, **options)
+        if dry_run:
+            return
+        for hashed_name in sorted(set(self.hashed_files.values())):
+            if not hashed_name.endswith(self.compress_extensions):
+                continue
+            for compressed_name in self._write_compressed(hashed_name):
+                yield compressed_name, compressed_name, True
+
+    def _write_compressed(self, name):
+        with self.open(name) as original:
+            content = original.read()
+        if len(content) < self.min_compress_size:
+            return
+        # mtime=0 keeps the output byte-for-byte reproducible between builds
+        variants = [('.gz', gzip.compress(content, compresslevel=9, mtime=0))]
+        if brotli is not None:
+            variants.append(('.br', brotli.compress(content, quality=11)))
+        for suffix, compressed in variants:
+            if len(compressed) >= len(content):
+                continue
+            path = self.path(name + suffix)
+            with open(path, 'wb') as handle:
+                handle.write(compressed)
+            yield name + suffix
@@ -1,8 +1,63 @@
+import csv
 import datetime
-from django.test import TestCase
+import hashlib
+import http.server
+import importlib
+import io
+import json
+import os
+import sys
+import tempfile
+import threading
+import time
+import zoneinfo
+import unittest
+from pathlib import Path
+from unittest import mock
+from django.conf import settings
+from django.contrib.auth.models import User
+from django.db import connection, connections
+from django.db.models import F
+from django.core.management import CommandError, call_command
+from django.test import TestCase, TransactionTestCase, override_settings
 from django.utils import timezone
-from .models import Questions
+from django.core.cache import cache
+from .models import CounterShard, Questions, ThisOrThat, ThisOrThatCategory, UserAgent, Vote, VoteRollup
 from django.urls import reverse
+from . import archive, counters, eventlog, funnels, ratelimit, sharding, singleflight, snapshots, stats, thumbnails, useragents, views, voting
+
+# Keep vote events written by tests out of the project directory
+_event_dir = tempfile.TemporaryDirectory()
+_event_settings = override_settings(POLLS_VOTE_EVENT_DIR=_event_dir.name)
+
+# Tests run without DEBUG and without a collectstatic manifest, so pages link
+# unhashed names; StaticPipelineTests puts the project's storage back
+_PROJECT_STORAGES = settings.STORAGES
+_static_settings = override_settings(STORAGES={
+    **settings.STORAGES, "staticfiles": {"BACKEND": "django.contrib.staticfiles.storage.StaticFilesStorage"},
+})
+
+# A second database standing in for a vote shard file (see VoteShardTests).
+# Its tables are created from the models: the data migrations only run in
+# the default database, as they do in a configured shard
+SHARD = "vote_shard_test"
+connections.settings[SHARD] = {
+    **connections.settings["default"], "TEST": {**connections.settings["default"]["TEST"], "MIGRATE": False},
+}
+
+
+def setUpModule():
+    _event_settings.enable()
+    _static_settings.enable()
+    eventlog.reset()
+
+
+def tearDownModule():
+    _static_settings.disable()
+    _event_settings.disable()
+    eventlog.reset()
+    _event_dir.cleanup()
+
 
 class QuestionModelTests(TestCase):
     def test_was_published_recently_with_future_question(self):
@@ -112,4 +167,1824 @@ class QuestionDetailViewTests(TestCase):
         past_question = create_question(question_text="Past Question.", days=-5)
         url = reverse("polls:detail", args=(past_question.id,))
         response = self.client.get(url)
-        self.assertContains(response, past_question.question_text)
\ No newline at end of file
+        self.assertContains(response, past_question.question_text)
+
+
+def create_vote(question, choice="A", when=None, session_key="session", **kwargs):
+    """
+    Create a vote on `question`, optionally backdated to `when` (auto_now_add
+    ignores explicit timestamps, so it is set afterwards)."""
+    vote = Vote.objects.create(this_or_that=question, choice=choice, session_key=session_key, **kwargs)
+    if when is not None:
+        Vote.objects.filter(id=vote.id).update(timestamp=when)
+        vote.timestamp = when
+    return vote
+
+class AnalyticsQueryTests(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.category = ThisOrThatCategory.objects.create(name="Food")
+        self.question = ThisOrThat.objects.create(category=self.category, option_a="Tea", option_b="Coffee")
+
+    def test_hourly_data_uses_viewer_timezone(self):
+        """
+        Votes are bucketed by the hour in the requested timezone, not UTC.
+        """
+        create_vote(self.question, when=timezone.now().replace(hour=23, minute=30))
+        singapore = zoneinfo.ZoneInfo("Asia/Singapore")
+        self.assertEqual(views.get_hourly_data(tz=datetime.timezone.utc)["votes"][23], 1)
+        self.assertEqual(views.get_hourly_data(tz=singapore)["votes"][7], 1)
+
+    def test_activity_data_counts_by_local_day(self):
+        """
+        Daily activity includes today's and older votes in the window and
+        ignores votes outside it.
+        """
+        now = timezone.now()
+        create_vote(self.question, when=now, session_key="a")
+        create_vote(self.question, when=now - datetime.timedelta(days=2), session_key="b")
+        create_vote(self.question, when=now - datetime.timedelta(days=40), session_key="c")
+        data = views.get_activity_data(30, tz=datetime.timezone.utc)
+        self.assertEqual(len(data["votes"]), 31)
+        self.assertEqual(data["votes"][-1], 1)
+        self.assertEqual(sum(data["votes"]), 2)
+
+    @unittest.skipUnless(connection.vendor == "sqlite", "query plan text is SQLite-specific")
+    def test_activity_range_uses_timestamp_index(self):
+        """
+        The range predicate on timestamp is answered from the index.
+        """
+        start = timezone.now() - datetime.timedelta(days=30)
+        plan = Vote.objects.filter(timestamp__gte=start, timestamp__lt=timezone.now()).explain()
+        self.assertIn("polls_vote_timestamp_idx", plan)
+
+    def test_dashboard_renders_for_staff(self):
+        """
+        The analytics dashboard renders chart data for staff users.
+        """
+        create_vote(self.question)
+        staff = User.objects.create_user("staff", password="pw", is_staff=True)
+        self.client.force_login(staff)
+        response = self.client.get(reverse("polls:analytics_dashboard"))
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.context["total_votes"], 1)
+        self.assertEqual(response.context["today_votes"], 1)
+
+class UpdateAnalyticsTests(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.food = ThisOrThatCategory.objects.create(name="Food", icon="🍕")
+        self.travel = ThisOrThatCategory.objects.create(name="Travel", icon="✈️")
+        self.tea = ThisOrThat.objects.create(category=self.food, option_a="Tea", option_b="Coffee")
+        self.beach = ThisOrThat.objects.create(category=self.travel, option_a="Beach", option_b="Mountains")
+        staff = User.objects.create_user("staff", password="pw", is_staff=True)
+        self.client.force_login(staff)
+        # These tests follow single votes; sharing of the snapshot is covered in SingleFlightTests
+        patcher = mock.patch.object(views, "DASHBOARD_CACHE_SECONDS", 0)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def update(self, **body):
+        body.setdefault("time_period", 30)
+        body.setdefault("timezone", "UTC")
+        return self.client.post(
+            reverse("polls:update_analytics"), data=json.dumps(body), content_type="application/json"
+        )
+
+    def test_category_filter_is_applied(self):
+        """
+        Selecting a category restricts every dataset to that category's votes.
+        """
+        create_vote(self.tea, session_key="a")
+        create_vote(self.beach, session_key="b")
+        data = self.update(category=str(self.food.id)).json()
+        self.assertTrue(data["full"])
+        self.assertEqual(sum(data["activity_data"]["votes"]), 1)
+        self.assertEqual(sum(data["hourly_data"]["votes"]), 1)
+        self.assertEqual(data["category_data"]["labels"], ["🍕 Food"])
+
+    def test_unchanged_watermark_returns_304(self):
+        """
+        Polling with the current watermark returns an empty 304 with the ETag.
+        """
+        create_vote(self.tea)
+        first = self.update()
+        watermark = first.json()["watermark"]
+        second = self.update(watermark=watermark)
+        self.assertEqual(second.status_code, 304)
+        self.assertEqual(second["ETag"], first["ETag"])
+        self.assertEqual(second.content, b"")
+
+    def test_new_votes_return_only_changed_buckets(self):
+        """
+        After new votes, only the buckets they touched are sent back.
+        """
+        now = timezone.now()
+        create_vote(self.tea, when=now, session_key="a")
+        watermark = self.update().json()["watermark"]
+        create_vote(self.beach, when=now, session_key="b")
+        data = self.update(watermark=watermark).json()
+        self.assertFalse(data["full"])
+        self.assertEqual(data["activity_data"], [[30, 2]])
+        self.assertEqual(data["hourly_data"], [[now.hour, 2]])
+        self.assertEqual(data["category_data"], [["✈️ Travel", 1]])
+
+    def test_revote_forces_full_resync(self):
+        """
+        A revote moves an existing row between buckets, so the full datasets
+        are sent.
+        """
+        vote = create_vote(self.tea, when=timezone.now() - datetime.timedelta(days=3))
+        watermark = self.update().json()["watermark"]
+        Vote.objects.filter(id=vote.id).update(choice="B", timestamp=timezone.now())
+        data = self.update(watermark=watermark).json()
+        self.assertTrue(data["full"])
+        self.assertEqual(data["activity_data"]["votes"][-1], 1)
+
+class FunnelTests(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.food = ThisOrThatCategory.objects.create(name="Food", icon="🍕")
+        self.questions = [
+            ThisOrThat.objects.create(category=self.food, option_a=f"A{i}", option_b=f"B{i}") for i in range(4)
+        ]
+
+    def steps(self):
+        return funnels.funnel_data([{"id": self.food.id, "name": "Food", "icon": "🍕"}])[0]
+
+    def test_update_moves_voters_along_the_funnel_incrementally(self):
+        for question in self.questions:
+            create_vote(question, session_key="finisher")
+        create_vote(self.questions[0], session_key="quitter")
+        self.assertEqual(funnels.update(batch_size=2), 5)
+        funnel = self.steps()
+        # Started, 10%, 20%, 30% ... 100%: the quitter reached 25%
+        self.assertEqual(funnel["steps"], [2, 2, 2, 1, 1, 1, 1, 1, 1, 1, 1])
+        self.assertEqual(funnel["completion_rate"], 50.0)
+
+        create_vote(self.questions[1], session_key="quitter")
+        user = User.objects.create_user("fan")
+        create_vote(self.questions[2], session_key=None, user=user)
+        self.assertEqual(funnels.update(), 2)
+        self.assertEqual(self.steps()["steps"], [3, 3, 3, 2, 2, 2, 1, 1, 1, 1, 1])
+        self.assertEqual(funnels.update(), 0)
+
+    def test_replaying_a_reset_game_counts_the_voter_once(self):
+        for question in self.questions:
+            create_vote(question, session_key="again")
+        funnels.update()
+        Vote.objects.all().delete()
+        for question in self.questions:
+            create_vote(question, session_key="again")
+        funnels.update()
+        self.assertEqual(self.steps()["steps"], [1] * len(funnels.STEPS))
+
+    def test_dashboard_shows_the_funnel(self):
+        create_vote(self.questions[0], session_key="s")
+        call_command("update_funnels", stdout=io.StringIO())
+        self.client.force_login(User.objects.create_user("staff", password="pw", is_staff=True))
+        response = self.client.get(reverse("polls:analytics_dashboard"))
+        self.assertContains(response, "Completion Funnel")
+        self.assertEqual(response.context["funnel_data"][0]["started"], 1)
+
+
+class QuestionStatsTests(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.food = ThisOrThatCategory.objects.create(name="Food")
+
+    def question(self, votes_a, votes_b, **kwargs):
+        return ThisOrThat.objects.create(
+            category=self.food, option_a="A", option_b="B", votes_a=votes_a, votes_b=votes_b, **kwargs
+        )
+
+    def test_intervals_account_for_sample_size(self):
+        self.assertEqual(stats.wilson(0, 0), (0.0, 1.0))
+        low, high = stats.wilson(1, 0)
+        self.assertLess(low, 0.25)
+        self.assertAlmostEqual(high, 1.0)
+        self.assertGreater(stats.wilson(10000, 0)[0], 0.999)
+        self.assertEqual(stats.win_probability(50, 50), 0.5)
+        self.assertLess(stats.win_probability(1, 0), 0.8)
+        self.assertGreater(stats.win_probability(10000, 0), 0.9999)
+        self.assertAlmostEqual(stats.win_probability(3, 7), stats.win_probability(7, 3))
+
+    def test_question_stats_match_the_single_question_formulas(self):
+        questions = [self.question(a, b) for a, b in [(0, 0), (1, 0), (30, 70), (5000, 4990)]]
+        result = stats.question_stats()
+        self.assertEqual([int(i) for i in result["ids"]], [question.id for question in questions])
+        for index, question in enumerate(questions):
+            expected = stats.summary(question.votes_a, question.votes_b)
+            self.assertAlmostEqual(float(result["low"][index]), expected["low"])
+            self.assertAlmostEqual(float(result["high"][index]), expected["high"])
+            self.assertAlmostEqual(float(result["win_probability"][index]), expected["win_probability"], places=6)
+
+    def test_closest_battles_rank_uncertain_questions_with_enough_votes(self):
+        self.question(1, 1)  # too few votes
+        landslide = self.question(900, 100)
+        small_tie = self.question(15, 15)
+        big_tie = self.question(500, 500)
+        close = self.question(520, 480)
+        self.question(500, 500, is_active=False)
+        battles = stats.closest_battles(limit=3, min_votes=20)
+        self.assertEqual(battles, [big_tie, small_tie, close])
+        self.assertEqual(battles[0].win_probability, 0.5)
+        self.assertNotIn(landslide, battles)
+
+    @unittest.skipIf(stats.numpy is None, "numpy is not installed")
+    def test_numpy_and_python_paths_agree(self):
+        pairs = [(0, 0), (1, 0), (0, 1), (15, 15), (30, 70), (520, 480), (480, 520), (900, 100), (5000, 4990), (10**6, 3)]
+        pairs += [(500, 500)] * 3 + [(n * 37 % 400, n * 53 % 400) for n in range(40)]
+        for a, b in pairs:
+            self.question(a, b)
+        vectorised = stats.question_stats()
+        battles = stats.closest_battles(limit=12, min_votes=20)
+        with mock.patch.object(stats, "numpy", None):
+            python = stats.question_stats()
+            self.assertEqual(stats.closest_battles(limit=12, min_votes=20), battles)
+        self.assertIsInstance(python["low"], list)
+        self.assertEqual([int(i) for i in vectorised["ids"]], python["ids"])
+        for key in ("low", "high"):
+            for got, expected in zip(vectorised[key], python[key]):
+                self.assertAlmostEqual(float(got), expected, places=12)
+        # _erf approximates math.erf to within 1.5e-7
+        for got, expected in zip(vectorised["win_probability"], python["win_probability"]):
+            self.assertAlmostEqual(float(got), expected, places=6)
+
+    def test_closest_battles_without_numpy(self):
+        with mock.patch.object(stats, "numpy", None):
+            self.test_closest_battles_rank_uncertain_questions_with_enough_votes()
+            self.assertEqual(stats.question_stats(ThisOrThat.objects.none())["ids"], [])
+        self.assertEqual(len(stats.question_stats(ThisOrThat.objects.none())["ids"]), 0)
+
+    def test_dashboard_and_admin_show_the_confidence(self):
+        self.question(520, 480)
+        self.client.force_login(User.objects.create_superuser("admin", password="pw"))
+        self.assertContains(self.client.get(reverse("polls:analytics_dashboard")), "Closest Battles")
+        changelist = self.client.get(reverse("admin:polls_thisorthat_changelist"))
+        self.assertContains(changelist, "A 49%–55%")
+
+
+class SingleFlightTests(TestCase):
+    def setUp(self):
+        cache.clear()
+
+    def test_concurrent_requests_share_one_computation(self):
+        calls = []
+        started, release = threading.Event(), threading.Event()
+
+        def compute():
+            calls.append(1)
+            started.set()
+            release.wait(5)
+            return len(calls)
+
+        results = []
+        first = threading.Thread(target=lambda: results.append(singleflight.get_or_compute("k", compute, 60)))
+        first.start()
+        started.wait(5)
+        waiters = [
+            threading.Thread(target=lambda: results.append(singleflight.get_or_compute("k", compute, 60)))
+            for _ in range(3)
+        ]
+        for thread in waiters:
+            thread.start()
+        release.set()
+        for thread in [first, *waiters]:
+            thread.join(5)
+        self.assertEqual((len(calls), results), (1, [1, 1, 1, 1]))
+
+    def test_stale_value_is_served_while_another_request_refreshes(self):
+        singleflight.get_or_compute("k", lambda: "old", 0, stale_for=60)
+        cache.add("k:lock", True)
+        self.assertEqual(singleflight.get_or_compute("k", lambda: "new", 0, stale_for=60), "old")
+        cache.delete("k:lock")
+        self.assertEqual(singleflight.get_or_compute("k", lambda: "new", 0, stale_for=60), "new")
+
+    def test_analytics_viewers_share_the_snapshot(self):
+        category = ThisOrThatCategory.objects.create(name="Food")
+        create_vote(ThisOrThat.objects.create(category=category, option_a="Tea", option_b="Coffee"))
+        self.client.force_login(User.objects.create_user("staff", password="pw", is_staff=True))
+        body = json.dumps({"time_period": 30, "timezone": "UTC"})
+        url = reverse("polls:update_analytics")
+        first = self.client.post(url, data=body, content_type="application/json")
+        with self.assertNumQueries(2):  # session and user only
+            second = self.client.post(url, data=body, content_type="application/json")
+        self.assertEqual(second.json(), first.json())
+
+
+class ConditionalGetTests(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.category = ThisOrThatCategory.objects.create(name="Food")
+        self.question = ThisOrThat.objects.create(category=self.category, option_a="Tea", option_b="Coffee")
+
+    def vote(self, question, choice):
+        return self.client.post(
+            reverse("polls:vote_this_or_that", args=(question.id,)),
+            data=json.dumps({"choice": choice}), content_type="application/json",
+        )
+
+    def test_home_revalidates_until_a_vote(self):
+        """
+        The category list answers 304 to a matching ETag until a vote changes it.
+        """
+        first = self.client.get(reverse("polls:this_or_that_home"))
+        self.assertIn("public", first["Cache-Control"])
+        self.assertIn("Last-Modified", first)
+        cached = self.client.get(reverse("polls:this_or_that_home"), HTTP_IF_NONE_MATCH=first["ETag"])
+        self.assertEqual(cached.status_code, 304)
+        self.vote(self.question, "A")
+        fresh = self.client.get(reverse("polls:this_or_that_home"), HTTP_IF_NONE_MATCH=first["ETag"])
+        self.assertEqual(fresh.status_code, 200)
+
+    def test_votes_leave_the_category_row_alone(self):
+        """
+        A vote does not bump the category version, yet the summary still
+        revalidates to a fresh copy.
+        """
+        url = reverse("polls:quiz_summary", args=(self.category.id,))
+        self.vote(self.question, "A")
+        summary = self.client.get(url)
+        version = ThisOrThatCategory.objects.get(id=self.category.id).version
+        with self.captureOnCommitCallbacks(execute=True):
+            self.vote(self.question, "B")
+        self.assertEqual(ThisOrThatCategory.objects.get(id=self.category.id).version, version)
+        fresh = self.client.get(url, HTTP_IF_NONE_MATCH=summary["ETag"])
+        self.assertEqual(fresh.status_code, 200)
+        self.assertEqual(fresh.context["questions_with_results"][0]["votes_b"], 1)
+
+    def test_summary_is_private_and_per_voter(self):
+        """
+        The summary includes the voter's own picks, so it is private and its
+        ETag differs between voters.
+        """
+        self.vote(self.question, "A")
+        url = reverse("polls:quiz_summary", args=(self.category.id,))
+        mine = self.client.get(url)
+        self.assertIn("private", mine["Cache-Control"])
+        self.assertEqual(self.client.get(url, HTTP_IF_NONE_MATCH=mine["ETag"]).status_code, 304)
+        other = self.client_class().get(url, HTTP_IF_NONE_MATCH=mine["ETag"])
+        self.assertEqual(other.status_code, 200)
+
+    def test_results_etag_follows_choice_votes(self):
+        """
+        Classic results revalidate against the question's choice counts.
+        """
+        question = create_question(question_text="Best pet?", days=-1)
+        choice = question.choice_set.create(choice_text="Cat")
+        url = reverse("polls:results", args=(question.id,))
+        etag = self.client.get(url)["ETag"]
+        self.assertEqual(self.client.get(url, HTTP_IF_NONE_MATCH=etag).status_code, 304)
+        self.client.post(reverse("polls:vote", args=(question.id,)), {"choice": choice.id})
+        self.assertEqual(self.client.get(url, HTTP_IF_NONE_MATCH=etag).status_code, 200)
+
+    def test_moving_question_bumps_both_categories(self):
+        """
+        Moving a question changes both the old and the new category's version.
+        """
+        other = ThisOrThatCategory.objects.create(name="Travel")
+        self.question.category = other
+        self.question.save()
+        self.category.refresh_from_db()
+        other.refresh_from_db()
+        self.assertEqual(self.category.version, 2)
+        self.assertEqual(other.version, 1)
+
+@override_settings(STORAGES=_PROJECT_STORAGES)
+class StaticPipelineTests(TestCase):
+    def test_missing_manifest_raises_unless_debugging(self):
+        from django.contrib.staticfiles.storage import staticfiles_storage
+        with tempfile.TemporaryDirectory() as static_root, override_settings(STATIC_ROOT=static_root):
+            with self.assertRaisesMessage(ValueError, "Missing staticfiles manifest entry"):
+                staticfiles_storage.url("polls/js/this_or_that.js")
+            with override_settings(DEBUG=True):
+                self.assertEqual(staticfiles_storage.url("polls/js/this_or_that.js"), "/static/polls/js/this_or_that.js")
+
+    def test_collectstatic_writes_hashed_and_precompressed_assets(self):
+        """
+        collectstatic writes hashed copies of the game assets with gzip
+        siblings, and templates then link the hashed names.
+        """
+        with tempfile.TemporaryDirectory() as static_root, override_settings(STATIC_ROOT=static_root):
+            call_command("collectstatic", interactive=False, verbosity=0)
+            from django.contrib.staticfiles.storage import staticfiles_storage
+            hashed = staticfiles_storage.stored_name("polls/js/this_or_that.js")
+            self.assertNotEqual(hashed, "polls/js/this_or_that.js")
+            self.assertTrue(os.path.exists(os.path.join(static_root, hashed + ".gz")))
+
+            category = ThisOrThatCategory.objects.create(name="Food")
+            ThisOrThat.objects.create(category=category, option_a="Tea", option_b="Coffee")
+            response = self.client.get(reverse("polls:this_or_that", args=(category.id,)))
+            self.assertContains(response, hashed)
+            self.assertContains(response, 'type="image/avif"')
+
+
+class ImageHandler(http.server.BaseHTTPRequestHandler):
+    """Local stand-in for a remote image host that counts its requests"""
+    hits = 0
+    # Seconds between each of four parts of the body, to act like a slow host
+    drip = 0
+
+    @staticmethod
+    def body():
+        from PIL import Image
+        buffer = io.BytesIO()
+        Image.new("RGB", (1200, 600), "red").save(buffer, "PNG")
+        return buffer.getvalue()
+
+    def do_GET(self):
+        type(self).hits += 1
+        self.send_response(200)
+        self.send_header("Content-Type", "image/png")
+        self.end_headers()
+        data = self.body()
+        if not self.drip:
+            self.wfile.write(data)
+            return
+        step = -(-len(data) // 4)
+        for start in range(0, len(data), step):
+            self.wfile.write(data[start:start + step])
+            self.wfile.flush()
+            time.sleep(self.drip)
+
+    def log_message(self, *args):
+        pass
+
+class ThumbnailTests(TestCase):
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+        cls.server = http.server.HTTPServer(("127.0.0.1", 0), ImageHandler)
+        threading.Thread(target=cls.server.serve_forever, daemon=True).start()
+        cls.image_url = f"http://127.0.0.1:{cls.server.server_port}/cat.png"
+
+    @classmethod
+    def tearDownClass(cls):
+        cls.server.shutdown()
+        cls.server.server_close()
+        super().tearDownClass()
+
+    def setUp(self):
+        ImageHandler.hits = 0
+        cache.clear()
+        cache_dir = tempfile.TemporaryDirectory()
+        self.addCleanup(cache_dir.cleanup)
+        self.settings_override = override_settings(POLLS_THUMBNAIL_CACHE_DIR=cache_dir.name)
+        self.settings_override.enable()
+        self.addCleanup(self.settings_override.disable)
+        # Background evictions are started by hand
+        threads = mock.patch.object(thumbnails, "threading")
+        self.eviction_thread = threads.start().Thread
+        self.addCleanup(threads.stop)
+        category = ThisOrThatCategory.objects.create(name="Pets")
+        self.question = ThisOrThat.objects.create(
+            category=category, option_a="Cats", option_b="Dogs", option_a_image=self.image_url
+        )
+
+    def test_thumbnail_is_fetched_once_and_cached(self):
+        """
+        The remote image is fetched and resized once; later requests are
+        served from disk with immutable cache headers.
+        """
+        from PIL import Image
+        url = reverse("polls:thumbnail", args=(self.question.id, "a", 160, thumbnails.source_digest(self.image_url)))
+        first = self.client.get(url)
+        self.assertEqual(first["Cache-Control"], "public, max-age=31536000, immutable")
+        with Image.open(io.BytesIO(b"".join(first.streaming_content))) as image:
+            self.assertEqual(image.size, (160, 80))
+        self.client.get(url)
+        self.assertEqual(ImageHandler.hits, 1)
+
+    def test_stale_digest_is_rejected(self):
+        """
+        Thumbnail URLs for an image the question no longer uses are 404s, so
+        the endpoint cannot proxy arbitrary URLs.
+        """
+        url = reverse("polls:thumbnail", args=(self.question.id, "a", 160, "0" * 16))
+        self.assertEqual(self.client.get(url).status_code, 404)
+        self.assertEqual(ImageHandler.hits, 0)
+
+    def test_cache_evicts_least_recently_used(self):
+        """
+        When the cache outgrows its limit the least recently used thumbnail goes.
+        """
+        small = thumbnails.get_thumbnail(self.image_url, 160)
+        os.utime(small, (0, 0))
+        large = thumbnails.get_thumbnail(self.image_url, 320)
+        out = io.StringIO()
+        with override_settings(POLLS_THUMBNAIL_CACHE_MAX_BYTES=large.stat().st_size + 1):
+            call_command("prune_thumbnails", stdout=out)
+        self.assertIn(f"Removed 1 thumbnail(s); {large.stat().st_size} bytes left", out.getvalue())
+        self.assertFalse(small.exists())
+        self.assertTrue(large.exists())
+
+    def test_misses_evict_in_the_background_once_per_interval(self):
+        small = thumbnails.get_thumbnail(self.image_url, 160)
+        os.utime(small, (0, 0))
+        thumbnails.get_thumbnail(self.image_url, 320)
+        thumbnails.get_thumbnail(self.image_url, 640)
+        self.eviction_thread.assert_called_once()
+        self.assertTrue(small.exists())
+        with override_settings(POLLS_THUMBNAIL_CACHE_MAX_BYTES=1):
+            self.eviction_thread.call_args.kwargs["target"]()
+        self.assertEqual(list(Path(thumbnails.cache_dir()).glob("*/*.webp")), [])
+
+    def test_oversized_or_slow_sources_fall_back_to_the_original(self):
+        url = reverse("polls:thumbnail", args=(self.question.id, "a", 160, thumbnails.source_digest(self.image_url)))
+        with override_settings(POLLS_THUMBNAIL_MAX_SOURCE_BYTES=100):
+            response = self.client.get(url)
+        self.assertRedirects(response, self.image_url, fetch_redirect_response=False)
+        # Every part arrives well within the timeout, but not the whole image
+        with mock.patch.object(ImageHandler, "drip", 0.2), override_settings(POLLS_THUMBNAIL_FETCH_TIMEOUT=0.5):
+            with self.assertRaisesMessage(thumbnails.ThumbnailError, "took too long"):
+                thumbnails.get_thumbnail(self.image_url, 160)
+        self.eviction_thread.assert_not_called()
+
+    def test_urls_of_the_same_image_share_one_thumbnail(self):
+        first = thumbnails.get_thumbnail(self.image_url, 160)
+        second = thumbnails.get_thumbnail(self.image_url + "?copy", 160)
+        self.assertEqual(first, second)
+        self.assertTrue(first.name.startswith(hashlib.sha256(ImageHandler.body()).hexdigest()))
+        self.assertEqual(ImageHandler.hits, 2)
+
+    def test_thumbnail_evicted_before_it_is_served_is_made_again(self):
+        url = reverse("polls:thumbnail", args=(self.question.id, "a", 160, thumbnails.source_digest(self.image_url)))
+        path = thumbnails.get_thumbnail(self.image_url, 160)
+        path.unlink()
+        self.assertEqual(self.client.get(url).status_code, 200)
+        # Evicted between the lookup and the open
+        real = thumbnails.get_thumbnail
+        with mock.patch.object(thumbnails, "get_thumbnail", side_effect=[path.with_name("gone.webp"), real(self.image_url, 160)]):
+            response = self.client.get(url)
+        self.assertEqual(response.status_code, 200)
+        response.close()
+        self.assertEqual(ImageHandler.hits, 2)
+
+    def test_concurrent_misses_wait_for_one_fetch(self):
+        lock = f"polls:thumbnail-lock:{hashlib.sha256(self.image_url.encode()).hexdigest()}:160"
+        cache.add(lock, True)
+
+        def other_request():
+            time.sleep(0.2)
+            thumbnails._create(thumbnails.cache_dir(), self.image_url, 160)
+            cache.delete(lock)
+
+        thread = threading.Thread(target=other_request)
+        thread.start()
+        path = thumbnails.get_thumbnail(self.image_url, 160)
+        thread.join()
+        self.assertTrue(path.exists())
+        self.assertEqual(ImageHandler.hits, 1)
+
+        # A holder that never finishes leaves the waiters to fall back to the original
+        cache.add(lock.replace(":160", ":320"), True)
+        with mock.patch.object(thumbnails, "_lock_seconds", return_value=0.2):
+            with self.assertRaisesMessage(thumbnails.ThumbnailError, "not available yet"):
+                thumbnails.get_thumbnail(self.image_url, 320)
+        self.assertEqual(ImageHandler.hits, 1)
+
+    def test_game_page_links_local_thumbnails(self):
+        """
+        The game page points at local thumbnails instead of the remote original.
+        """
+        response = self.client.get(reverse("polls:this_or_that", args=(self.question.category_id,)))
+        self.assertContains(response, "/thumbnail/")
+        self.assertNotContains(response, self.image_url)
+
+
+class ShardedCounterTests(TestCase):
+    def setUp(self):
+        cache.clear()
+        ratelimit.reset()
+        self.category = ThisOrThatCategory.objects.create(name="Food")
+        self.question = ThisOrThat.objects.create(category=self.category, option_a="Tea", option_b="Coffee")
+
+    def test_unsharded_votes_update_the_question_row(self):
+        counters.add_votes(self.question, 1, 0)
+        self.question.refresh_from_db()
+        self.assertEqual((self.question.votes_a, self.question.votes_b), (1, 0))
+        self.assertFalse(CounterShard.objects.exists())
+
+    @override_settings(POLLS_SHARD_PROMOTE_WRITES_PER_SECOND=3, POLLS_COUNTER_SHARDS=4)
+    def test_hot_question_is_promoted(self):
+        """
+        A question written to faster than the threshold switches to shards.
+        """
+        for _ in range(4):
+            counters.add_votes(self.question, 1, 0)
+        self.question.refresh_from_db()
+        self.assertEqual(self.question.counter_shards, 4)
+        self.assertEqual(CounterShard.objects.filter(this_or_that=self.question).count(), 4)
+
+    def test_sharded_totals_include_pending_deltas(self):
+        """
+        Sharded writes are counted by totals() before and after folding.
+        """
+        counters.promote(self.question, 4)
+        for _ in range(5):
+            counters.add_votes(self.question, 1, 0)
+        counters.add_votes(self.question, -1, 1)
+        self.assertEqual(counters.totals(self.question), (4, 1))
+        self.question.refresh_from_db()
+        self.assertEqual(self.question.votes_a, 0)
+
+        version = ThisOrThatCategory.objects.get(id=self.category.id).version
+        counters.fold(self.question.id)
+        self.question.refresh_from_db()
+        self.assertEqual((self.question.votes_a, self.question.votes_b), (4, 1))
+        self.assertFalse(CounterShard.objects.exclude(votes_a=0, votes_b=0).exists())
+        self.assertEqual(ThisOrThatCategory.objects.get(id=self.category.id).version, version + 1)
+
+    def test_last_votes_before_a_question_goes_quiet_are_folded(self):
+        """
+        Vote, then no more votes, then read: neither vote writes the
+        question row, both are folded when the interval ends, and the
+        cooled-down question is demoted.
+        """
+        counters.promote(self.question, 4)
+        url = reverse("polls:quiz_summary", args=(self.category.id,))
+        with mock.patch.object(counters.threading, "Timer") as timer:
+            for client, choice in ((self.client, "A"), (self.client_class(), "B")):
+                with self.captureOnCommitCallbacks(execute=True):
+                    client.post(
+                        reverse("polls:vote_this_or_that", args=(self.question.id,)),
+                        data=json.dumps({"choice": choice}), content_type="application/json",
+                    )
+        self.assertEqual(self.client.get(url).context["total_votes"], 0)
+        # One fold scheduled for the end of the interval (the event log has
+        # its own flush timer); run it as the timer would
+        folds = [call for call in timer.call_args_list if call.args[1:] == (counters._fold_in_background,)]
+        self.assertEqual(len(folds), 1)
+        delay, run = folds[0].args
+        self.assertEqual(delay, counters.fold_interval())
+        run(*folds[0].kwargs["args"])
+
+        self.question.refresh_from_db()
+        self.assertEqual((self.question.votes_a, self.question.votes_b), (1, 1))
+        self.assertEqual(self.question.counter_shards, 0)
+        self.assertEqual(self.client.get(url).context["total_votes"], 2)
+
+    def test_busy_question_stays_sharded(self):
+        counters.promote(self.question, 4)
+        for _ in range(counters.promote_threshold()):
+            counters.add_votes(self.question, 1, 0)
+        counters.fold(self.question.id)
+        self.question.refresh_from_db()
+        self.assertEqual(self.question.counter_shards, 4)
+        self.assertEqual(counters.totals(self.question), (counters.promote_threshold(), 0))
+
+    def test_vote_endpoint_reports_sharded_totals(self):
+        counters.promote(self.question, 4)
+        response = self.client.post(
+            reverse("polls:vote_this_or_that", args=(self.question.id,)),
+            data=json.dumps({"choice": "B"}), content_type="application/json",
+        )
+        self.assertEqual(response.json()["votes_b"], 1)
+
+
+class BatchVoteTests(TestCase):
+    def setUp(self):
+        cache.clear()
+        ratelimit.reset()
+        category = ThisOrThatCategory.objects.create(name="Food")
+        self.questions = [
+            ThisOrThat.objects.create(category=category, option_a=f"A{i}", option_b=f"B{i}")
+            for i in range(3)
+        ]
+        self.url = reverse("polls:vote_batch")
+
+    def post(self, votes):
+        return self.client.post(self.url, data=json.dumps({"votes": votes}), content_type="application/json")
+
+    def test_batch_records_votes_and_returns_tallies(self):
+        q1, q2, q3 = self.questions
+        response = self.post([
+            {"question_id": q1.id, "choice": "A"},
+            {"question_id": q2.id, "choice": "B"},
+            {"question_id": q3.id, "choice": "A"},
+        ])
+        self.assertEqual(response.status_code, 200)
+        results = response.json()["results"]
+        self.assertEqual([r["question_id"] for r in results], [q1.id, q2.id, q3.id])
+        self.assertEqual((results[1]["votes_a"], results[1]["votes_b"]), (0, 1))
+        self.assertEqual(Vote.objects.count(), 3)
+
+    def test_batch_revotes_adjust_counters(self):
+        q1, q2, _ = self.questions
+        self.post([{"question_id": q1.id, "choice": "A"}, {"question_id": q2.id, "choice": "A"}])
+        self.post([{"question_id": q1.id, "choice": "B"}, {"question_id": q2.id, "choice": "A"}])
+        q1.refresh_from_db()
+        q2.refresh_from_db()
+        self.assertEqual((q1.votes_a, q1.votes_b), (0, 1))
+        self.assertEqual((q2.votes_a, q2.votes_b), (1, 0))
+        self.assertEqual(Vote.objects.count(), 2)
+
+    def test_unknown_question_rejects_whole_batch(self):
+        response = self.post([
+            {"question_id": self.questions[0].id, "choice": "A"},
+            {"question_id": 99999, "choice": "A"},
+        ])
+        self.assertEqual(response.status_code, 400)
+        self.assertFalse(Vote.objects.exists())
+
+    def test_batch_updates_all_counters_at_once(self):
+        with mock.patch.object(counters, "add_votes", wraps=counters.add_votes) as single:
+            self.post([{"question_id": q.id, "choice": "A"} for q in self.questions])
+        single.assert_not_called()
+        self.assertEqual(
+            list(ThisOrThat.objects.order_by("id").values_list("votes_a", flat=True)), [1, 1, 1]
+        )
+
+    @override_settings(POLLS_VOTE_RATE_PER_IP=(1, 2))
+    def test_every_vote_in_a_batch_costs_a_token(self):
+        ratelimit.reset()
+        votes = [{"question_id": q.id, "choice": "A"} for q in self.questions]
+        self.assertEqual(self.post(votes).status_code, 200)
+        # Three votes on two tokens: nothing more until the debt is paid off
+        response = self.post(votes)
+        self.assertEqual(response.status_code, 429)
+        self.assertEqual(response["Retry-After"], "2")
+
+    def test_invalid_payloads(self):
+        self.assertEqual(self.post([]).status_code, 400)
+        self.assertEqual(self.post([{"question_id": self.questions[0].id, "choice": "C"}]).status_code, 400)
+        with override_settings(POLLS_BATCH_VOTE_MAX=2):
+            votes = [{"question_id": q.id, "choice": "A"} for q in self.questions]
+            self.assertEqual(self.post(votes).status_code, 400)
+
+
+class GameFlowTests(TestCase):
+    def setUp(self):
+        cache.clear()
+        ratelimit.reset()
+        self.category = ThisOrThatCategory.objects.create(name="Food")
+        self.questions = [
+            ThisOrThat.objects.create(category=self.category, option_a=f"A{i}", option_b=f"B{i}")
+            for i in range(2)
+        ]
+
+    def vote(self, question_id):
+        return self.client.post(
+            reverse("polls:vote_this_or_that", args=(question_id,)),
+            data=json.dumps({"choice": "A"}), content_type="application/json",
+        ).json()
+
+    def test_vote_response_carries_next_question(self):
+        first, second = self.questions
+        data = self.vote(first.id)
+        self.assertEqual(data["next"]["question"]["id"], second.id)
+        self.assertEqual(data["next"]["question"]["vote_url"], reverse("polls:vote_this_or_that", args=(second.id,)))
+        self.assertEqual(data["next"]["current_question"], 2)
+        self.assertEqual(data["next"]["progress_percentage"], 50)
+        self.assertFalse(data["next"]["has_next_question"])
+
+        data = self.vote(second.id)
+        self.assertIsNone(data["next"]["question"])
+        self.assertEqual(data["next"]["progress_percentage"], 100)
+
+    def test_game_page_shows_an_unanswered_question(self):
+        self.vote(self.questions[0].id)
+        response = self.client.get(reverse("polls:this_or_that", args=(self.category.id,)))
+        self.assertEqual(response.context["question"], self.questions[1])
+        self.assertEqual(response.context["current_question"], 2)
+        self.vote(self.questions[1].id)
+        response = self.client.get(reverse("polls:this_or_that", args=(self.category.id,)))
+        self.assertRedirects(response, reverse("polls:quiz_summary", args=(self.category.id,)))
+
+    def test_summary_is_paginated_with_category_totals(self):
+        """
+        The summary shows one page of questions, with SQL percentages and the
+        voter's picks for that page, but totals over the whole category.
+        """
+        self.vote(self.questions[1].id)
+        url = reverse("polls:quiz_summary", args=(self.category.id,))
+        with mock.patch.object(views, "SUMMARY_PAGE_SIZE", 1):
+            first = self.client.get(url)
+            second = self.client.get(url, {"page": 2})
+        self.assertEqual([q["id"] for q in first.context["questions_with_results"]], [self.questions[0].id])
+        self.assertEqual(first.context["questions_with_results"][0]["percentage_a"], 50)
+        self.assertIsNone(first.context["questions_with_results"][0]["user_choice"])
+        question = second.context["questions_with_results"][0]
+        self.assertEqual((question["id"], question["user_choice"]), (self.questions[1].id, "A"))
+        self.assertEqual((question["percentage_a"], question["percentage_b"]), (100, 0))
+        self.assertEqual((second.context["total_questions"], second.context["total_votes"]), (2, 1))
+        self.assertEqual((second.context["page"], second.context["num_pages"]), (2, 2))
+        self.assertContains(first, "?page=2")
+
+
+class VoteRateLimitTests(TestCase):
+    def setUp(self):
+        # Repeats are only collapsed with a cache that every worker shares;
+        # the limiters are rebuilt once the override is gone
+        self.addCleanup(ratelimit.reset)
+        cache_dir = tempfile.TemporaryDirectory()
+        self.addCleanup(cache_dir.cleanup)
+        shared_cache = override_settings(CACHES={
+            "default": {"BACKEND": "django.core.cache.backends.filebased.FileBasedCache", "LOCATION": cache_dir.name},
+        })
+        shared_cache.enable()
+        self.addCleanup(shared_cache.disable)
+        ratelimit.reset()
+        category = ThisOrThatCategory.objects.create(name="Food")
+        self.question = ThisOrThat.objects.create(category=category, option_a="Tea", option_b="Coffee")
+        self.url = reverse("polls:vote_this_or_that", args=(self.question.id,))
+
+    def vote(self, choice, **extra):
+        return self.client.post(self.url, data=json.dumps({"choice": choice}), content_type="application/json", **extra)
+
+    def test_token_bucket_refills(self):
+        limiter = ratelimit.TokenBucketLimiter(rate=2, burst=2)
+        self.assertEqual(limiter.consume("k", now=0), 0)
+        self.assertEqual(limiter.consume("k", now=0), 0)
+        self.assertAlmostEqual(limiter.consume("k", now=0), 0.5)
+        self.assertEqual(limiter.consume("k", now=1), 0)
+
+    def test_token_bucket_charges_batches_per_vote(self):
+        limiter = ratelimit.TokenBucketLimiter(rate=2, burst=2)
+        # Let through on one token, leaving three to pay off
+        self.assertEqual(limiter.consume("k", now=0, count=5), 0)
+        self.assertAlmostEqual(limiter.consume("k", now=1), 1)
+        self.assertEqual(limiter.consume("k", now=2), 0)
+
+    @override_settings(POLLS_VOTE_RATE_PER_VOTER=(1, 3), POLLS_REVOTE_COLLAPSE_SECONDS=0)
+    def test_flood_from_one_voter_gets_429(self):
+        ratelimit.reset()
+        # The first vote has no session cookie yet, so only the IP bucket sees it
+        statuses = [self.vote("AB"[i % 2]).status_code for i in range(5)]
+        self.assertEqual(statuses, [200, 200, 200, 200, 429])
+        response = self.vote("A")
+        self.assertEqual(response["Retry-After"], "1")
+        self.assertEqual(Vote.objects.count(), 1)
+
+    @override_settings(POLLS_VOTE_RATE_PER_IP=(1, 2))
+    def test_flood_from_one_ip_gets_429(self):
+        ratelimit.reset()
+        for i in range(2):
+            self.assertEqual(self.vote("A", REMOTE_ADDR="10.0.0.1").status_code, 200)
+            self.client.cookies.clear()
+        self.assertEqual(self.vote("A", REMOTE_ADDR="10.0.0.1").status_code, 429)
+        self.assertEqual(self.vote("A", REMOTE_ADDR="10.0.0.2").status_code, 200)
+
+    def test_identical_revote_is_answered_without_database_work(self):
+        first = self.vote("A").json()
+        # Only the session is loaded, to tell who the voter is
+        with self.assertNumQueries(1):
+            repeat = self.vote("A").json()
+        self.assertEqual(repeat, first)
+
+    def test_no_collapse_with_a_per_process_cache(self):
+        with override_settings(CACHES={"default": {"BACKEND": "django.core.cache.backends.locmem.LocMemCache"}}):
+            ratelimit.reset()
+            self.assertFalse(ratelimit.shared_cache())
+            self.vote("A")
+            # Deleted behind this worker's back, as another worker's reset would
+            Vote.objects.all().delete()
+            self.vote("A")
+            self.assertEqual(Vote.objects.count(), 1)
+
+    def test_reset_in_another_worker_stops_the_collapse(self):
+        self.vote("A")
+        # Another worker's module state: only the shared cache is common
+        ratelimit.reset()
+        with self.assertNumQueries(1):
+            self.assertEqual(self.vote("A").json()["votes_a"], 1)
+        with self.captureOnCommitCallbacks(execute=True):
+            voting.reset_votes(Vote.objects.filter(this_or_that=self.question))
+        self.assertEqual(self.vote("A").json()["votes_a"], 1)
+        self.assertEqual(Vote.objects.count(), 1)
+
+    def test_collapse_is_keyed_on_the_session_not_the_cookie(self):
+        self.client.cookies[settings.SESSION_COOKIE_NAME] = "not-a-session-key"
+        self.vote("A")
+        session_key = self.client.cookies[settings.SESSION_COOKIE_NAME].value
+        self.assertNotEqual(session_key, "not-a-session-key")
+        self.assertIsNotNone(ratelimit.recent_votes.get(f"s:{session_key}", self.question.id)[0])
+        self.assertIsNone(ratelimit.recent_votes.get("s:not-a-session-key", self.question.id)[0])
+
+    def test_collapse_follows_the_user_across_sessions(self):
+        user = User.objects.create_user("voter", password="pw")
+        self.client.force_login(user)
+        other = self.client_class()
+        other.force_login(user)
+        self.vote("A")
+        other.post(self.url, data=json.dumps({"choice": "B"}), content_type="application/json")
+        # Back in the first session: A again is a change, not a repeat
+        self.assertEqual(self.vote("A").json()["votes_a"], 1)
+        self.assertEqual(Vote.objects.get(user=user).choice, "A")
+
+    def test_changed_choice_is_not_collapsed(self):
+        self.vote("A")
+        self.vote("B")
+        response = self.vote("A").json()
+        self.assertEqual((response["votes_a"], response["votes_b"]), (1, 0))
+
+
+class ArchiveVotesTests(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.archive_dir = tempfile.TemporaryDirectory()
+        self.addCleanup(self.archive_dir.cleanup)
+        self.settings_override = override_settings(POLLS_VOTE_ARCHIVE_DIR=self.archive_dir.name)
+        self.settings_override.enable()
+        self.addCleanup(self.settings_override.disable)
+
+        category = ThisOrThatCategory.objects.create(name="Food", icon="F")
+        self.question = ThisOrThat.objects.create(category=category, option_a="Tea", option_b="Coffee")
+        old = timezone.now() - datetime.timedelta(days=100)
+        self.old_votes = [
+            create_vote(self.question, "A", when=old, session_key="s1"),
+            create_vote(self.question, "B", when=old, session_key="s2"),
+            create_vote(self.question, "B", when=old + datetime.timedelta(hours=3), session_key="s3"),
+        ]
+        user = User.objects.create_user("voter")
+        self.user_vote = create_vote(self.question, "A", when=old, session_key=None, user=user)
+        self.recent_vote = create_vote(self.question, "A", session_key="s4")
+
+    def test_old_anonymous_votes_move_to_archive_and_rollups(self):
+        call_command("archive_votes", "--days", "90", "--batch-size", "2", stdout=io.StringIO())
+        self.assertEqual(
+            set(Vote.objects.values_list("id", flat=True)), {self.user_vote.id, self.recent_vote.id}
+        )
+        self.assertEqual(sum(r.votes_a + r.votes_b for r in VoteRollup.objects.all()), 3)
+        self.assertEqual(VoteRollup.objects.count(), 2)
+        archived = list(archive.iter_archived_votes())
+        self.assertEqual(sorted(row["id"] for row in archived), sorted(v.id for v in self.old_votes))
+
+    def test_analytics_still_count_archived_votes(self):
+        before = (
+            views.get_category_data()["votes"],
+            sum(views.get_hourly_data()["votes"]),
+            sum(views.get_activity_data(365)["votes"]),
+        )
+        archive.archive_votes(days=90)
+        after = (
+            views.get_category_data()["votes"],
+            sum(views.get_hourly_data()["votes"]),
+            sum(views.get_activity_data(365)["votes"]),
+        )
+        self.assertEqual(before, ([5], 5, 5))
+        self.assertEqual(after, before)
+
+    def test_export_includes_archived_votes(self):
+        archive.archive_votes(days=90)
+        output = io.StringIO()
+        call_command("export_votes", stdout=output)
+        lines = output.getvalue().strip().splitlines()
+        self.assertEqual(len(lines), 1 + 5)
+        self.assertTrue(lines[0].startswith("id,this_or_that_id"))
+
+    def test_retention_shorter_than_session_lifetime_is_refused(self):
+        with self.assertRaises(CommandError):
+            call_command("archive_votes", "--days", "1", stdout=io.StringIO())
+
+
+IPHONE_UA = (
+    "Mozilla/5.0 (iPhone; CPU iPhone OS 17_0 like Mac OS X) AppleWebKit/605.1.15 "
+    "(KHTML, like Gecko) Version/17.0 Mobile/15E148 Safari/604.1"
+)
+DESKTOP_CHROME_UA = (
+    "Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 "
+    "(KHTML, like Gecko) Chrome/126.0.0.0 Safari/537.36"
+)
+
+
+class UserAgentTests(TestCase):
+    def setUp(self):
+        cache.clear()
+        ratelimit.reset()
+        useragents.clear_cache()
+        self.addCleanup(useragents.clear_cache)
+        category = ThisOrThatCategory.objects.create(name="Food")
+        self.questions = [
+            ThisOrThat.objects.create(category=category, option_a=f"A{i}", option_b=f"B{i}")
+            for i in range(3)
+        ]
+
+    def vote(self, question, user_agent):
+        return self.client.post(
+            reverse("polls:vote_this_or_that", args=(question.id,)),
+            data=json.dumps({"choice": "A"}), content_type="application/json",
+            HTTP_USER_AGENT=user_agent,
+        )
+
+    def test_parse(self):
+        self.assertEqual(useragents.parse(IPHONE_UA), (UserAgent.MOBILE, UserAgent.SAFARI))
+        self.assertEqual(useragents.parse(DESKTOP_CHROME_UA), (UserAgent.DESKTOP, UserAgent.CHROME))
+        self.assertEqual(useragents.parse("Googlebot/2.1")[0], UserAgent.BOT)
+        self.assertEqual(
+            useragents.parse("Mozilla/5.0 (Linux; Android 14; SM-X910) Chrome/126.0 Safari/537.36")[0],
+            UserAgent.TABLET,
+        )
+
+    def test_backfill_migration_keeps_its_own_classifier(self):
+        backfill = importlib.import_module("polls.migrations.0008_backfill_user_agents")
+        self.assertFalse(hasattr(backfill, "useragents") or hasattr(backfill, "UserAgent"))
+        for string in (IPHONE_UA, DESKTOP_CHROME_UA, "Googlebot/2.1", "Opera/9.80 (Windows NT 6.1)"):
+            self.assertEqual(backfill.parse(string), useragents.parse(string))
+            self.assertEqual(backfill.digest(string), UserAgent.objects.get(id=useragents.agent_id(string)).digest)
+
+    def test_votes_share_one_interned_row(self):
+        for question in self.questions:
+            self.vote(question, IPHONE_UA)
+        self.assertEqual(UserAgent.objects.count(), 1)
+        self.assertEqual(set(Vote.objects.values_list("agent__string", flat=True)), {IPHONE_UA})
+        self.assertEqual(Vote.objects.first().user_agent, IPHONE_UA)
+
+    def test_device_breakdown(self):
+        self.vote(self.questions[0], IPHONE_UA)
+        self.client.cookies.clear()
+        self.vote(self.questions[0], DESKTOP_CHROME_UA)
+        self.client.cookies.clear()
+        self.vote(self.questions[1], IPHONE_UA)
+        self.assertEqual(views.get_device_data(7), {"labels": ["Mobile", "Desktop"], "votes": [2, 1]})
+
+
+class VoteCategoryTests(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.food = ThisOrThatCategory.objects.create(name="Food")
+        self.travel = ThisOrThatCategory.objects.create(name="Travel")
+        self.question = ThisOrThat.objects.create(category=self.food, option_a="Tea", option_b="Coffee")
+
+    def test_votes_record_the_question_category(self):
+        vote = create_vote(self.question)
+        self.assertEqual(vote.category_id, self.food.id)
+
+    def test_moving_a_question_moves_its_votes(self):
+        create_vote(self.question, session_key="s1")
+        create_vote(self.question, session_key="s2")
+        self.question.category = self.travel
+        self.question.save()
+        self.assertEqual(Vote.objects.filter(category=self.travel).count(), 2)
+        self.assertEqual(views.get_category_data()["labels"], [f"{self.travel.icon} Travel"])
+
+    @unittest.skipUnless(connection.vendor == "sqlite", "query plan text is SQLite-specific")
+    def test_progress_lookup_is_a_single_table_index_scan(self):
+        plan = Vote.objects.filter(category=self.food, session_key="s1").values("this_or_that_id").explain()
+        self.assertIn("polls_vote_cat_session_idx", plan)
+        self.assertNotIn("polls_thisorthat", plan)
+
+    def test_backfill_migration_drops_votes_of_missing_questions(self):
+        from django.apps import apps
+        backfill = importlib.import_module("polls.migrations.0011_backfill_vote_category")
+        kept = create_vote(self.question, session_key="s1")
+        orphan = create_vote(self.question, session_key="s2")
+        Vote.objects.filter(id=kept.id).update(category=self.travel)
+        # Left behind by a raw delete of its question
+        Vote.objects.filter(id=orphan.id).update(this_or_that_id=self.question.id + 1000)
+        rollup = VoteRollup.objects.create(this_or_that=self.question, category=self.travel, hour=timezone.now())
+        with self.assertLogs(backfill.logger, "WARNING"):
+            backfill.backfill_categories(apps, None)
+        self.assertEqual(list(Vote.objects.values_list("id", "category_id")), [(kept.id, self.food.id)])
+        rollup.refresh_from_db()
+        self.assertEqual(rollup.category_id, self.food.id)
+
+
+class ResetVotesTests(TestCase):
+    def setUp(self):
+        cache.clear()
+        ratelimit.reset()
+        self.category = ThisOrThatCategory.objects.create(name="Food")
+        self.questions = [
+            ThisOrThat.objects.create(category=self.category, option_a=f"A{i}", option_b=f"B{i}")
+            for i in range(3)
+        ]
+
+    def vote(self, question, choice):
+        return self.client.post(
+            reverse("polls:vote_this_or_that", args=(question.id,)),
+            data=json.dumps({"choice": choice}), content_type="application/json",
+        )
+
+    def totals(self):
+        return list(ThisOrThat.objects.order_by("id").values_list("votes_a", "votes_b"))
+
+    def test_play_again_takes_votes_back_out_of_totals(self):
+        for question, choice in zip(self.questions, "ABA"):
+            self.vote(question, choice)
+        self.assertEqual(self.totals(), [(1, 0), (0, 1), (1, 0)])
+        with self.captureOnCommitCallbacks(execute=True):
+            response = self.client.get(reverse("polls:this_or_that", args=(self.category.id,)), {"reset": 1})
+        self.assertEqual(response.status_code, 302)
+        self.assertEqual(self.totals(), [(0, 0), (0, 0), (0, 0)])
+        self.assertFalse(Vote.objects.exists())
+
+        # Voting the same way again right after the reset is recorded, not collapsed
+        self.vote(self.questions[0], "A")
+        self.assertEqual(self.totals()[0], (1, 0))
+
+    def test_reset_uses_constant_number_of_queries(self):
+        for i in range(20):
+            create_vote(self.questions[i % 3], "AB"[i % 2], session_key="s")
+        ThisOrThat.objects.update(votes_a=10, votes_b=10)
+        # Savepoint, grouped deltas, question lookup, counter update, version bump, delete, release
+        with self.assertNumQueries(7):
+            removed = voting.reset_votes(Vote.objects.filter(session_key="s"))
+        self.assertEqual(removed, 20)
+        self.assertEqual(self.totals(), [(6, 7), (7, 6), (7, 7)])
+
+    def test_admin_action_resets_whole_category_in_batches(self):
+        other = ThisOrThatCategory.objects.create(name="Travel")
+        kept = ThisOrThat.objects.create(category=other, option_a="Sea", option_b="Hills", votes_a=1)
+        create_vote(kept)
+        for i in range(7):
+            create_vote(self.questions[i % 3], session_key=f"s{i}")
+        for question in self.questions:
+            ThisOrThat.objects.filter(id=question.id).update(votes_a=question.vote_set.count())
+        admin_user = User.objects.create_superuser("admin", "admin@example.com", "pw")
+        self.client.force_login(admin_user)
+        with mock.patch("polls.admin.ThisOrThatCategoryAdmin.reset_batch_size", 3):
+            self.client.post(
+                reverse("admin:polls_thisorthatcategory_changelist"),
+                {"action": "reset_votes", "_selected_action": [self.category.id]},
+            )
+        self.assertEqual(Vote.objects.filter(category=self.category).count(), 0)
+        self.assertEqual(self.totals()[:3], [(0, 0), (0, 0), (0, 0)])
+        self.assertEqual(Vote.objects.filter(category=other).count(), 1)
+
+
+class GenerateLoadDataTests(TestCase):
+    def setUp(self):
+        # Interned user agent ids must not outlive the test's transaction
+        useragents.clear_cache()
+        self.addCleanup(useragents.clear_cache)
+
+    def generate(self, prefix, seed=7):
+        call_command(
+            "generate_load_data", "--seed", str(seed), "--prefix", prefix, "--categories", "2",
+            "--questions", "5", "--users", "3", "--sessions", "30", "--votes", "150",
+            "--end", "2026-01-31", stdout=io.StringIO(),
+        )
+        return Vote.objects.filter(this_or_that__option_a__startswith=f"{prefix}{seed} ")
+
+    def test_same_seed_gives_same_votes(self):
+        def shape(prefix):
+            rows = self.generate(prefix).order_by("id").values_list(
+                "this_or_that__option_a", "choice", "timestamp", "user_id", "ip_address"
+            )
+            return [(option[len(prefix):], choice, timestamp, user_id is None, ip) for option, choice, timestamp, user_id, ip in rows]
+        first = shape("one")
+        second = shape("two")
+        self.assertEqual(first, second)
+        self.assertTrue(first)
+
+    def test_generated_votes_are_consistent(self):
+        votes = self.generate("load")
+        # One vote per voter and question, like the real vote path
+        self.assertEqual(
+            votes.values("this_or_that", "user", "session_key").distinct().count(), votes.count()
+        )
+        self.assertFalse(votes.exclude(category_id=F("this_or_that__category_id")).exists())
+        self.assertFalse(votes.filter(timestamp__gte=datetime.datetime(2026, 2, 1, tzinfo=datetime.timezone.utc)).exists())
+        for question in ThisOrThat.objects.filter(option_a__startswith="load7 "):
+            self.assertEqual(question.votes_a, question.vote_set.filter(choice="A").count())
+            self.assertEqual(question.votes_b, question.vote_set.filter(choice="B").count())
+
+    def test_categories_stay_off_the_public_pages(self):
+        self.generate("load")
+        self.assertFalse(ThisOrThatCategory.objects.filter(name__startswith="load7 ", is_active=True).exists())
+        response = self.client.get(reverse("polls:this_or_that_home"))
+        self.assertNotContains(response, "load7 category")
+
+    def test_rerun_with_the_same_seed_and_prefix_is_refused(self):
+        votes = self.generate("load").count()
+        with self.assertRaisesMessage(CommandError, "Load data for load7 already exists"):
+            self.generate("load")
+        self.assertEqual(Vote.objects.filter(this_or_that__option_a__startswith="load7 ").count(), votes)
+        self.assertTrue(self.generate("load", seed=8).exists())
+
+
+class SnapshotTests(TestCase):
+    def setUp(self):
+        cache.clear()
+        ratelimit.reset()
+        snapshot_dir = tempfile.TemporaryDirectory()
+        self.addCleanup(snapshot_dir.cleanup)
+        self.settings_override = override_settings(POLLS_SNAPSHOT_DIR=snapshot_dir.name, POLLS_SNAPSHOT_MAX_AGE=0)
+        self.settings_override.enable()
+        self.addCleanup(self.settings_override.disable)
+        threading_patch = mock.patch.object(snapshots, "threading")
+        self.threading = threading_patch.start()
+        self.addCleanup(threading_patch.stop)
+        self.category = ThisOrThatCategory.objects.create(name="Food")
+        self.question = ThisOrThat.objects.create(category=self.category, option_a="Tea", option_b="Coffee")
+        self.poll = create_question(question_text="Best pet?", days=-1)
+        self.choice = self.poll.choice_set.create(choice_text="Cat")
+
+    def snapshot(self, url_path):
+        path = snapshots.snapshot_path(url_path)
+        return path.read_text() if path.exists() else None
+
+    def test_publish_renders_only_changed_pages(self):
+        written, unchanged, removed = snapshots.publish()
+        summary = reverse("polls:quiz_summary", args=(self.category.id,))
+        results = reverse("polls:results", args=(self.poll.id,))
+        self.assertCountEqual(written, [reverse("polls:this_or_that_home"), summary, results])
+        self.assertIn("Tea", self.snapshot(summary))
+        self.assertIn("Cat", self.snapshot(results))
+
+        written, unchanged, removed = snapshots.publish()
+        self.assertEqual(written, [])
+
+        self.category.name = "Drinks"
+        self.category.save()
+        written, unchanged, removed = snapshots.publish()
+        self.assertCountEqual(written, [reverse("polls:this_or_that_home"), summary])
+        self.assertIn("Drinks", self.snapshot(summary))
+
+        self.category.is_active = False
+        self.category.save()
+        written, unchanged, removed = snapshots.publish()
+        self.assertEqual(removed, [summary])
+        self.assertIsNone(self.snapshot(summary))
+
+    def test_changes_expire_snapshots_past_the_maximum_age(self):
+        snapshots.publish()
+        summary = reverse("polls:quiz_summary", args=(self.category.id,))
+        results = reverse("polls:results", args=(self.poll.id,))
+        with override_settings(POLLS_SNAPSHOT_MAX_AGE=3600), self.captureOnCommitCallbacks(execute=True):
+            self.client.post(
+                reverse("polls:vote_this_or_that", args=(self.question.id,)),
+                data=json.dumps({"choice": "A"}), content_type="application/json",
+            )
+        self.assertIsNotNone(self.snapshot(summary))
+        with self.captureOnCommitCallbacks(execute=True):
+            self.client.post(
+                reverse("polls:vote_this_or_that", args=(self.question.id,)),
+                data=json.dumps({"choice": "B"}), content_type="application/json",
+            )
+        self.assertIsNone(self.snapshot(summary))
+        self.assertIsNone(self.snapshot(reverse("polls:this_or_that_home")))
+        self.client.post(reverse("polls:vote", args=(self.poll.id,)), {"choice": self.choice.id})
+        self.assertIsNone(self.snapshot(results))
+        self.assertIn(summary, snapshots.publish()[0])
+
+    def test_young_snapshots_expire_when_they_reach_the_maximum_age(self):
+        snapshots.publish()
+        summary = reverse("polls:quiz_summary", args=(self.category.id,))
+        results = reverse("polls:results", args=(self.poll.id,))
+        with override_settings(POLLS_SNAPSHOT_MAX_AGE=3600):
+            snapshots.expire([summary, results])
+            snapshots.expire([summary])
+        self.assertIsNotNone(self.snapshot(summary))
+        # One timer per snapshot file, however many changes arrive meanwhile
+        timers = self.threading.Timer.call_args_list
+        self.assertEqual(len(timers), 2)
+        delay, callback = timers[0].args
+        self.assertGreater(delay, 3590)
+
+        # A page published again in between keeps its new snapshot
+        os.utime(snapshots.snapshot_path(results), (0, 0))
+        for timer in timers:
+            timer.args[1](*timer.kwargs["args"])
+        self.assertIsNone(self.snapshot(summary))
+        self.assertIsNotNone(self.snapshot(results))
+
+
+class CacheWarmupTests(TransactionTestCase):
+    def setUp(self):
+        cache.clear()
+        self.category = ThisOrThatCategory.objects.create(name="Food")
+        self.question = ThisOrThat.objects.create(category=self.category, option_a="Tea", option_b="Coffee")
+        create_vote(self.question)
+
+    def test_warm_caches_reports_every_item(self):
+        out = io.StringIO()
+        call_command("warm_caches", stdout=out)
+        output = out.getvalue()
+        self.assertIn("category stats:", output)
+        self.assertIn("dashboard:", output)
+        self.assertIn("category results: Food:", output)
+
+    def test_home_after_warmup_only_checks_versions(self):
+        """
+        Once warmed, the home page only runs the version aggregate and
+        looks up the latest vote.
+        """
+        from .warmup import warm_caches
+        warm_caches(workers=1)
+        with self.assertNumQueries(2):
+            response = self.client.get(reverse("polls:this_or_that_home"))
+        self.assertContains(response, "1 votes")
+
+
+    @override_settings(POLLS_WARM_CACHES_ON_STARTUP=True)
+    def test_startup_warmup_runs_in_server_processes_only(self):
+        from django.apps import apps
+        from . import warmup
+        with mock.patch.object(warmup, "warm_caches_in_background") as warm:
+            apps.get_app_config("polls").ready()
+            call_command("check", stdout=io.StringIO())
+            warm.assert_not_called()
+            # What gunicorn, uvicorn and runserver load
+            for module in ("mysite.wsgi", "mysite.asgi"):
+                with mock.patch.dict(sys.modules):
+                    sys.modules.pop(module, None)
+                    importlib.import_module(module)
+            self.assertEqual(warm.call_args_list, [mock.call(0)] * 2)
+            with override_settings(POLLS_WARM_CACHES_ON_STARTUP=False):
+                self.assertIsNone(warmup.warm_on_startup())
+
+    def test_warm_caches_warns_about_a_per_process_cache(self):
+        err = io.StringIO()
+        call_command("warm_caches", "--workers", "1", stdout=io.StringIO(), stderr=err)
+        self.assertIn("local to this process", err.getvalue())
+
+
+class StressVotesTests(TransactionTestCase):
+    def setUp(self):
+        cache.clear()
+        useragents.clear_cache()
+        self.addCleanup(useragents.clear_cache)
+
+    def stress(self, *args):
+        out = io.StringIO()
+        call_command(
+            "stress_votes", "--threads", "3", "--ops", "15", "--questions", "2", *args,
+            stdout=out, stderr=io.StringIO(),
+        )
+        return out.getvalue()
+
+    def test_counters_match_after_concurrent_votes(self):
+        output = self.stress("--reset-rate", "0.2")
+        self.assertIn("45 requests", output)
+        self.assertIn("Counters match the Vote table.", output)
+        self.assertFalse(ThisOrThatCategory.objects.filter(name__startswith="Stress test").exists())
+
+    def test_lost_counter_update_fails_the_run(self):
+        with mock.patch.object(counters, "add_votes"):
+            with self.assertRaisesMessage(CommandError, "Counters do not match votes"):
+                self.stress("--reset-rate", "0")
+
+
+class VoteEventLogTests(TestCase):
+    def setUp(self):
+        cache.clear()
+        ratelimit.reset()
+        root = tempfile.TemporaryDirectory()
+        self.addCleanup(root.cleanup)
+        self.root = root.name
+        settings_override = override_settings(POLLS_VOTE_EVENT_DIR=self.root)
+        settings_override.enable()
+        self.addCleanup(settings_override.disable)
+        eventlog.reset()
+        self.addCleanup(eventlog.reset)
+        self.category = ThisOrThatCategory.objects.create(name="Food")
+        self.questions = [
+            ThisOrThat.objects.create(category=self.category, option_a=f"A{i}", option_b=f"B{i}")
+            for i in range(2)
+        ]
+
+    def vote(self, question, choice):
+        with self.captureOnCommitCallbacks(execute=True):
+            self.client.post(
+                reverse("polls:vote_this_or_that", args=(question.id,)),
+                data=json.dumps({"choice": choice}), content_type="application/json",
+            )
+
+    def events(self):
+        eventlog.event_log.flush()
+        return list(eventlog.iter_events(Path(self.root)))
+
+    def test_votes_revotes_and_resets_are_logged(self):
+        first, second = self.questions
+        self.vote(first, "A")
+        self.vote(first, "B")
+        self.vote(second, "A")
+        with self.captureOnCommitCallbacks(execute=True):
+            self.client.get(reverse("polls:this_or_that", args=(self.category.id,)), {"reset": 1})
+        events = self.events()
+        self.assertEqual([event["k"] for event in events], ["vote", "revote", "vote", "reset"])
+        self.assertEqual(events[1]["d"], [[first.id, self.category.id, -1, 1]])
+        self.assertEqual(len({event["v"] for event in events}), 1)
+        self.assertEqual(sorted(events[3]["d"]), sorted([
+            [first.id, self.category.id, 0, -1], [second.id, self.category.id, -1, 0],
+        ]))
+
+    def test_idle_worker_writes_its_buffer_after_the_flush_interval(self):
+        log = eventlog.EventLog(self.root, buffer_events=100, flush_seconds=60)
+        self.addCleanup(log.close)
+        with mock.patch.object(eventlog.threading, "Timer") as timer:
+            log.append({"k": "vote", "d": []})
+            log.append({"k": "vote", "d": []})
+        # One timer for the buffer, fired as it would be after 60 idle seconds
+        timer.assert_called_once_with(60, log._flush_later)
+        self.assertEqual(list(eventlog.iter_events(Path(self.root))), [])
+        timer.call_args.args[1]()
+        self.assertEqual(len(list(eventlog.iter_events(Path(self.root)))), 2)
+        # The next event starts a new timer
+        with mock.patch.object(eventlog.threading, "Timer") as timer:
+            log.append({"k": "vote", "d": []})
+        timer.assert_called_once()
+
+    def test_rolled_back_votes_are_not_logged(self):
+        with mock.patch.object(counters, "add_votes", side_effect=RuntimeError("boom")):
+            self.vote(self.questions[0], "A")
+        self.assertEqual(self.events(), [])
+        self.assertFalse(Vote.objects.exists())
+
+    def test_replay_rebuilds_drifted_counters(self):
+        first, second = self.questions
+        self.vote(first, "A")
+        self.vote(second, "B")
+        ThisOrThat.objects.update(votes_a=40, votes_b=2)
+        # A torn line from a crash mid-write is skipped
+        eventlog.event_log.flush()
+        with open(eventlog.segments(Path(self.root))[-1], "ab") as handle:
+            handle.write(b'{"t": 1, "k": "vo')
+
+        out = io.StringIO()
+        call_command("replay_votes", stdout=out)
+        self.assertIn("Replayed 2 event(s)", out.getvalue())
+        self.assertIn("2 counter(s) differ", out.getvalue())
+        self.assertEqual(ThisOrThat.objects.get(id=first.id).votes_a, 40)
+
+        call_command("replay_votes", "--apply", stdout=io.StringIO())
+        self.assertEqual(
+            list(ThisOrThat.objects.order_by("id").values_list("votes_a", "votes_b")), [(1, 0), (0, 1)]
+        )
+
+    def test_replay_skips_questions_with_votes_from_before_the_log(self):
+        first, second = self.questions
+        # Inserted without going through the log, like generate_load_data does
+        create_vote(first, "B", when=timezone.now() - datetime.timedelta(days=30), session_key="old")
+        ThisOrThat.objects.filter(id=first.id).update(votes_b=1)
+        self.vote(first, "A")
+        self.vote(second, "A")
+        ThisOrThat.objects.filter(id=second.id).update(votes_a=5)
+
+        out = io.StringIO()
+        call_command("replay_votes", "--apply", stdout=out)
+        self.assertIn("Skipped 1 question(s) with history from before events-", out.getvalue())
+        self.assertEqual(
+            list(ThisOrThat.objects.order_by("id").values_list("votes_a", "votes_b")), [(1, 1), (1, 0)]
+        )
+
+
+class QuestionSearchTests(TestCase):
+    def setUp(self):
+        self.food = ThisOrThatCategory.objects.create(name="Food")
+        self.travel = ThisOrThatCategory.objects.create(name="Travel")
+        self.pizza = ThisOrThat.objects.create(category=self.food, option_a="Pizza", option_b="Burgers")
+        self.beach = ThisOrThat.objects.create(category=self.travel, option_a="Beach", option_b="Mountains")
+
+    def search(self, term, **params):
+        response = self.client.get(reverse("polls:search_questions"), {"q": term, **params})
+        self.assertEqual(response.status_code, 200)
+        return [result["id"] for result in response.json()["results"]]
+
+    def test_prefix_search_over_options_and_category_names(self):
+        self.assertEqual(self.search("piz"), [self.pizza.id])
+        self.assertEqual(self.search("MOUNTAIN"), [self.beach.id])
+        self.assertEqual(self.search("travel"), [self.beach.id])
+        # Every word has to match
+        self.assertEqual(self.search("pizza beach"), [])
+        self.assertEqual(self.search("  !!  "), [])
+
+    def test_option_matches_rank_above_category_matches(self):
+        named = ThisOrThat.objects.create(category=self.food, option_a="Travel mug", option_b="Flask")
+        self.assertEqual(self.search("travel"), [named.id, self.beach.id])
+        self.assertEqual(self.search("travel", limit=1), [named.id])
+
+    def test_inactive_questions_do_not_crowd_out_results(self):
+        ThisOrThat.objects.bulk_create([
+            ThisOrThat(category=self.food, option_a="Kiwi", option_b="Mango", is_active=False) for _ in range(15)
+        ])
+        call_command("rebuild_search_index", stdout=io.StringIO())
+        active = ThisOrThat.objects.create(category=self.food, option_a="Kiwi", option_b="Mango")
+        self.assertEqual(self.search("kiwi", limit=1), [active.id])
+
+    def test_index_follows_edits_renames_and_deletes(self):
+        self.pizza.option_a = "Pasta"
+        self.pizza.save()
+        self.assertEqual(self.search("pizza"), [])
+        self.assertEqual(self.search("pasta"), [self.pizza.id])
+
+        self.food.name = "Cuisine"
+        self.food.save()
+        self.assertEqual(self.search("cuisine"), [self.pizza.id])
+
+        self.food.is_active = False
+        self.food.save()
+        self.assertEqual(self.search("pasta"), [])
+
+        self.beach.delete()
+        self.assertEqual(self.search("beach"), [])
+
+    def test_rebuild_indexes_bulk_created_questions(self):
+        bulk = ThisOrThat.objects.bulk_create([ThisOrThat(category=self.food, option_a="Sushi", option_b="Ramen")])
+        self.assertEqual(self.search("sushi"), [])
+        call_command("rebuild_search_index", stdout=io.StringIO())
+        self.assertEqual(self.search("sushi"), [bulk[0].id])
+
+    def test_admin_search_uses_the_index(self):
+        admin_user = User.objects.create_superuser("admin", "admin@example.com", "pw")
+        self.client.force_login(admin_user)
+        response = self.client.get(reverse("admin:polls_thisorthat_changelist"), {"q": "burg"})
+        self.assertEqual(list(response.context["cl"].queryset), [self.pizza])
+
+        create_vote(self.pizza, user=admin_user, session_key=None)
+        create_vote(self.beach)
+        response = self.client.get(reverse("admin:polls_vote_changelist"), {"q": "mountains"})
+        self.assertEqual([vote.this_or_that_id for vote in response.context["cl"].queryset], [self.beach.id])
+        response = self.client.get(reverse("admin:polls_vote_changelist"), {"q": "admin"})
+        self.assertEqual([vote.user_id for vote in response.context["cl"].queryset], [admin_user.id])
+
+
+class JsonApiTests(TestCase):
+    def setUp(self):
+        cache.clear()
+        ratelimit.reset()
+        self.food = ThisOrThatCategory.objects.create(name="Food")
+        self.travel = ThisOrThatCategory.objects.create(name="Travel")
+        self.questions = [
+            ThisOrThat.objects.create(category=self.food, option_a=f"A{i}", option_b=f"B{i}", votes_a=i)
+            for i in range(5)
+        ]
+        self.beach = ThisOrThat.objects.create(category=self.travel, option_a="Beach", option_b="Mountains")
+
+    def get(self, name, **params):
+        return self.client.get(reverse(f"polls:{name}"), params)
+
+    def test_keyset_pages_cover_every_row_once(self):
+        seen = []
+        url = reverse("polls:api_questions") + "?limit=2&category=%d" % self.food.id
+        while url:
+            data = self.client.get(url).json()
+            seen.extend(row["id"] for row in data["results"])
+            url = data["next"]
+        self.assertEqual(seen, [question.id for question in self.questions])
+
+    def test_deep_pages_run_the_same_queries_as_the_first(self):
+        # Latest vote, category versions, then the page itself
+        with self.assertNumQueries(3):
+            first = self.get("api_questions", limit=2)
+        with self.assertNumQueries(3):
+            deep = self.get("api_questions", limit=2, after=self.questions[3].id)
+        self.assertEqual([row["id"] for row in deep.json()["results"]], [self.questions[4].id, self.beach.id])
+        self.assertIsNone(deep.json()["next"])
+        self.assertIsNotNone(first.json()["next"])
+
+    def test_field_selection(self):
+        data = self.get("api_questions", fields="option_a,total_votes", category=self.food.id).json()
+        self.assertEqual(data["results"][2], {"option_a": "A2", "total_votes": 2})
+        response = self.get("api_questions", fields="option_a,secret")
+        self.assertEqual(response.status_code, 400)
+        self.assertIn("secret", response.json()["error"])
+        self.assertEqual(self.get("api_categories", after="x").status_code, 400)
+        self.assertEqual(self.get("api_categories", limit=0).status_code, 400)
+
+    def test_lists_revalidate_until_a_category_changes(self):
+        response = self.get("api_questions", category=self.travel.id)
+        etag = response["ETag"]
+        with self.assertNumQueries(2):
+            response = self.client.get(
+                reverse("polls:api_questions"), {"category": self.travel.id}, HTTP_IF_NONE_MATCH=etag
+            )
+        self.assertEqual(response.status_code, 304)
+
+        # A vote in another category leaves this list alone, one in this category does not
+        self.client.post(
+            reverse("polls:vote_this_or_that", args=(self.questions[0].id,)),
+            data=json.dumps({"choice": "A"}), content_type="application/json",
+        )
+        response = self.client.get(reverse("polls:api_questions"), {"category": self.travel.id}, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 304)
+        self.client.post(
+            reverse("polls:vote_this_or_that", args=(self.beach.id,)),
+            data=json.dumps({"choice": "B"}), content_type="application/json",
+        )
+        response = self.client.get(reverse("polls:api_questions"), {"category": self.travel.id}, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.json()["results"][0]["votes_b"], 1)
+
+    def test_classic_polls_with_choices(self):
+        question = create_question("Favourite colour?", days=-1)
+        question.choice_set.create(choice_text="Red", votes=3)
+        question.choice_set.create(choice_text="Blue", votes=1)
+        create_question("Not yet", days=5)
+        response = self.get("api_polls")
+        self.assertEqual(len(response.json()["results"]), 1)
+        self.assertEqual(
+            [(choice["choice_text"], choice["votes"]) for choice in response.json()["results"][0]["choices"]],
+            [("Red", 3), ("Blue", 1)],
+        )
+        response = self.client.get(reverse("polls:api_polls"), HTTP_IF_NONE_MATCH=response["ETag"])
+        self.assertEqual(response.status_code, 304)
+        self.assertEqual(self.get("api_polls", fields="question_text").json()["results"], [{"question_text": "Favourite colour?"}])
+
+
+@override_settings(POLLS_VOTE_SHARDS=[SHARD])
+class VoteShardTests(TestCase):
+    databases = {"default", SHARD}
+
+    def setUp(self):
+        cache.clear()
+        ratelimit.reset()
+        self.sharded = ThisOrThatCategory.objects.create(name="Food", icon="🍔")
+        self.plain = ThisOrThatCategory.objects.create(name="Travel", icon="✈️")
+        self.shard_map = self.settings(POLLS_CATEGORY_SHARDS={self.sharded.id: SHARD, self.plain.id: "default"})
+        self.shard_map.enable()
+        self.addCleanup(self.shard_map.disable)
+        # Trailing folds would run in timer threads, outside the test's transaction
+        fold_timer = mock.patch.object(counters.threading, "Timer")
+        fold_timer.start()
+        self.addCleanup(fold_timer.stop)
+        self.food = [
+            ThisOrThat.objects.create(category=self.sharded, option_a=f"A{i}", option_b=f"B{i}") for i in range(2)
+        ]
+        self.trip = ThisOrThat.objects.create(category=self.plain, option_a="Sea", option_b="Hills")
+
+    def vote(self, question, choice):
+        with self.captureOnCommitCallbacks(using=SHARD, execute=True):
+            return self.client.post(
+                reverse("polls:vote_this_or_that", args=(question.id,)),
+                data=json.dumps({"choice": choice}), content_type="application/json",
+            ).json()
+
+    def test_category_map_and_router(self):
+        self.assertEqual(sharding.vote_databases(), ["default", SHARD])
+        self.assertEqual(sharding.db_for_category(self.sharded.id), SHARD)
+        with self.settings(POLLS_CATEGORY_SHARDS={}):
+            self.assertEqual(sharding.db_for_category(4), "default")
+            self.assertEqual(sharding.db_for_category(5), SHARD)
+        with self.settings(POLLS_VOTE_SHARDS=[]):
+            self.assertEqual(sharding.db_for_category(self.sharded.id), "default")
+        router = sharding.VoteShardRouter()
+        self.assertTrue(router.allow_migrate(SHARD, "polls", model_name="vote"))
+        self.assertFalse(router.allow_migrate(SHARD, "polls", model_name="thisorthat"))
+        self.assertFalse(router.allow_migrate(SHARD, "auth", model_name="user"))
+        self.assertIsNone(router.allow_migrate("default", "polls", model_name="vote"))
+        self.assertEqual(router.db_for_read(Vote, instance=self.food[0]), SHARD)
+        self.assertEqual(router.db_for_read(ThisOrThat, instance=Vote.objects.using(SHARD).model()), "default")
+
+    def test_votes_and_counters_stay_in_the_category_shard(self):
+        data = self.vote(self.food[0], "A")
+        self.assertEqual((data["votes_a"], data["votes_b"]), (1, 0))
+        self.vote(self.food[0], "B")
+        self.vote(self.trip, "A")
+        self.assertEqual(Vote.objects.using(SHARD).get().choice, "B")
+        self.assertEqual(Vote.objects.get().this_or_that, self.trip)
+        self.assertEqual(counters.totals(self.food[0]), (0, 1))
+        self.assertEqual(sum(CounterShard.objects.using(SHARD).values_list("votes_b", flat=True)), 1)
+        # The question row is a copy, refreshed after the first commit and then
+        # at most once per fold interval
+        self.food[0].refresh_from_db()
+        self.assertEqual((self.food[0].votes_a, self.food[0].votes_b), (1, 0))
+        self.assertEqual(counters.fold_all(), 1)
+        self.food[0].refresh_from_db()
+        self.assertEqual((self.food[0].votes_a, self.food[0].votes_b), (0, 1))
+
+        response = self.client.get(reverse("polls:this_or_that", args=(self.sharded.id,)))
+        self.assertEqual(response.context["question"], self.food[1])
+        summary = self.client.get(reverse("polls:quiz_summary", args=(self.sharded.id,)))
+        self.assertEqual(summary.context["questions_with_results"][0]["user_choice"], "B")
+
+        with self.captureOnCommitCallbacks(using=SHARD, execute=True):
+            response = self.client.post(
+                reverse("polls:vote_batch"), content_type="application/json",
+                data=json.dumps({"votes": [
+                    {"question_id": self.food[1].id, "choice": "A"}, {"question_id": self.trip.id, "choice": "B"},
+                ]}),
+            )
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(Vote.objects.using(SHARD).count(), 2)
+        self.assertEqual(Vote.objects.get().choice, "B")
+
+        self.client.get(reverse("polls:this_or_that", args=(self.sharded.id,)), {"reset": 1})
+        self.assertFalse(Vote.objects.using(SHARD).exists())
+        self.assertEqual(Vote.objects.count(), 1)
+        self.assertEqual(counters.exact_totals([question.id for question in self.food]), {
+            self.food[0].id: (0, 0), self.food[1].id: (0, 0),
+        })
+
+    def test_analytics_add_up_across_shards(self):
+        agent = UserAgent.objects.create(digest="m", string="phone", device=UserAgent.MOBILE, browser=UserAgent.OTHER)
+        for i in range(3):
+            Vote.objects.using(SHARD).create(
+                this_or_that_id=self.food[i % 2].id, category_id=self.sharded.id, choice="A",
+                session_key=f"s{i}", agent=agent,
+            )
+        create_vote(self.trip, session_key="s0")
+
+        stats = {category["name"]: category["total_votes"] for category in views.get_category_stats()}
+        self.assertEqual(stats, {"Food": 3, "Travel": 1})
+        self.assertEqual(views.get_category_data(7), {"labels": ["🍔 Food", "✈️ Travel"], "votes": [3, 1]})
+        self.assertEqual(views.get_device_data(7), {"labels": ["Mobile", "Unknown"], "votes": [3, 1]})
+        self.assertEqual(sum(views.get_hourly_data(7)["votes"]), 4)
+        data = views.get_dashboard_data(refresh=True)
+        self.assertEqual(data["total_votes"], 4)
+        trending = data["trending_questions"]
+        self.assertEqual((trending[0], trending[0].recent_votes), (self.food[0], 2))
+        self.assertEqual({question.id for question in trending[1:]}, {self.food[1].id, self.trip.id})
+        self.assertIn(":4:", data["watermark"])
+
+    def test_migrate_vote_shards_moves_votes_and_counters(self):
+        with self.settings(POLLS_VOTE_SHARDS=[]):
+            self.vote(self.food[0], "A")
+            self.vote(self.food[1], "B")
+        self.assertEqual(Vote.objects.filter(category=self.sharded).count(), 2)
+
+        out = io.StringIO()
+        call_command("migrate_vote_shards", stdout=out)
+        self.assertIn("Moved 2 vote(s) and the counters of 2 question(s)", out.getvalue())
+        self.assertFalse(Vote.objects.filter(category=self.sharded).exists())
+        self.assertEqual(Vote.objects.using(SHARD).count(), 2)
+        self.assertEqual(counters.totals(self.food[0]), (1, 0))
+        self.assertEqual(counters.totals(self.food[1]), (0, 1))
+
+        # Revoting in the new home takes the moved vote back out of the counters
+        self.vote(self.food[0], "B")
+        self.assertEqual(Vote.objects.using(SHARD).count(), 2)
+        self.assertEqual(counters.exact_totals([self.food[0].id]), {self.food[0].id: (0, 1)})
+
+        out = io.StringIO()
+        call_command("migrate_vote_shards", stdout=out)
+        self.assertIn("Moved 0 vote(s) and the counters of 0 question(s)", out.getvalue())
+
+        # Moving back out of the shard
+        with self.settings(POLLS_CATEGORY_SHARDS={}, POLLS_VOTE_SHARDS=[]):
+            call_command("migrate_vote_shards", "--source", SHARD, stdout=io.StringIO())
+            self.assertEqual(Vote.objects.filter(category=self.sharded).count(), 2)
+            self.assertEqual(counters.totals(self.food[0]), (0, 1))
+        self.assertFalse(CounterShard.objects.using(SHARD).exists())
+
+    def test_archive_and_export_cover_shard_votes(self):
+        archive_dir = tempfile.TemporaryDirectory()
+        self.addCleanup(archive_dir.cleanup)
+        agent = UserAgent.objects.create(digest="m", string="phone", device=UserAgent.MOBILE, browser=UserAgent.OTHER)
+        old = timezone.now() - datetime.timedelta(days=100)
+        shard_votes = [
+            Vote.objects.using(SHARD).create(
+                this_or_that_id=question.id, category_id=self.sharded.id, choice="B", session_key="s1", agent=agent,
+            )
+            for question in self.food
+        ]
+        Vote.objects.using(SHARD).update(timestamp=old)
+        create_vote(self.trip, when=old, session_key="s2")
+        create_vote(self.trip, session_key="s3")
+
+        with self.settings(POLLS_VOTE_ARCHIVE_DIR=archive_dir.name):
+            self.assertEqual(archive.archive_votes(days=90), 3)
+            archived = list(archive.iter_archived_votes())
+            output = io.StringIO()
+            call_command("export_votes", stdout=output)
+        self.assertFalse(Vote.objects.using(SHARD).exists())
+        self.assertEqual(Vote.objects.count(), 1)
+        self.assertEqual(
+            sorted((row["this_or_that_id"], row["user_agent"]) for row in archived),
+            sorted([(question.id, "phone") for question in self.food] + [(self.trip.id, "")]),
+        )
+        # Vote ids are only unique per database, so each has its own files
+        month = old.astimezone(datetime.timezone.utc).strftime("%Y-%m")
+        self.assertEqual(
+            sorted(path.name for path in Path(archive_dir.name).iterdir()),
+            [f"votes-{month}-{SHARD}.ndjson.gz", f"votes-{month}.ndjson.gz"],
+        )
+        self.assertEqual(
+            {(rollup.this_or_that_id, rollup.votes_b) for rollup in VoteRollup.objects.filter(category=self.sharded)},
+            {(question.id, 1) for question in self.food},
+        )
+        self.assertEqual(len(output.getvalue().strip().splitlines()), 1 + 4)
+
+        Vote.objects.using(SHARD).create(
+            this_or_that_id=self.food[0].id, category_id=self.sharded.id, choice="A", session_key="s4", agent=agent,
+        )
+        output = io.StringIO()
+        call_command("export_votes", "--no-archive", stdout=output)
+        rows = list(csv.DictReader(io.StringIO(output.getvalue())))
+        self.assertEqual(
+            sorted((int(row["this_or_that_id"]), row["user_agent"]) for row in rows),
+            sorted([(self.food[0].id, "phone"), (self.trip.id, "")]),
+        )
+
+    def test_load_data_goes_to_each_category_shard(self):
+        useragents.clear_cache()
+        self.addCleanup(useragents.clear_cache)
+        with self.captureOnCommitCallbacks(using=SHARD, execute=True):
+            call_command(
+                "generate_load_data", "--seed", "3", "--categories", "2", "--questions", "3", "--users", "2",
+                "--sessions", "20", "--votes", "60", stdout=io.StringIO(),
+            )
+        categories = list(ThisOrThatCategory.objects.filter(name__startswith="load3 "))
+        self.assertEqual({sharding.db_for_category(category.id) for category in categories}, {"default", SHARD})
+        for category in categories:
+            using = sharding.db_for_category(category.id)
+            other = SHARD if using == "default" else "default"
+            self.assertTrue(Vote.objects.using(using).filter(category_id=category.id).exists())
+            self.assertFalse(Vote.objects.using(other).filter(category_id=category.id).exists())
+            for question in category.thisorthat_set.all():
+                votes = Vote.objects.using(using).filter(this_or_that_id=question.id)
+                expected = (votes.filter(choice="A").count(), votes.filter(choice="B").count())
+                self.assertEqual(counters.totals(question), expected)
+                # Folding the shard counters into the rows keeps what was set
+                counters.fold_all()
+                question.refresh_from_db()
+                self.assertEqual((question.votes_a, question.votes_b), expected)
+
+    def test_deleting_a_question_removes_its_shard_votes(self):
+        self.vote(self.food[0], "A")
+        self.food[0].delete()
+        self.assertFalse(Vote.objects.using(SHARD).exists())
+        self.assertFalse(CounterShard.objects.using(SHARD).exists())
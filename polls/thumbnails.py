@@ -0,0 +1,269 @@
+"""
+Local thumbnails for the remote option images of ThisOrThat questions.
+
+Thumbnails are content-addressed: each source image is fetched once, and its
+WebP thumbnails are stored under the hash of the image's bytes plus the
+width, so URLs that serve the same image share files. A small index file
+per source URL (under urls/) names the content hash it last served. A miss
+fetches the source while the request waits, so the fetch gets a short
+overall time limit and a size cap; if either is hit the view redirects to
+the original. Concurrent misses for one thumbnail wait for a single fetch
+(across workers with a shared cache backend) instead of each making it.
+
+POLLS_THUMBNAIL_CACHE_MAX_BYTES is a target rather than a hard bound. The
+least recently served files are evicted first (a hit refreshes the file's
+mtime), but eviction scans the whole directory, so it only runs from the
+prune_thumbnails command and, after a miss, at most once per
+POLLS_THUMBNAIL_EVICT_INTERVAL seconds in a background thread. In between,
+the cache grows by whatever the misses add.
+"""
+import hashlib
+import io
+import logging
+import os
+import tempfile
+import threading
+import time
+import urllib.request
+from pathlib import Path
+
+from django.conf import settings
+from django.core.cache import cache
+from django.urls import reverse
+from PIL import Image
+
+logger = logging.getLogger(__name__)
+
+WIDTHS = tuple(getattr(settings, 'POLLS_THUMBNAIL_WIDTHS', (160, 320, 640)))
+READ_CHUNK = 64 * 1024
+# How often a request waiting for another one's fetch looks for the file
+WAIT_INTERVAL = 0.05
+
+
+class ThumbnailError(Exception):
+    pass
+
+
+def cache_dir():
+    return Path(getattr(settings, 'POLLS_THUMBNAIL_CACHE_DIR', settings.BASE_DIR / 'thumbnail_cache'))
+
+
+def max_cache_bytes():
+    return getattr(settings, 'POLLS_THUMBNAIL_CACHE_MAX_BYTES', 256 * 1024 * 1024)
+
+
+def fetch_timeout():
+    """Seconds a source image may take to arrive in full"""
+    return getattr(settings, 'POLLS_THUMBNAIL_FETCH_TIMEOUT', 3)
+
+
+def max_source_bytes():
+    return getattr(settings, 'POLLS_THUMBNAIL_MAX_SOURCE_BYTES', 5 * 1024 * 1024)
+
+
+def evict_interval():
+    return getattr(settings, 'POLLS_THUMBNAIL_EVICT_INTERVAL', 300)
+
+
+def source_digest(url):
+    """Short hash of a source URL; part of the thumbnail URL so it changes with the image"""
+    return hashlib.sha256(url.encode()).hexdigest()[:16]
+
+
+def thumbnail_urls(question, side):
+    """``src``/``srcset`` for one side ('a' or 'b') of a question, or None without an image"""
+    url = question.option_a_image if side == 'a' else question.option_b_image
+    if not url:
+        return None
+    digest = source_digest(url)
+    urls = {
+        width: reverse('polls:thumbnail', args=(question.id, side, width, digest))
+        for width in WIDTHS
+    }
+    return {
+        'src': urls[WIDTHS[0]],
+        'srcset': ', '.join(f"{url} {width}w" for width, url in urls.items()),
+    }
+
+
+def _fetch(url):
+    if not url.startswith(('http://', 'https://')):
+        raise ThumbnailError(f"Unsupported image URL: {url}")
+    request = urllib.request.Request(url, headers={'User-Agent': 'ThisOrThat-Thumbnailer/1.0'})
+    limit = max_source_bytes()
+    # urlopen's timeout bounds each socket operation; the deadline bounds the whole download
+    deadline = time.monotonic() + fetch_timeout()
+    chunks, size = [], 0
+    try:
+        with urllib.request.urlopen(request, timeout=fetch_timeout()) as response:
+            length = response.headers.get('Content-Length')
+            if length and length.isdigit() and int(length) > limit:
+                raise ThumbnailError(f"Image too large: {url}")
+            # read1 returns what has arrived, so a slow sender is noticed between reads
+            while chunk := response.read1(READ_CHUNK):
+                chunks.append(chunk)
+                size += len(chunk)
+                if size > limit:
+                    raise ThumbnailError(f"Image too large: {url}")
+                if time.monotonic() > deadline:
+                    raise ThumbnailError(f"Fetching {url} took too long")
+    except OSError as e:
+        raise ThumbnailError(f"Could not fetch {url}: {e}") from e
+    return b''.join(chunks)
+
+
+def _resize(data, width):
+    try:
+        with Image.open(io.BytesIO(data)) as image:
+            image.load()
+            if image.mode not in ('RGB', 'RGBA'):
+                image = image.convert('RGBA')
+            if image.width > width:
+                height = max(1, round(image.height * width / image.width))
+                image = image.resize((width, height), Image.LANCZOS)
+            output = io.BytesIO()
+            image.save(output, 'WEBP', quality=80)
+    except (OSError, ValueError, Image.DecompressionBombError) as e:
+        raise ThumbnailError(f"Not a usable image: {e}") from e
+    return output.getvalue()
+
+
+def evict(root=None, limit=None):
+    """
+    Remove least recently used thumbnails until the cache fits in ``limit``
+    bytes (POLLS_THUMBNAIL_CACHE_MAX_BYTES by default). Returns the number
+    of files removed and the bytes left.
+    """
+    root = cache_dir() if root is None else root
+    limit = max_cache_bytes() if limit is None else limit
+    entries = []
+    total = 0
+    for path in root.glob('*/*.webp'):
+        try:
+            stat = path.stat()
+        except FileNotFoundError:
+            continue
+        entries.append((stat.st_mtime, stat.st_size, path))
+        total += stat.st_size
+    entries.sort()
+    removed = 0
+    for _, size, path in entries:
+        if total <= limit:
+            break
+        # A file being served stays readable after it is unlinked
+        path.unlink(missing_ok=True)
+        total -= size
+        removed += 1
+    # Index entries whose thumbnails are all gone only lead to misses
+    for index in root.glob('urls/*/*'):
+        try:
+            content = index.read_text()
+        except FileNotFoundError:
+            continue
+        if not any((root / content[:2]).glob(f'{content}-*.webp')):
+            index.unlink(missing_ok=True)
+    return removed, total
+
+
+def evict_later():
+    """Run evict() in a background thread, at most once per evict interval across workers"""
+    interval = evict_interval()
+    if interval is None or not cache.add('polls:thumbnail-evict', True, interval):
+        return
+    threading.Thread(target=_evict_in_background, name='polls-thumbnail-evict', daemon=True).start()
+
+
+def _evict_in_background():
+    try:
+        evict()
+    except OSError:  # e.g. the cache directory went away; the next run retries
+        logger.exception("Evicting thumbnails failed")
+
+
+def _url_key(url):
+    return hashlib.sha256(url.encode()).hexdigest()
+
+
+def _index_path(root, url):
+    key = _url_key(url)
+    return root / 'urls' / key[:2] / key
+
+
+def _thumbnail_path(root, content, width):
+    return root / content[:2] / f"{content}-{width}.webp"
+
+
+def _write(path, data):
+    path.parent.mkdir(parents=True, exist_ok=True)
+    # Write to a temporary file and rename so readers never see a partial file
+    fd, tmp_path = tempfile.mkstemp(dir=path.parent, suffix='.tmp')
+    with os.fdopen(fd, 'wb') as handle:
+        handle.write(data)
+    os.replace(tmp_path, path)
+
+
+def _cached(root, url, width):
+    """Path of the existing thumbnail, marked as just used, or None"""
+    try:
+        path = _thumbnail_path(root, _index_path(root, url).read_text(), width)
+        os.utime(path)
+    except FileNotFoundError:  # never made, or evicted
+        return None
+    return path
+
+
+def _create(root, url, width):
+    source = _fetch(url)
+    content = hashlib.sha256(source).hexdigest()
+    path = _thumbnail_path(root, content, width)
+    try:
+        # The same image behind another URL may have made it already
+        os.utime(path)
+    except FileNotFoundError:
+        _write(path, _resize(source, width))
+    _write(_index_path(root, url), content.encode())
+    return path
+
+
+def _lock_seconds():
+    # Longer than a fetch may take, yet short enough that a holder that died
+    # does not keep the others waiting long
+    return fetch_timeout() + 5
+
+
+def get_thumbnail(url, width):
+    """Path of the cached ``width``-pixel WebP thumbnail of ``url``, creating it if needed"""
+    root = cache_dir()
+    path = _cached(root, url, width)
+    if path is not None:
+        return path
+    lock = f'polls:thumbnail-lock:{_url_key(url)}:{width}'
+    wait = _lock_seconds()
+    if not cache.add(lock, True, wait):
+        # Another request is fetching this one; wait for its file
+        deadline = time.monotonic() + wait
+        while time.monotonic() < deadline:
+            time.sleep(WAIT_INTERVAL)
+            released = cache.get(lock) is None
+            path = _cached(root, url, width)
+            if path is not None:
+                return path
+            if released:
+                break
+        raise ThumbnailError(f"Thumbnail of {url} is not available yet")
+    try:
+        path = _create(root, url, width)
+    finally:
+        cache.delete(lock)
+    evict_later()
+    return path
+
+
+def open_thumbnail(url, width):
+    """get_thumbnail()'s file, opened for reading; one evicted in between is made again"""
+    for _ in range(2):
+        try:
+            return open(get_thumbnail(url, width), 'rb')
+        except FileNotFoundError:
+            continue
+    raise ThumbnailError(f"Thumbnail of {url} was evicted while being served")
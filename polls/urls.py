@@ -1,5 +1,5 @@
 from django.urls import path
-from . import views
+from . import api, views
 
 app_name = "polls"
 urlpatterns = [
@@ -15,9 +15,21 @@ urlpatterns = [
     path("this-or-that/", views.this_or_that_home, name="this_or_that_home"),
     path("this-or-that/<int:category_id>/", views.this_or_that_game, name="this_or_that"),
     path("this-or-that/vote/<int:question_id>/", views.vote_this_or_that, name="vote_this_or_that"),
+    path("this-or-that/vote/batch/", views.vote_batch, name="vote_batch"),
+    path("this-or-that/search/", views.search_questions, name="search_questions"),
     path('quiz-summary/<int:category_id>/', views.quiz_summary, name='quiz_summary'),
+    path(
+        "this-or-that/thumbnail/<int:question_id>/<str:side>/<int:width>/<str:digest>/",
+        views.question_thumbnail,
+        name="thumbnail",
+    ),
 
 
+    # Read-only JSON API
+    path("api/categories/", api.categories, name="api_categories"),
+    path("api/questions/", api.questions, name="api_questions"),
+    path("api/polls/", api.polls, name="api_polls"),
+
     #Analytics
     path('analytics/', views.analytics_dashboard, name='analytics_dashboard'),
     path("analytics/update/", views.update_analytics, name="update_analytics"),
@@ -0,0 +1,69 @@
+"""
+Interned user-agent strings.
+
+Votes point at a UserAgent row instead of carrying their own copy of the
+header. Device and browser class are parsed once, when a string is first
+seen, so analytics can group on them directly. Lookups on the vote path go
+through a per-process LRU cache and only hit the database for new strings.
+"""
+import hashlib
+import re
+from functools import lru_cache
+
+from django.conf import settings
+
+from .models import UserAgent
+
+# Longer headers are truncated; nothing past this point helps classification
+MAX_LENGTH = 1024
+
+_BOT = re.compile(r'bot|crawl|spider|slurp|curl|wget|python-requests|headless', re.I)
+_TABLET = re.compile(r'ipad|tablet|kindle|silk|playbook|android(?!.*mobile)', re.I)
+_MOBILE = re.compile(r'mobi|iphone|ipod|android|blackberry|opera mini|windows phone', re.I)
+_BROWSERS = [
+    (re.compile(r'edg(e|a|ios)?/', re.I), UserAgent.EDGE),
+    (re.compile(r'opr/|opera', re.I), UserAgent.OPERA),
+    (re.compile(r'samsungbrowser', re.I), UserAgent.SAMSUNG),
+    (re.compile(r'firefox|fxios', re.I), UserAgent.FIREFOX),
+    (re.compile(r'chrome|crios|chromium', re.I), UserAgent.CHROME),
+    (re.compile(r'safari', re.I), UserAgent.SAFARI),
+]
+
+
+def digest(string):
+    return hashlib.sha1(string.encode()).hexdigest()
+
+
+def parse(string):
+    """(device, browser) classes for a user-agent string"""
+    if _BOT.search(string):
+        device = UserAgent.BOT
+    elif _TABLET.search(string):
+        device = UserAgent.TABLET
+    elif _MOBILE.search(string):
+        device = UserAgent.MOBILE
+    else:
+        device = UserAgent.DESKTOP
+    browser = next((name for pattern, name in _BROWSERS if pattern.search(string)), UserAgent.OTHER)
+    return device, browser
+
+
+@lru_cache(maxsize=getattr(settings, 'POLLS_USER_AGENT_CACHE_SIZE', 2048))
+def _agent_id(string):
+    device, browser = parse(string)
+    agent, _ = UserAgent.objects.get_or_create(
+        digest=digest(string),
+        defaults={'string': string, 'device': device, 'browser': browser},
+    )
+    return agent.id
+
+
+def agent_id(string):
+    """Id of the UserAgent row for ``string``, or None for an empty header"""
+    if not string:
+        return None
+    return _agent_id(string[:MAX_LENGTH])
+
+
+def clear_cache():
+    _agent_id.cache_clear()
@@ -1,16 +1,27 @@
+import hashlib
 import json
+import math
 import random
-from datetime import datetime, timedelta
+import zoneinfo
+from datetime import datetime, time, timedelta, timezone as dt_timezone
 from django.shortcuts import get_object_or_404, render, redirect
-from django.http import JsonResponse, HttpResponse, HttpResponseRedirect
+from django.http import FileResponse, Http404, JsonResponse, HttpResponse, HttpResponseNotModified, HttpResponseRedirect
 from django.views.decorators.csrf import csrf_exempt
-from django.views.decorators.http import require_POST
+from django.views.decorators.cache import cache_control
+from django.views.decorators.http import condition, require_GET, require_POST
+from django.views.decorators.vary import vary_on_cookie
+from django.utils.decorators import method_decorator
+from django.conf import settings
+from django.core.cache import cache
 from django.contrib.admin.views.decorators import staff_member_required
-from django.db.models import Count, Q, F, Avg
+from django.db import transaction
+from django.db.models import Case, Count, FloatField, Q, F, Avg, Max, Sum, Value, When
+from django.db.models.functions import Coalesce, ExtractHour, Round, TruncDate
 from django.utils import timezone
 from django.core.paginator import Paginator
 from django.contrib.auth.models import User
-from .models import Questions, Choice, ThisOrThat, ThisOrThatCategory, Vote
+from .models import Questions, Choice, ThisOrThat, ThisOrThatCategory, UserAgent, Vote, VoteRollup
+from . import counters, eventlog, funnels, ratelimit, search, sharding, singleflight, stats, thumbnails, useragents, voting
 from django.urls import reverse
 from django.views import generic
 from django.db.models import Avg
@@ -36,6 +47,23 @@ class DetailView(generic.DetailView):
         return Questions.objects.filter(pub_date__lte=timezone.now())
 
 
+SHARED_CACHE_SECONDS = getattr(settings, 'POLLS_SHARED_CACHE_SECONDS', 30)
+STATS_CACHE_SECONDS = getattr(settings, 'POLLS_STATS_CACHE_SECONDS', 300)
+DASHBOARD_CACHE_SECONDS = getattr(settings, 'POLLS_DASHBOARD_CACHE_SECONDS', 30)
+SEARCH_MAX_RESULTS = getattr(settings, 'POLLS_SEARCH_MAX_RESULTS', 50)
+SUMMARY_PAGE_SIZE = getattr(settings, 'POLLS_SUMMARY_PAGE_SIZE', 50)
+
+def _results_etag(request, pk):
+    """Fingerprint of everything the results page shows for one question"""
+    rows = list(Questions.objects.filter(pk=pk).order_by('choice__id').values_list(
+        'question_text', 'choice__id', 'choice__choice_text', 'choice__votes'
+    ))
+    if not rows:
+        return None
+    return hashlib.md5(repr(rows).encode()).hexdigest()
+
+@method_decorator(cache_control(public=True, max_age=0, s_maxage=SHARED_CACHE_SECONDS), name='dispatch')
+@method_decorator(condition(etag_func=_results_etag), name='dispatch')
 class ResultsView(generic.DetailView):
     model = Questions
     template_name = "polls/results.html"
@@ -53,162 +81,111 @@ def vote(request, question_id):
         return HttpResponseRedirect(reverse("polls:results", args=(question.id,)))
 
 
+def _categories_state():
+    # All categories, not just active ones, so deactivating one is noticed
+    state = ThisOrThatCategory.objects.aggregate(
+        count=Count('id'), version=Sum('version'), updated_at=Max('updated_at')
+    )
+    state['last_votes'] = sharding.last_vote_times()
+    return state
+
+def _votes_key(last_votes):
+    return '-'.join(str(last.timestamp()) if last else '0' for last in last_votes)
+
+def _state_key(state):
+    updated_at = state['updated_at'].timestamp() if state['updated_at'] else 0
+    return f"{state['count']}-{state['version'] or 0}-{updated_at}-{_votes_key(state['last_votes'])}"
+
+def _last_modified(state):
+    """The later of the category change and the latest vote behind ``state``"""
+    return max(filter(None, (state['updated_at'], *state['last_votes'])), default=None)
+
+def get_category_stats(state=None, refresh=False):
+    """
+    Active categories with question and vote counts, as dicts. Cached until
+    any category's version changes.
+    """
+    key = f"polls:category-stats:{_state_key(state or _categories_state())}"
+    stats = None if refresh else cache.get(key)
+    if stats is None:
+        question_counts = dict(ThisOrThat.objects.filter(is_active=True).values(
+            'category_id'
+        ).annotate(count=Count('id')).values_list('category_id', 'count'))
+        vote_counts = sharding.merge_counts(
+            pair for votes in sharding.vote_querysets()
+            for pair in votes.values_list('category_id').annotate(count=Count('id'))
+        )
+        stats = [
+            {
+                'id': category['id'],
+                'name': category['name'],
+                'icon': category['icon'],
+                'question_count': question_counts.get(category['id'], 0),
+                'total_votes': vote_counts.get(category['id'], 0),
+            }
+            for category in ThisOrThatCategory.objects.filter(is_active=True).values('id', 'name', 'icon')
+        ]
+        cache.set(key, stats, STATS_CACHE_SECONDS)
+    return stats
+
+def _home_state(request):
+    if not hasattr(request, '_polls_home_state'):
+        request._polls_home_state = _categories_state()
+    return request._polls_home_state
+
+def _home_etag(request):
+    return _state_key(_home_state(request))
+
+def _home_last_modified(request):
+    return _last_modified(_home_state(request))
+
+@cache_control(public=True, max_age=0, s_maxage=SHARED_CACHE_SECONDS)
+@condition(etag_func=_home_etag, last_modified_func=_home_last_modified)
 def this_or_that_home(request):
     """Landing page showing all categories"""
-    categories = ThisOrThatCategory.objects.filter(is_active=True)
-    
-    # Add stats for each category
-    for category in categories:
-        category.question_count = ThisOrThat.objects.filter(
-            category=category, is_active=True
-        ).count()
-        category.total_votes = Vote.objects.filter(
-            this_or_that__category=category
-        ).count()
-    
     return render(request, 'polls/this_or_that_home.html', {
-        'categories': categories
+        'categories': get_category_stats(_home_state(request))
     })
 
-def this_or_that_game(request, category_id):
-    """Main game interface"""
-    category = get_object_or_404(ThisOrThatCategory, id=category_id, is_active=True)
-    
-    # Just get all available questions (don't exclude voted ones)
-    available_questions = ThisOrThat.objects.filter(
-        category=category,
-        is_active=True
+def get_dashboard_data(refresh=False):
+    """
+    Everything the analytics dashboard renders, shared by every viewer and
+    recomputed by one request at a time (see singleflight.py)
+    """
+    tz = timezone.get_current_timezone()
+    return singleflight.get_or_compute(
+        f"polls:dashboard:{tz}", lambda: _compute_dashboard_data(tz), DASHBOARD_CACHE_SECONDS, refresh=refresh
     )
-    
-    if not available_questions.exists():
-        return render(request, 'polls/category_complete.html', {
-            'category': category
-        })
-    
-    question = random.choice(available_questions)
-    
-    # Calculate progress based on total questions
-    total_questions = available_questions.count()
-    
-    return render(request, 'polls/this_or_that.html', {
-        'question': question,
-        'category': category,
-        'current_question': 1,  # Since they can revote, this is always "current"
-        'total_questions': total_questions,
-        'progress_percentage': 0  # Or calculate based on some other metric
-    })
 
-@require_POST
-def vote_this_or_that(request, question_id):
-    """Handle voting via AJAX"""
-    question = get_object_or_404(ThisOrThat, id=question_id)
-    
-    try:
-        data = json.loads(request.body)
-        choice = data.get('choice')
-        
-        if choice not in ['A', 'B']:
-            return JsonResponse({'error': 'Invalid choice'}, status=400)
-        
-        # Create vote data
-        vote_data = {
-            'this_or_that': question,
-            'choice': choice,
-            'user_agent': request.META.get('HTTP_USER_AGENT', ''),
-            'ip_address': request.META.get('REMOTE_ADDR'),
-        }
-        
-        if request.user.is_authenticated:
-            vote_data['user'] = request.user
-            # Check for existing vote by this user
-            existing_vote = Vote.objects.filter(
-                this_or_that=question,
-                user=request.user
-            ).first()
-        else:
-            if not request.session.session_key:
-                request.session.create()
-            vote_data['session_key'] = request.session.session_key
-            # Check for existing vote by this session
-            existing_vote = Vote.objects.filter(
-                this_or_that=question,
-                session_key=request.session.session_key
-            ).first()
-        
-        # Handle existing vote
-        if existing_vote:
-            # Decrement the old choice count
-            if existing_vote.choice == 'A':
-                ThisOrThat.objects.filter(id=question_id).update(votes_a=F('votes_a') - 1)
-            else:
-                ThisOrThat.objects.filter(id=question_id).update(votes_b=F('votes_b') - 1)
-            
-            # Update the existing vote
-            existing_vote.choice = choice
-            existing_vote.timestamp = timezone.now()
-            existing_vote.user_agent = vote_data['user_agent']
-            existing_vote.ip_address = vote_data['ip_address']
-            existing_vote.save()
-        else:
-            # Create new vote
-            Vote.objects.create(**vote_data)
-        
-        # Increment the new choice count
-        if choice == 'A':
-            ThisOrThat.objects.filter(id=question_id).update(votes_a=F('votes_a') + 1)
-        else:
-            ThisOrThat.objects.filter(id=question_id).update(votes_b=F('votes_b') + 1)
-        
-        # Get updated results
-        question.refresh_from_db()
-        
-        return JsonResponse({
-            'success': True,
-            'votes_a': question.votes_a,
-            'votes_b': question.votes_b,
-            'total_votes': question.total_votes,
-            'percentage_a': question.percentage_a,
-            'percentage_b': question.percentage_b,
-            'winning_option': question.winning_option
-        })
-        
-    except json.JSONDecodeError:
-        return JsonResponse({'error': 'Invalid JSON'}, status=400)
-    except Exception as e:
-        return JsonResponse({'error': str(e)}, status=500)
-
-@staff_member_required
-def analytics_dashboard(request):
-    """Analytics dashboard for admins"""
+def _compute_dashboard_data(tz):
     # Basic stats
     total_questions = ThisOrThat.objects.filter(is_active=True).count()
-    total_votes = Vote.objects.count()
-    today_votes = Vote.objects.filter(
-        timestamp__date=timezone.now().date()
-    ).count()
-    
-    # Active users (voted in last 7 days)
+    total_votes = sum(votes.count() for votes in sharding.vote_querysets()) + _rollup_total(VoteRollup.objects.all())
+    today = timezone.localdate(timezone=tz)
+    today_start, today_end = _local_day_range(today, today, tz)
+    today_votes = sum(votes.count() for votes in sharding.vote_querysets(Vote.objects.filter(
+        timestamp__gte=today_start,
+        timestamp__lt=today_end
+    )))
+    
+    # Active users (voted in last 7 days), who may have voted in several vote shards
     week_ago = timezone.now() - timedelta(days=7)
-    active_users = Vote.objects.filter(
-        timestamp__gte=week_ago,
-        user__isnull=False
-    ).values('user').distinct().count()
+    active_users = len(set().union(*(
+        votes.values_list('user', flat=True).distinct()
+        for votes in sharding.vote_querysets(Vote.objects.filter(timestamp__gte=week_ago, user__isnull=False))
+    )))
     
     # Categories with stats
-    categories = ThisOrThatCategory.objects.filter(is_active=True)
+    categories = get_category_stats()
     category_stats = []
     
     for category in categories:
-        question_count = ThisOrThat.objects.filter(
-            category=category, is_active=True
-        ).count()
-        category_votes = Vote.objects.filter(
-            this_or_that__category=category
-        ).count()
+        question_count = category['question_count']
+        category_votes = category['total_votes']
         
         category_stats.append({
-            'name': category.name,
-            'icon': category.icon,
+            'name': category['name'],
+            'icon': category['icon'],
             'question_count': question_count,
             'total_votes': category_votes,
             'avg_votes': round(category_votes / question_count, 1) if question_count > 0 else 0,
@@ -219,19 +196,20 @@ def analytics_dashboard(request):
     
     # Trending questions (most votes in last 24 hours)
     yesterday = timezone.now() - timedelta(days=1)
-    trending_questions = ThisOrThat.objects.filter(
-        is_active=True,
-        vote__timestamp__gte=yesterday
-    ).annotate(
-        recent_votes=Count('vote')
-    ).order_by('-recent_votes')[:10]
-    
-    # Data for charts
-    activity_data = get_activity_data(30)  # Last 30 days
-    category_data = get_category_data()
-    hourly_data = get_hourly_data()
-    
-    context = {
+    recent_votes = sharding.merge_counts(
+        pair for votes in sharding.vote_querysets(Vote.objects.filter(timestamp__gte=yesterday))
+        for pair in votes.values_list('this_or_that_id').annotate(count=Count('id'))
+    )
+    trending_questions = _top_active_questions(recent_votes, 10)
+    
+    # Data for charts, matching the default filters of update_analytics
+    activity_data = get_activity_data(30, tz=tz)  # Last 30 days
+    category_data = get_category_data(30, tz=tz)
+    hourly_data = get_hourly_data(30, tz=tz)
+    device_data = get_device_data(30, tz=tz)
+    watermark = _analytics_watermark(_chart_votes(30, tz), f"30/all/{tz}", timezone.localdate(timezone=tz))
+    
+    return {
         'total_questions': total_questions,
         'total_votes': total_votes,
         'today_votes': today_votes,
@@ -239,34 +217,118 @@ def analytics_dashboard(request):
         'categories': categories,
         'category_stats': category_stats,
         'trending_questions': trending_questions,
-        'activity_data': json.dumps(activity_data),
-        'category_data': json.dumps(category_data),
-        'hourly_data': json.dumps(hourly_data),
+        'closest_battles': stats.closest_battles(10),
+        'activity_data': activity_data,
+        'category_data': category_data,
+        'hourly_data': hourly_data,
+        'device_data': device_data,
+        'funnel_steps': funnels.STEPS,
+        'funnel_data': funnels.funnel_data(categories),
+        'server_timezone': str(tz),
+        'watermark': watermark,
     }
-    
-    return render(request, 'polls/analytics_dashboard.html', context)
 
-def get_activity_data(days=30):
-    """Get voting activity over time"""
-    end_date = timezone.now().date()
+def _top_active_questions(counts, limit):
+    """The active questions with the highest ``{question_id: count}``, as ThisOrThat with ``recent_votes``"""
+    ordered = sorted(counts, key=lambda question_id: -counts[question_id])
+    found = []
+    for start in range(0, len(ordered), 100):
+        chunk = ordered[start:start + 100]
+        active = ThisOrThat.objects.filter(is_active=True).select_related('category').in_bulk(chunk)
+        for question_id in chunk:
+            if question_id in active:
+                active[question_id].recent_votes = counts[question_id]
+                found.append(active[question_id])
+        if len(found) >= limit:
+            break
+    return found[:limit]
+
+@staff_member_required
+def analytics_dashboard(request):
+    """Analytics dashboard for admins"""
+    return render(request, 'polls/analytics_dashboard.html', get_dashboard_data())
+
+_EPOCH = datetime(1970, 1, 1, tzinfo=dt_timezone.utc)
+
+def _resolve_timezone(name=None):
+    """Return the named timezone, falling back to the active one."""
+    if name:
+        try:
+            return zoneinfo.ZoneInfo(name)
+        except (zoneinfo.ZoneInfoNotFoundError, ValueError):
+            pass
+    return timezone.get_current_timezone()
+
+def _local_day_range(start_date, end_date, tz):
+    """Aware [start, end) datetimes covering whole local days in ``tz``"""
+    start = datetime.combine(start_date, time.min, tzinfo=tz)
+    end = datetime.combine(end_date + timedelta(days=1), time.min, tzinfo=tz)
+    return start, end
+
+def _chart_votes(days=None, tz=None, vote_filter=None):
+    """Votes inside the last ``days`` local days (all time if None), optionally filtered"""
+    tz = tz or timezone.get_current_timezone()
+    votes = Vote.objects.all()
+    if days is not None:
+        end_date = timezone.localdate(timezone=tz)
+        start, end = _local_day_range(end_date - timedelta(days=days), end_date, tz)
+        # Plain range predicates on timestamp so the index can be used
+        votes = votes.filter(timestamp__gte=start, timestamp__lt=end)
+    if vote_filter is not None:
+        votes = votes.filter(vote_filter)
+    return votes
+
+def _chart_rollups(days=None, tz=None, vote_filter=None):
+    """
+    Hourly rollups of archived votes for the same window and filter as
+    _chart_votes. Rollup hours are UTC, so in zones with a half-hour offset an
+    archived hour counts towards the local day and hour it starts in.
+    """
+    tz = tz or timezone.get_current_timezone()
+    rollups = VoteRollup.objects.all()
+    if days is not None:
+        end_date = timezone.localdate(timezone=tz)
+        start, end = _local_day_range(end_date - timedelta(days=days), end_date, tz)
+        rollups = rollups.filter(hour__gte=start, hour__lt=end)
+    if vote_filter is not None:
+        rollups = rollups.filter(vote_filter)
+    return rollups
+
+def _rollup_total(rollups):
+    return rollups.aggregate(total=Sum(F('votes_a') + F('votes_b')))['total'] or 0
+
+def _rollup_counts(rollups, **group):
+    """``{group value: archived vote count}`` for a single annotation in ``group``"""
+    (name, expression), = group.items()
+    return {
+        item[name]: item['count']
+        for item in rollups.annotate(**group).values(name).annotate(
+            count=Sum(F('votes_a') + F('votes_b'))
+        )
+    }
+
+def get_activity_data(days=30, tz=None, vote_filter=None):
+    """Get voting activity over time, bucketed by local day"""
+    tz = tz or timezone.get_current_timezone()
+    end_date = timezone.localdate(timezone=tz)
     start_date = end_date - timedelta(days=days)
     
-    # Get daily vote counts
-    daily_votes = Vote.objects.filter(
-        timestamp__date__gte=start_date,
-        timestamp__date__lte=end_date
-    ).extra(
-        select={'day': 'DATE(timestamp)'}
-    ).values('day').annotate(
-        count=Count('id')
-    ).order_by('day')
+    daily_votes = [
+        item
+        for votes in sharding.vote_querysets(_chart_votes(days, tz, vote_filter))
+        for item in votes.annotate(day=TruncDate('timestamp', tzinfo=tz)).values('day').annotate(count=Count('id'))
+    ]
     
     # Create labels and data arrays
     labels = []
     votes = []
     
     current_date = start_date
-    vote_dict = {item['day']: item['count'] for item in daily_votes}
+    vote_dict = _rollup_counts(
+        _chart_rollups(days, tz, vote_filter), day=TruncDate('hour', tzinfo=tz)
+    )
+    for item in daily_votes:
+        vote_dict[item['day']] = vote_dict.get(item['day'], 0) + item['count']
     
     while current_date <= end_date:
         labels.append(current_date.strftime('%b %d'))
@@ -275,64 +337,235 @@ def get_activity_data(days=30):
     
     return {'labels': labels, 'votes': votes}
 
-def get_category_data():
-    """Get vote distribution by category"""
-    category_votes = Vote.objects.values(
-        'this_or_that__category__name',
-        'this_or_that__category__icon'
-    ).annotate(
-        count=Count('id')
-    ).order_by('-count')
-    
-    labels = [f"{item['this_or_that__category__icon']} {item['this_or_that__category__name']}" 
-              for item in category_votes]
-    votes = [item['count'] for item in category_votes]
+def _category_counts(votes, rollups=None):
+    """Labels and counts of ``votes`` (plus archived ``rollups``) grouped by category, biggest first"""
+    # Grouped by id in each vote database; the names are only in the default one
+    by_id = sharding.merge_counts(
+        pair for shard_votes in sharding.vote_querysets(votes)
+        for pair in shard_votes.values_list('category_id').annotate(count=Count('id'))
+    )
+    if rollups is not None:
+        for category_id, count in rollups.values_list('category_id').annotate(count=Sum(F('votes_a') + F('votes_b'))):
+            by_id[category_id] = by_id.get(category_id, 0) + count
+    names = ThisOrThatCategory.objects.in_bulk(list(by_id))
+    counts = {}
+    for category_id, count in by_id.items():
+        if category_id in names:
+            key = names[category_id].icon, names[category_id].name
+            counts[key] = counts.get(key, 0) + count
+    
+    category_votes = sorted(counts.items(), key=lambda pair: -pair[1])
+    labels = [f"{icon} {name}" for (icon, name), _ in category_votes]
+    votes = [count for _, count in category_votes]
     
     return {'labels': labels, 'votes': votes}
 
-def get_hourly_data():
-    """Get voting patterns by hour of day"""
-    # SQLite-compatible way to extract hour
-    hourly_votes = Vote.objects.extra(
-        select={'hour': "CAST(strftime('%%H', timestamp) AS INTEGER)"}
-    ).values('hour').annotate(
-        count=Count('id')
-    ).order_by('hour')
+def get_category_data(days=None, tz=None, vote_filter=None):
+    """Get vote distribution by category"""
+    tz = tz or timezone.get_current_timezone()
+    return _category_counts(_chart_votes(days, tz, vote_filter), _chart_rollups(days, tz, vote_filter))
+
+def _hourly_counts(votes, tz, rollups=None):
+    """Map of local hour -> vote count for ``votes`` (plus archived ``rollups``)"""
+    hourly_votes = [
+        item
+        for shard_votes in sharding.vote_querysets(votes)
+        for item in shard_votes.annotate(hour=ExtractHour('timestamp', tzinfo=tz)).values('hour').annotate(
+            count=Count('id')
+        )
+    ]
+    counts = {}
+    if rollups is not None:
+        counts = {
+            int(hour): count
+            for hour, count in _rollup_counts(rollups, local_hour=ExtractHour('hour', tzinfo=tz)).items()
+        }
+    for item in hourly_votes:
+        counts[int(item['hour'])] = counts.get(int(item['hour']), 0) + item['count']
+    return counts
+
+def get_hourly_data(days=None, tz=None, vote_filter=None):
+    """Get voting patterns by local hour of day"""
+    tz = tz or timezone.get_current_timezone()
     
     # Create 24-hour labels
     labels = [f"{i:02d}:00" for i in range(24)]
     votes = [0] * 24
     
-    for item in hourly_votes:
-        hour = int(item['hour'])
-        votes[hour] = item['count']
+    counts = _hourly_counts(_chart_votes(days, tz, vote_filter), tz, _chart_rollups(days, tz, vote_filter))
+    for hour, count in counts.items():
+        votes[hour] = count
+    
+    return {'labels': labels, 'votes': votes}
+
+def get_device_data(days=None, tz=None, vote_filter=None):
+    """Get vote distribution by device class, as classified when the user agent was interned"""
+    names = dict(UserAgent.DEVICE_CHOICES)
+    # Grouped by agent in each vote database; the agents are only in the default one
+    agent_votes = sharding.merge_counts(
+        pair for votes in sharding.vote_querysets(_chart_votes(days, tz, vote_filter))
+        for pair in votes.values_list('agent_id').annotate(count=Count('id'))
+    )
+    agent_ids = [agent_id for agent_id in agent_votes if agent_id is not None]
+    devices = {}
+    for start in range(0, len(agent_ids), 500):
+        devices.update(UserAgent.objects.filter(id__in=agent_ids[start:start + 500]).values_list('id', 'device'))
+    device_votes = sharding.merge_counts(
+        (devices.get(agent_id), count) for agent_id, count in agent_votes.items()
+    )
+    device_votes = sorted(device_votes.items(), key=lambda pair: -pair[1])
+    
+    labels = [names.get(device, 'Unknown') for device, _ in device_votes]
+    votes = [count for _, count in device_votes]
     
     return {'labels': labels, 'votes': votes}
 
+def _analytics_watermark(votes, filter_key, end_date):
+    """
+    Opaque token describing the state of ``votes``: the filters and window it
+    was computed for plus the row count, highest vote id and latest timestamp.
+    Used both as the ETag and as the client's delta-sync watermark. With vote
+    shards the counts add up and the id is the sum of each database's highest.
+    """
+    count = max_id = 0
+    max_ts = None
+    for shard_votes in sharding.vote_querysets(votes):
+        stats = shard_votes.aggregate(count=Count('id'), max_id=Max('id'), max_ts=Max('timestamp'))
+        count += stats['count']
+        max_id += stats['max_id'] or 0
+        if stats['max_ts'] and (max_ts is None or stats['max_ts'] > max_ts):
+            max_ts = stats['max_ts']
+    max_ts_us = (max_ts - _EPOCH) // timedelta(microseconds=1) if max_ts else 0
+    return f"{filter_key}:{end_date.isoformat()}:{count}:{max_id}:{max_ts_us}"
+
+def _parse_watermark(token):
+    """Split a watermark into (prefix, count, max_id, max_timestamp), or None if malformed"""
+    try:
+        prefix, count, max_id, max_ts_us = token.rsplit(':', 3)
+        return prefix, int(count), int(max_id), _EPOCH + timedelta(microseconds=int(max_ts_us))
+    except (AttributeError, ValueError, OverflowError):
+        return None
+
+def _analytics_delta(votes, days, tz, since, current, rollups=None):
+    """
+    Buckets changed between watermark ``since`` and ``current``.
+
+    Only a pure append (new vote rows, nothing revoted, deleted or aged out
+    of the window) can be expressed as a delta: in that case the new rows'
+    buckets are recounted and returned. Returns None when the client has to
+    resync the full datasets.
+    """
+    old, new = _parse_watermark(since), _parse_watermark(current)
+    # Vote ids are per database, so with vote shards no id marks the new rows
+    if old is None or old[0] != new[0] or sharding.enabled():
+        return None
+    _, old_count, old_max_id, old_max_ts = old
+    new_rows = votes.filter(id__gt=old_max_id)
+    if new[1] != old_count + new_rows.count():
+        return None
+    # Revotes rewrite the timestamp of an existing row, moving it between buckets
+    if votes.filter(id__lte=old_max_id, timestamp__gt=old_max_ts).exists():
+        return None
+    
+    days_touched = set(new_rows.annotate(
+        day=TruncDate('timestamp', tzinfo=tz)
+    ).values_list('day', flat=True).distinct())
+    hours_touched = set(new_rows.annotate(
+        hour=ExtractHour('timestamp', tzinfo=tz)
+    ).values_list('hour', flat=True).distinct())
+    categories_touched = set(new_rows.values_list('category_id', flat=True).distinct())
+    
+    start_date = timezone.localdate(timezone=tz) - timedelta(days=days)
+    first_day = min(days_touched)
+    start, _ = _local_day_range(first_day, first_day, tz)
+    daily = {}
+    if rollups is not None:
+        daily = _rollup_counts(rollups.filter(hour__gte=start), day=TruncDate('hour', tzinfo=tz))
+    for item in votes.filter(timestamp__gte=start).annotate(
+        day=TruncDate('timestamp', tzinfo=tz)
+    ).values('day').annotate(count=Count('id')):
+        daily[item['day']] = daily.get(item['day'], 0) + item['count']
+    hourly = _hourly_counts(votes, tz, rollups)
+    categories = _category_counts(
+        votes.filter(category_id__in=categories_touched),
+        rollups.filter(category_id__in=categories_touched) if rollups is not None else None,
+    )
+    
+    return {
+        'activity_data': [[(day - start_date).days, daily.get(day, 0)] for day in sorted(days_touched)],
+        'hourly_data': [[hour, hourly.get(hour, 0)] for hour in sorted(hours_touched)],
+        'category_data': [list(pair) for pair in zip(categories['labels'], categories['votes'])],
+    }
+
+def _analytics_snapshot(votes, days, tz, vote_filter, filter_key):
+    """The watermark of ``votes`` and the full chart datasets for one set of filters"""
+    return {
+        'watermark': _analytics_watermark(votes, filter_key, timezone.localdate(timezone=tz)),
+        'datasets': {
+            'activity_data': get_activity_data(days, tz=tz, vote_filter=vote_filter),
+            'category_data': get_category_data(days, tz=tz, vote_filter=vote_filter),
+            'hourly_data': get_hourly_data(days, tz=tz, vote_filter=vote_filter),
+        },
+    }
+
 @staff_member_required
 @require_POST
 def update_analytics(request):
-    """AJAX endpoint to update dashboard data"""
+    """
+    AJAX endpoint to update dashboard data.
+
+    The client sends back the ``watermark`` of the data it already has. If
+    nothing matching its filters changed since, the answer is an empty 304;
+    if only new votes arrived, just the buckets they touched are returned.
+    The data is a snapshot shared by all viewers, up to twice
+    DASHBOARD_CACHE_SECONDS old.
+    """
     try:
         data = json.loads(request.body)
         time_period = int(data.get('time_period', 30))
         category_id = data.get('category')
+        tz = _resolve_timezone(data.get('timezone'))
+        since = data.get('watermark') or request.headers.get('If-None-Match', '').strip('"')
         
         # Filter by category if specified
         vote_filter = Q()
         if category_id and category_id != 'all':
-            vote_filter = Q(this_or_that__category_id=category_id)
+            vote_filter = Q(category_id=category_id)
         
-        # Get updated data
-        activity_data = get_activity_data(time_period)
-        category_data = get_category_data()
-        hourly_data = get_hourly_data()
+        votes = _chart_votes(time_period, tz, vote_filter)
+        filter_key = f"{time_period}/{category_id or 'all'}/{tz}"
+        # Every viewer with the same filters shares one snapshot, and the
+        # delta from one watermark to the next; see singleflight.py
+        snapshot = singleflight.get_or_compute(
+            f"polls:analytics:{hashlib.md5(filter_key.encode()).hexdigest()}",
+            lambda: _analytics_snapshot(votes, time_period, tz, vote_filter, filter_key),
+            DASHBOARD_CACHE_SECONDS,
+        )
+        watermark = snapshot['watermark']
+        etag = f'"{watermark}"'
         
-        return JsonResponse({
-            'activity_data': activity_data,
-            'category_data': category_data,
-            'hourly_data': hourly_data
-        })
+        if since == watermark:
+            response = HttpResponseNotModified()
+            response['ETag'] = etag
+            return response
+        
+        delta = None
+        if since:
+            rollups = _chart_rollups(time_period, tz, vote_filter)
+            delta = singleflight.get_or_compute(
+                f"polls:analytics-delta:{hashlib.md5(f'{since}|{watermark}'.encode()).hexdigest()}",
+                lambda: _analytics_delta(votes, time_period, tz, since, watermark, rollups),
+                DASHBOARD_CACHE_SECONDS,
+            )
+        if delta is not None:
+            payload = {'full': False, **delta}
+        else:
+            payload = {'full': True, **snapshot['datasets']}
+        payload['watermark'] = watermark
+        
+        response = JsonResponse(payload)
+        response['ETag'] = etag
+        return response
         
     except Exception as e:
         return JsonResponse({'error': str(e)}, status=500)
@@ -372,111 +605,227 @@ def this_or_that_game(request, category_id):
     reset = request.GET.get('reset')
     
     if reset:
-        # Clear user's previous votes for this category
-        if request.user.is_authenticated:
-            Vote.objects.filter(
-                user=request.user,
-                this_or_that__category=category
-            ).delete()
-        elif request.session.session_key:
-            Vote.objects.filter(
-                session_key=request.session.session_key,
-                this_or_that__category=category
-            ).delete()
+        # Clear user's previous votes for this category, taking them out of the totals
+        voter = _voter_filter(request)
+        if voter:
+            voting.reset_votes(sharding.category_votes(category.id).filter(**voter), voter)
         
         # Redirect to start fresh (without reset parameter)
         return redirect('polls:this_or_that', category_id=category_id)
     
-    # Get all questions for this category
-    all_questions = ThisOrThat.objects.filter(category=category, is_active=True)
-    
-    if not all_questions.exists():
+    progress = _game_progress(request, category.id)
+    if not progress['total']:
         return render(request, 'polls/category_complete.html', {
             'category': category
         })
     
-    # Get questions user has voted on
-    voted_questions = []
-    if request.user.is_authenticated:
-        voted_questions = Vote.objects.filter(
-            user=request.user,
-            this_or_that__category=category
-        ).values_list('this_or_that_id', flat=True)
-    elif request.session.session_key:
-        voted_questions = Vote.objects.filter(
-            session_key=request.session.session_key,
-            this_or_that__category=category
-        ).values_list('this_or_that_id', flat=True)
-    
-    # Get remaining questions
-    remaining_questions = all_questions.exclude(id__in=voted_questions)
-    
     # If no remaining questions, redirect to summary
-    if not remaining_questions.exists():
+    question = progress['question']
+    if question is None:
         return redirect('polls:quiz_summary', category_id=category_id)
     
-    # Get next question (random from remaining)
-    question = random.choice(remaining_questions)
-    
-    # Calculate progress
-    total_questions = all_questions.count()
-    answered_questions = len(voted_questions)
-    progress_percentage = (answered_questions / total_questions) * 100 if total_questions > 0 else 0
-    
-    # Check if there are more questions after this one
-    has_next_question = remaining_questions.count() > 1
-    
     return render(request, 'polls/this_or_that.html', {
         'question': question,
         'category': category,
-        'current_question': answered_questions + 1,
-        'total_questions': total_questions,
-        'progress_percentage': progress_percentage,
-        'has_next_question': has_next_question
+        **_progress_context(progress),
+        'option_a_thumbnail': thumbnails.thumbnail_urls(question, 'a'),
+        'option_b_thumbnail': thumbnails.thumbnail_urls(question, 'b'),
     })
 
+
+def _voter_filter(request):
+    """Vote filter kwargs for the current user or session, or None for a new visitor"""
+    if request.user.is_authenticated:
+        return {'user': request.user}
+    if request.session.session_key:
+        return {'session_key': request.session.session_key}
+    return None
+
+
+def _game_progress(request, category_id):
+    """
+    The voter's position in a category: a random unanswered question (None
+    when all are answered) plus answered/total/remaining counts. Uses only
+    id lists, so it is cheap enough to run on every vote.
+    """
+    question_ids = list(
+        ThisOrThat.objects.filter(category_id=category_id, is_active=True).values_list('id', flat=True)
+    )
+    voter = _voter_filter(request)
+    voted = set()
+    if voter and question_ids:
+        voted = set(
+            sharding.category_votes(category_id).filter(**voter)
+            .values_list('this_or_that_id', flat=True)
+        )
+    remaining = [question_id for question_id in question_ids if question_id not in voted]
+    question = None
+    if remaining:
+        question = ThisOrThat.objects.get(id=random.choice(remaining))
+    return {
+        'question': question,
+        'answered': len(question_ids) - len(remaining),
+        'total': len(question_ids),
+        'remaining': len(remaining),
+    }
+
+
+def _progress_context(progress):
+    total = progress['total']
+    return {
+        'current_question': progress['answered'] + 1,
+        'total_questions': total,
+        'progress_percentage': (progress['answered'] / total) * 100 if total > 0 else 0,
+        # Check if there are more questions after this one
+        'has_next_question': progress['remaining'] > 1,
+    }
+
+
+def _question_json(question):
+    """What the game page needs to show a question without reloading"""
+    return {
+        'id': question.id,
+        'option_a': question.option_a,
+        'option_b': question.option_b,
+        'option_a_thumbnail': thumbnails.thumbnail_urls(question, 'a'),
+        'option_b_thumbnail': thumbnails.thumbnail_urls(question, 'b'),
+        'vote_url': reverse('polls:vote_this_or_that', args=(question.id,)),
+    }
+
+
+def _next_question_payload(request, category_id):
+    """Next question and progress, sent with every vote so the game never reloads"""
+    progress = _game_progress(request, category_id)
+    question = progress['question']
+    return {
+        'question': _question_json(question) if question else None,
+        **_progress_context(progress),
+    }
+
+def question_thumbnail(request, question_id, side, width, digest):
+    """Serve a cached, resized copy of a question's option image"""
+    if side not in ('a', 'b') or width not in thumbnails.WIDTHS:
+        raise Http404("Unknown thumbnail")
+    question = get_object_or_404(ThisOrThat, id=question_id)
+    url = question.option_a_image if side == 'a' else question.option_b_image
+    # The digest pins the URL to one source image, so the response never changes
+    if not url or thumbnails.source_digest(url) != digest:
+        raise Http404("Image has changed")
+    try:
+        handle = thumbnails.open_thumbnail(url, width)
+    except thumbnails.ThumbnailError:
+        response = HttpResponseRedirect(url)
+        response['Cache-Control'] = 'public, max-age=300'
+        return response
+    response = FileResponse(handle, content_type='image/webp')
+    response['Cache-Control'] = 'public, max-age=31536000, immutable'
+    return response
+
+def _category_state(category_id, active_only=True):
+    """Version, change time and latest vote of a category, or None if there is no such (active) category"""
+    categories = ThisOrThatCategory.objects.filter(id=category_id)
+    if active_only:
+        categories = categories.filter(is_active=True)
+    state = categories.values('version', 'updated_at').first()
+    if state is not None:
+        state['last_votes'] = sharding.last_vote_times(category_id)
+    return state
+
+def _category_key(category_id, state):
+    return f"{category_id}:{state['version']}:{state['updated_at'].timestamp()}:{_votes_key(state['last_votes'])}"
+
+def _summary_state(request, category_id):
+    states = request.__dict__.setdefault('_polls_category_state', {})
+    if category_id not in states:
+        states[category_id] = _category_state(category_id)
+    return states[category_id]
+
+def _summary_etag(request, category_id):
+    """The summary shows the voter's own picks, so the voter is part of the tag"""
+    state = _summary_state(request, category_id)
+    if state is None:
+        return None
+    if request.user.is_authenticated:
+        voter = f"user:{request.user.pk}"
+    else:
+        voter = f"session:{request.session.session_key or ''}"
+    key = f"{_category_key(category_id, state)}:{voter}"
+    return hashlib.md5(key.encode()).hexdigest()
+
+def _summary_last_modified(request, category_id):
+    state = _summary_state(request, category_id)
+    return _last_modified(state) if state else None
+
+def _summary_rows(questions):
+    """Question rows for the summary, with the percentages worked out in SQL"""
+    total = F('votes_a') + F('votes_b')
+    def percentage(votes):
+        # Same rounding as ThisOrThat.percentage_a/b, 50/50 before any votes
+        return Case(
+            When(Q(votes_a=0) & Q(votes_b=0), then=Value(50.0)),
+            default=Round(100.0 * F(votes) / total, 1),
+            output_field=FloatField(),
+        )
+    return questions.values('id', 'option_a', 'option_b', 'votes_a', 'votes_b').annotate(
+        total_votes=total, percentage_a=percentage('votes_a'), percentage_b=percentage('votes_b'),
+    )
+
+def get_category_results(category, refresh=False, page=1, state=None):
+    """
+    One page of per-question tallies for a category plus the category totals,
+    shared by every voter. Cached until the category's version or latest
+    vote changes.
+    """
+    state = state or _category_state(category.id, active_only=False)
+    key = f"polls:category-results:{_category_key(category.id, state)}"
+    questions = ThisOrThat.objects.filter(category=category, is_active=True).order_by('id')
+    totals = None if refresh else cache.get(key)
+    if totals is None:
+        totals = questions.aggregate(
+            total_questions=Count('id'), total_votes=Coalesce(Sum(F('votes_a') + F('votes_b')), 0)
+        )
+        cache.set(key, totals, STATS_CACHE_SECONDS)
+    paginator = Paginator(_summary_rows(questions), SUMMARY_PAGE_SIZE)
+    # Already counted above; saves the paginator its own COUNT query
+    paginator.count = totals['total_questions']
+    page = paginator.get_page(page)
+    page_key = f"{key}:page:{page.number}"
+    rows = None if refresh else cache.get(page_key)
+    if rows is None:
+        rows = list(page.object_list)
+        cache.set(page_key, rows, STATS_CACHE_SECONDS)
+    return {**totals, 'questions': rows, 'page': page.number, 'num_pages': paginator.num_pages}
+
 # Add new quiz summary view
+@cache_control(private=True, max_age=0, must_revalidate=True)
+@vary_on_cookie
+@condition(etag_func=_summary_etag, last_modified_func=_summary_last_modified)
 def quiz_summary(request, category_id):
-    """Display quiz completion summary with all results"""
+    """Display quiz completion summary, one page of question results at a time"""
     category = get_object_or_404(ThisOrThatCategory, id=category_id, is_active=True)
     
-    # Get all questions in this category with their current vote counts
-    questions = ThisOrThat.objects.filter(category=category, is_active=True)
+    # Shared, cached tallies for the requested page
+    results = get_category_results(
+        category, page=request.GET.get('page'), state=_summary_state(request, category_id)
+    )
     
-    # Get user's votes for this category
+    # The voter's picks for just the questions on this page
     user_votes = {}
-    if request.user.is_authenticated:
-        votes = Vote.objects.filter(
-            user=request.user,
-            this_or_that__category=category
-        ).select_related('this_or_that')
-        user_votes = {vote.this_or_that.id: vote.choice for vote in votes}
-    elif request.session.session_key:
-        votes = Vote.objects.filter(
-            session_key=request.session.session_key,
-            this_or_that__category=category
-        ).select_related('this_or_that')
-        user_votes = {vote.this_or_that.id: vote.choice for vote in votes}
-    
-    # Prepare questions with calculated percentages and user choices
-    questions_with_results = []
-    total_votes = 0
-    
-    for question in questions:
-        total_votes += question.total_votes
-        questions_with_results.append({
-            'option_a': question.option_a,
-            'option_b': question.option_b,
-            'votes_a': question.votes_a,
-            'votes_b': question.votes_b,
-            'total_votes': question.total_votes,
-            'percentage_a': question.percentage_a,
-            'percentage_b': question.percentage_b,
-            'user_choice': user_votes.get(question.id, None),  # Add user's choice
-        })
+    voter = _voter_filter(request)
+    if voter and results['questions']:
+        user_votes = dict(
+            sharding.category_votes(category.id).filter(
+                **voter, this_or_that_id__in=[question['id'] for question in results['questions']]
+            ).values_list('this_or_that_id', 'choice')
+        )
+    questions_with_results = [
+        {**question, 'user_choice': user_votes.get(question['id'])}
+        for question in results['questions']
+    ]
     
     # Calculate summary stats
-    total_questions = questions.count()
+    total_questions = results['total_questions']
+    total_votes = results['total_votes']
     avg_votes_per_question = (total_votes / total_questions) if total_questions > 0 else 0
     
     return render(request, 'polls/quiz_summary.html', {
@@ -485,90 +834,185 @@ def quiz_summary(request, category_id):
         'total_questions': total_questions,
         'total_votes': total_votes,
         'avg_votes_per_question': avg_votes_per_question,
+        'page': results['page'],
+        'num_pages': results['num_pages'],
     })
+def _rate_limited(request, votes=1):
+    """429 response when the voter or their IP is over the vote rate, else None"""
+    retry_after = ratelimit.check_rate(request, votes)
+    if not retry_after:
+        return None
+    response = JsonResponse({'error': 'Too many votes, please slow down'}, status=429)
+    response['Retry-After'] = str(math.ceil(retry_after))
+    return response
+
+
+def _vote_payload(question):
+    """Tallies returned to the game after a vote"""
+    return {
+        'votes_a': question.votes_a,
+        'votes_b': question.votes_b,
+        'total_votes': question.total_votes,
+        'percentage_a': question.percentage_a,
+        'percentage_b': question.percentage_b,
+        'winning_option': question.winning_option
+    }
+
+
 # Update your vote_this_or_that view (keeping the revote logic you wanted)
 @require_POST
 def vote_this_or_that(request, question_id):
     """Handle voting via AJAX with revote capability"""
+    # Cheap in-memory guards first, before any database work
+    limited = _rate_limited(request)
+    if limited:
+        return limited
+    
+    try:
+        choice = json.loads(request.body).get('choice')
+    except (json.JSONDecodeError, AttributeError):
+        return JsonResponse({'error': 'Invalid JSON'}, status=400)
+    
+    if choice not in ['A', 'B']:
+        return JsonResponse({'error': 'Invalid choice'}, status=400)
+    
+    # Repeating the same choice straight away changes nothing; answer from the cache
+    recent, generation = ratelimit.recent_votes.get(eventlog.voter_label(_voter_filter(request)), question_id)
+    if recent is not None and recent[0] == choice:
+        return JsonResponse(recent[1])
+    
     question = get_object_or_404(ThisOrThat, id=question_id)
     
     try:
-        data = json.loads(request.body)
-        choice = data.get('choice')
-        
-        if choice not in ['A', 'B']:
-            return JsonResponse({'error': 'Invalid choice'}, status=400)
-        
         # Create vote data
         vote_data = {
             'this_or_that': question,
+            'category_id': question.category_id,
             'choice': choice,
-            'user_agent': request.META.get('HTTP_USER_AGENT', ''),
+            'agent_id': useragents.agent_id(request.META.get('HTTP_USER_AGENT', '')),
             'ip_address': request.META.get('REMOTE_ADDR'),
         }
         
-        if request.user.is_authenticated:
-            vote_data['user'] = request.user
-            # Check for existing vote by this user
-            existing_vote = Vote.objects.filter(
-                this_or_that=question,
-                user=request.user
-            ).first()
-        else:
-            if not request.session.session_key:
-                request.session.create()
-            vote_data['session_key'] = request.session.session_key
-            # Check for existing vote by this session
-            existing_vote = Vote.objects.filter(
-                this_or_that=question,
-                session_key=request.session.session_key
-            ).first()
+        if not request.user.is_authenticated and not request.session.session_key:
+            request.session.create()
+        voter_filter = _voter_filter(request)
+        vote_data.update(voter_filter)
         
-        # Handle existing vote (revote logic)
-        if existing_vote:
-            # Decrement the old choice count
-            if existing_vote.choice == 'A':
-                ThisOrThat.objects.filter(id=question_id).update(votes_a=F('votes_a') - 1)
+        # The vote row and its counter change commit together or not at all,
+        # in the database of the question's category
+        using = sharding.db_for_category(question.category_id)
+        with transaction.atomic(using=using):
+            # Check for an existing vote by this user or session
+            existing_vote = Vote.objects.using(using).filter(this_or_that=question, **voter_filter).first()
+            
+            # Handle existing vote (revote logic)
+            delta_a = int(choice == 'A')
+            delta_b = int(choice == 'B')
+            if existing_vote:
+                # Take back the old choice
+                delta_a -= int(existing_vote.choice == 'A')
+                delta_b -= int(existing_vote.choice == 'B')
+                
+                # Update the existing vote
+                existing_vote.choice = choice
+                existing_vote.timestamp = timezone.now()
+                existing_vote.agent_id = vote_data['agent_id']
+                existing_vote.ip_address = vote_data['ip_address']
+                existing_vote.save()
             else:
-                ThisOrThat.objects.filter(id=question_id).update(votes_b=F('votes_b') - 1)
+                # Create new vote
+                Vote.objects.using(using).create(**vote_data)
             
-            # Update the existing vote
-            existing_vote.choice = choice
-            existing_vote.timestamp = timezone.now()
-            existing_vote.user_agent = vote_data['user_agent']
-            existing_vote.ip_address = vote_data['ip_address']
-            existing_vote.save()
-        else:
-            # Create new vote
-            Vote.objects.create(**vote_data)
-        
-        # Increment the new choice count
-        if choice == 'A':
-            ThisOrThat.objects.filter(id=question_id).update(votes_a=F('votes_a') + 1)
-        else:
-            ThisOrThat.objects.filter(id=question_id).update(votes_b=F('votes_b') + 1)
+            counters.add_votes(question, delta_a, delta_b)
+            eventlog.record(
+                'revote' if existing_vote else 'vote', voter_filter,
+                [(question.id, question.category_id, delta_a, delta_b)], using=using,
+            )
         
         # Get updated results
-        question.refresh_from_db()
+        question.votes_a, question.votes_b = counters.totals(question)
         
-        return JsonResponse({
+        payload = {
             'success': True,
-            'votes_a': question.votes_a,
-            'votes_b': question.votes_b,
-            'total_votes': question.total_votes,
-            'percentage_a': question.percentage_a,
-            'percentage_b': question.percentage_b,
-            'winning_option': question.winning_option
-        })
+            **_vote_payload(question),
+            'next': _next_question_payload(request, question.category_id),
+        }
+        ratelimit.recent_votes.remember(eventlog.voter_label(voter_filter), {question_id: (choice, payload)}, generation)
+        return JsonResponse(payload)
         
-    except json.JSONDecodeError:
-        return JsonResponse({'error': 'Invalid JSON'}, status=400)
     except Exception as e:
         return JsonResponse({'error': str(e)}, status=500)
 
-# Restrict analytics to admin only
-@staff_member_required
-def analytics_dashboard(request):
-    """Analytics dashboard for admins only"""
-    # Your existing analytics code here...
-    pass
\ No newline at end of file
+
+
+@require_POST
+def vote_batch(request):
+    """Record several votes from one voter in a single request"""
+    try:
+        choices = voting.parse_votes(
+            json.loads(request.body), getattr(settings, 'POLLS_BATCH_VOTE_MAX', 100)
+        )
+    except json.JSONDecodeError:
+        return JsonResponse({'error': 'Invalid JSON'}, status=400)
+    except voting.BatchVoteError as e:
+        return JsonResponse({'error': str(e)}, status=400)
+    
+    # Every vote in the batch costs a token, as it would sent on its own
+    limited = _rate_limited(request, len(choices))
+    if limited:
+        return limited
+    
+    if request.user.is_authenticated:
+        voter = {'user': request.user}
+    else:
+        if not request.session.session_key:
+            request.session.create()
+        voter = {'session_key': request.session.session_key}
+    
+    # Read before the votes are written, like the single vote view does
+    generation = ratelimit.recent_votes.generation()
+    try:
+        questions = voting.apply_votes(
+            choices, voter,
+            agent_id=useragents.agent_id(request.META.get('HTTP_USER_AGENT', '')),
+            ip_address=request.META.get('REMOTE_ADDR'),
+        )
+    except voting.BatchVoteError as e:
+        return JsonResponse({'error': str(e)}, status=400)
+    
+    results, recent = [], {}
+    for question in questions:
+        payload = _vote_payload(question)
+        recent[question.id] = (choices[question.id], {'success': True, **payload})
+        results.append({'question_id': question.id, 'choice': choices[question.id], **payload})
+    # Keep the single-vote collapse cache in step with the new choices
+    ratelimit.recent_votes.remember(eventlog.voter_label(voter), recent, generation)
+    return JsonResponse({'success': True, 'results': results})
+
+
+@require_GET
+@cache_control(public=True, max_age=0, s_maxage=SHARED_CACHE_SECONDS)
+def search_questions(request):
+    """Ranked full-text search over active questions and their category names"""
+    term = request.GET.get('q', '').strip()[:200]
+    try:
+        limit = min(max(int(request.GET.get('limit', 20)), 1), SEARCH_MAX_RESULTS)
+    except ValueError:
+        return JsonResponse({'error': 'Invalid limit'}, status=400)
+    
+    results = [
+        {
+            'id': question.id,
+            'option_a': question.option_a,
+            'option_b': question.option_b,
+            'total_votes': question.votes_a + question.votes_b,
+            'category': {
+                'id': question.category_id,
+                'name': question.category.name,
+                'icon': question.category.icon,
+            },
+            'url': reverse('polls:this_or_that', args=(question.category_id,)),
+        }
+        for question in search.search(term, limit)
+    ]
+    return JsonResponse({'query': term, 'results': results})
\ No newline at end of file
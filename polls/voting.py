@@ -0,0 +1,135 @@
+"""
+Applying and taking back ThisOrThat votes in bulk.
+
+apply_votes() records several votes from one voter (the batch endpoint):
+existing votes are looked up with one query, new ones are bulk inserted,
+changed ones bulk updated, and the questions' counters take their net
+changes in one UPDATE (see counters.add_votes_bulk), all inside one
+transaction (one per vote shard when the batch spans several, see
+sharding). reset_votes() is the reverse for "play again" and the admin's
+category reset. Both also append their counter changes to the vote event
+log (see eventlog).
+"""
+from collections import defaultdict
+
+from django.db import transaction
+from django.db.models import Count, Q
+from django.utils import timezone
+
+from . import counters, eventlog, ratelimit, sharding
+from .models import ThisOrThat, Vote
+
+
+class BatchVoteError(ValueError):
+    pass
+
+
+def parse_votes(data, max_votes):
+    """
+    Validate a ``{"votes": [{"question_id": 1, "choice": "A"}, ...]}`` body and
+    return ``{question_id: choice}``. A later vote for the same question wins.
+    """
+    votes = data.get('votes') if isinstance(data, dict) else None
+    if not isinstance(votes, list) or not votes:
+        raise BatchVoteError('Expected a non-empty "votes" list')
+    if len(votes) > max_votes:
+        raise BatchVoteError(f'At most {max_votes} votes per batch')
+    choices = {}
+    for item in votes:
+        if not isinstance(item, dict):
+            raise BatchVoteError('Each vote must be an object')
+        question_id, choice = item.get('question_id'), item.get('choice')
+        if not isinstance(question_id, int) or isinstance(question_id, bool):
+            raise BatchVoteError('Invalid question_id')
+        if choice not in ('A', 'B'):
+            raise BatchVoteError(f'Invalid choice for question {question_id}')
+        choices[question_id] = choice
+    return choices
+
+
+def apply_votes(choices, voter, agent_id=None, ip_address=None):
+    """
+    Record ``{question_id: choice}`` for one voter and return the questions
+    with fresh totals. ``voter`` is ``{'user': user}`` or
+    ``{'session_key': key}``. Unknown questions fail the whole batch.
+    """
+    questions = ThisOrThat.objects.in_bulk(list(choices))
+    missing = sorted(set(choices) - set(questions))
+    if missing:
+        raise BatchVoteError(f'Unknown questions: {missing}')
+
+    # Questions in different vote shards are written in their own databases
+    by_database = defaultdict(list)
+    for question_id in choices:
+        by_database[sharding.db_for_category(questions[question_id].category_id)].append(question_id)
+    with sharding.atomic(by_database):
+        # Taken inside the transactions, so vote times follow commit order
+        # in each database (page validators rely on the latest one)
+        now = timezone.now()
+        for using, question_ids in by_database.items():
+            existing = {
+                vote.this_or_that_id: vote
+                for vote in Vote.objects.using(using).filter(this_or_that_id__in=question_ids, **voter)
+            }
+            new_votes, changed_votes, deltas = [], [], {}
+            new_deltas, changed_deltas = [], []
+            for question_id in question_ids:
+                choice = choices[question_id]
+                delta_a, delta_b = int(choice == 'A'), int(choice == 'B')
+                vote = existing.get(question_id)
+                if vote is None:
+                    new_votes.append(Vote(
+                        this_or_that_id=question_id, category_id=questions[question_id].category_id, choice=choice,
+                        agent_id=agent_id, ip_address=ip_address, **voter
+                    ))
+                    logged = new_deltas
+                else:
+                    # Take back the old choice
+                    delta_a -= int(vote.choice == 'A')
+                    delta_b -= int(vote.choice == 'B')
+                    vote.choice = choice
+                    vote.timestamp = now
+                    vote.agent_id = agent_id
+                    vote.ip_address = ip_address
+                    changed_votes.append(vote)
+                    logged = changed_deltas
+                deltas[question_id] = (delta_a, delta_b)
+                logged.append((question_id, questions[question_id].category_id, delta_a, delta_b))
+
+            Vote.objects.using(using).bulk_create(new_votes)
+            Vote.objects.using(using).bulk_update(changed_votes, ['choice', 'timestamp', 'agent', 'ip_address'])
+            counters.add_votes_bulk(deltas, questions)
+            eventlog.record('vote', voter, new_deltas, using=using)
+            eventlog.record('revote', voter, changed_deltas, using=using)
+
+    for question in questions.values():
+        question.votes_a, question.votes_b = counters.totals(question)
+    return [questions[question_id] for question_id in choices]
+
+
+def reset_votes(votes, voter=None):
+    """
+    Delete ``votes`` and take them back out of the question counters, in one
+    transaction: one grouped query for the per-question deltas, one counter
+    update and one DELETE. ``votes`` must be on the database of its
+    categories (see sharding.category_votes). ``voter`` is only used to label
+    the logged event. Returns how many votes were removed.
+    """
+    with transaction.atomic(using=votes.db):
+        grouped = votes.order_by().values('this_or_that_id', 'category_id').annotate(
+            votes_a=Count('id', filter=Q(choice='A')),
+            votes_b=Count('id', filter=Q(choice='B')),
+        )
+        grouped = list(grouped)
+        deltas = {row['this_or_that_id']: (-row['votes_a'], -row['votes_b']) for row in grouped}
+        if not deltas:
+            return 0
+        counters.add_votes_bulk(deltas)
+        # Repeats of the removed votes must be recorded again, not answered from the cache
+        transaction.on_commit(lambda: ratelimit.recent_votes.clear(), using=votes.db)
+        eventlog.record('reset', voter, [
+            (row['this_or_that_id'], row['category_id'], -row['votes_a'], -row['votes_b']) for row in grouped
+        ], using=votes.db)
+        # Nothing references Vote and no delete signals listen to it, so
+        # Django deletes these with one DELETE instead of loading them first
+        return votes.order_by().delete()[0]
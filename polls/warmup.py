@@ -0,0 +1,71 @@
+import logging
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+from django.conf import settings
+from django.db import connections
+
+logger = logging.getLogger(__name__)
+
+
+def _timed(label, func, *args):
+    started = time.perf_counter()
+    try:
+        func(*args)
+        error = None
+    except Exception as e:  # one broken item shouldn't stop the rest
+        error = e
+    finally:
+        # Worker threads get their own connections; don't leak them
+        connections.close_all()
+    return label, (time.perf_counter() - started) * 1000, error
+
+
+def warm_caches(workers=4):
+    """
+    Recompute and cache the home page stats, every active category's results
+    and the dashboard data in parallel. Returns (label, milliseconds, error)
+    for each item, in submission order.
+    """
+    from . import views
+    from .models import ThisOrThatCategory
+
+    jobs = [
+        ('category stats', views.get_category_stats, None, True),
+        ('dashboard', views.get_dashboard_data, True),
+    ]
+    for category in ThisOrThatCategory.objects.filter(is_active=True):
+        jobs.append((f'category results: {category.name}', views.get_category_results, category, True))
+    connections.close_all()
+
+    with ThreadPoolExecutor(max_workers=workers) as pool:
+        futures = [pool.submit(_timed, label, func, *args) for label, func, *args in jobs]
+        return [future.result() for future in futures]
+
+
+def warm_caches_in_background(delay=0):
+    """Run warm_caches in a daemon thread, logging the outcome"""
+    def run():
+        time.sleep(delay)
+        for label, ms, error in warm_caches():
+            if error:
+                logger.warning("Cache warm-up of %s failed after %.0fms: %s", label, ms, error)
+            else:
+                logger.info("Warmed %s in %.0fms", label, ms)
+
+    thread = threading.Thread(target=run, name='polls-cache-warmup', daemon=True)
+    thread.start()
+    return thread
+
+
+
+def warm_on_startup():
+    """
+    Warm this process's caches in the background if
+    POLLS_WARM_CACHES_ON_STARTUP is set, so the first requests after a deploy
+    or worker restart hit warm caches. Called once per server process.
+    """
+    if getattr(settings, 'POLLS_WARM_CACHES_ON_STARTUP', False):
+        return warm_caches_in_background(getattr(settings, 'POLLS_WARM_CACHES_DELAY', 0))
+    return None